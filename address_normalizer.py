@@ -1,5 +1,4 @@
 import re
-from rapidfuzz import fuzz, process
 
 class AddressNormalizer:
     def __init__(self):
@@ -29,6 +28,8 @@ class AddressNormalizer:
     
     def normalize(self, raw_address):
         """Нормализует адрес к стандартному формату"""
+        from rapidfuzz import fuzz, process
+
         if not raw_address:
             return ""
         
@@ -53,6 +54,8 @@ class AddressNormalizer:
     
     def match_addresses(self, address1, address2):
         """Проверяет, являются ли два адреса одним и тем же"""
+        from rapidfuzz import fuzz
+
         norm1 = self.normalize(address1)
         norm2 = self.normalize(address2)
         similarity = fuzz.token_sort_ratio(norm1, norm2)
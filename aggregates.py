@@ -0,0 +1,389 @@
+# aggregates.py — статистика за всё время: история сворачивается по месяцам в пределах лимита памяти
+
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime
+from itertools import groupby
+
+import report_events
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLimitError(RuntimeError):
+    """Процесс не укладывается в MEMORY_LIMIT_MB даже при свёртке истории по одному дню."""
+
+
+# ===================== ПАМЯТЬ ПРОЦЕССА =====================
+def rss_mb() -> float | None:
+    """Текущий RSS процесса в МБ (Linux — /proc/self/statm); где его нет — пик, а на Windows — None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float | None:
+    """Пиковый RSS процесса с запуска в МБ."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # macOS — байты, Linux — КБ
+
+
+class MemoryGuard:
+    """
+    Проверка лимита памяти между чанками. Превышение сначала лечится gc.collect();
+    если RSS всё ещё выше limit_mb — check() возвращает False, а вызывающий уменьшает чанк
+    или сдаётся. Лимит 0 — без ограничения, только замеры.
+    """
+
+    def __init__(self, limit_mb: float = 0):
+        self.limit_mb = limit_mb
+        self.peak_mb = rss_mb() or 0.0
+
+    def check(self) -> bool:
+        current = rss_mb()
+        if current is None:
+            return True
+        self.peak_mb = max(self.peak_mb, current)
+        if not self.limit_mb or current <= self.limit_mb:
+            return True
+        gc.collect()
+        current = rss_mb() or 0.0
+        return current <= self.limit_mb
+
+    def snapshot(self) -> dict:
+        return {
+            'rss_mb': round(rss_mb() or 0.0, 1),
+            'peak_rss_mb': round(peak_rss_mb() or 0.0, 1),
+            'limit_mb': self.limit_mb,
+        }
+
+
+# ===================== СВЁРТКА ИСТОРИИ ПО ЧАНКАМ =====================
+def iter_all_reports(processor, morning, evening, limit_mb: float = 0, since: date | None = None):
+    """
+    Все отчёты за историю (или с даты since) генератором: снимки листов (SheetSnapshot)
+    режутся по месяцам, каждый месяц сопоставляется отдельно, и в памяти одновременно только
+    его отчёты — потребитель сворачивает их в свои итоги (HistoryFeed.feed).
+
+    Между чанками проверяется лимит: если после gc процесс выше limit_mb, остаток истории
+    идёт по одному дню; если не помещается и день — MemoryLimitError.
+    """
+    guard = MemoryGuard(limit_mb)
+    started = time.perf_counter()
+    days = sorted(day for day in set(morning.dates()) & set(evening.dates()) if since is None or day >= since)
+    chunks = [list(month) for _, month in groupby(days, key=lambda d: (d.year, d.month))]
+    count = done = 0
+
+    while chunks:
+        chunk = chunks.pop(0)
+        reports = processor.process_daily_reports(morning.on_dates(chunk), evening.on_dates(chunk), track_processed=False)
+        count += len(reports)
+        done += 1
+        yield from reports
+        del reports
+
+        if guard.check():
+            continue
+        if any(len(c) > 1 for c in chunks):
+            logger.warning(
+                f"Свёртка истории: RSS выше лимита {limit_mb} МБ — остаток истории по одному дню"
+            )
+            chunks = [[day] for c in chunks for day in c]
+            continue
+        if chunks:
+            raise MemoryLimitError(
+                f"RSS {rss_mb():.0f} МБ выше лимита {limit_mb} МБ после {done} чанков ({count} отчётов)"
+            )
+
+    logger.info(
+        f"Свёртка истории: {count} отчётов, {done} чанков за {time.perf_counter() - started:.1f} с, "
+        f"пик RSS {guard.peak_mb:.0f} МБ (лимит {limit_mb or '—'} МБ)"
+    )
+
+
+class HistoryFeed:
+    """
+    Один проход по истории на все агрегаты процесса. Агрегаты регистрируются в ленте,
+    ensure_loaded() при первом обращении (или если отчёты не приходили дольше reload_interval —
+    бот без анализатора в процессе) читает историю один раз и раздаёт каждую пачку отчётов
+    всем агрегатам. Месяцы, пройденные целиком, закрываются (ReportAggregate.seal_month),
+    и повторная загрузка читает историю только с первого незакрытого месяца.
+    """
+
+    # Сколько отчётов раздавать агрегатам за раз
+    BATCH = 1000
+
+    def __init__(self, reload_interval: float = 3600.0):
+        self.reload_interval = reload_interval
+        self.aggregates = []
+        self._load_lock = None  # asyncio.Lock, создаётся в event loop бота
+        self._loaded_at = None  # time.monotonic() последней загрузки
+        self._updated_at = 0.0  # time.monotonic() последнего пополнения через report_events
+
+    def register(self, aggregate: report_events.ReportAggregate) -> None:
+        if aggregate not in self.aggregates:
+            self.aggregates.append(aggregate)
+
+    def touch(self, reports) -> None:
+        """Подписчик report_events: свежие отчёты откладывают перечитывание истории."""
+        self._updated_at = time.monotonic()
+
+    def needs_reload(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - max(self._loaded_at, self._updated_at) > self.reload_interval
+
+    def since(self) -> date | None:
+        """Первый день после месяца, закрытого во всех агрегатах; None — читать всю историю."""
+        sealed = [aggregate.sealed for aggregate in self.aggregates]
+        if not sealed or None in sealed:
+            return None
+        year, month = min(sealed)
+        return date(year + month // 12, month % 12 + 1, 1)
+
+    def feed(self, reports) -> int:
+        """Раздаёт отчёты (генератор iter_all_reports) всем агрегатам; возвращает их число."""
+        count = 0
+        batch = []
+        month = None
+        for report in reports:
+            current = report_events.report_month(report)
+            if batch and (current != month or len(batch) >= self.BATCH):
+                self._dispatch(batch)
+                batch = []
+            if month is not None and current > month:
+                self._seal(month)
+            month = current
+            batch.append(report)
+            count += 1
+        self._dispatch(batch)
+        if month is not None:
+            self._seal(month)
+        return count
+
+    def _dispatch(self, batch) -> None:
+        for aggregate in self.aggregates:
+            aggregate.add_reports(batch)
+
+    def _seal(self, month) -> None:
+        for aggregate in self.aggregates:
+            aggregate.seal_month(month)
+
+    async def ensure_loaded(self, loader) -> None:
+        """
+        Сворачивает историю из loader(since) (корутина, обычно возвращает iter_all_reports),
+        если данных нет или они устарели. Генератор дочитывается в рабочем потоке, чтобы
+        сопоставление по чанкам не блокировало event loop.
+        """
+        import asyncio
+
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if not self.needs_reload():
+                return
+            started = time.perf_counter()
+            since = self.since()
+            reports = await loader(since)
+            count = await asyncio.to_thread(self.feed, reports)
+            self._loaded_at = time.monotonic()
+            logger.info(
+                f"История для {len(self.aggregates)} агрегатов: {count} отчётов "
+                f"с {since.strftime('%d.%m.%Y') if since else 'начала'} за {time.perf_counter() - started:.1f} с"
+            )
+
+
+history_feed = HistoryFeed(reload_interval=Config.HISTORY_RELOAD_INTERVAL)
+report_events.subscribe(history_feed.touch)
+
+
+class AllTimeStats(report_events.ReportAggregate):
+    """
+    Итоги за всё время для экранов «Статистика за всё время»: по городам и сетям —
+    число дегустаций, продажи и сумма эффективности, плюс продажи по сырам и общие суммы.
+    Отчёт после учёта не хранится, поэтому память не растёт с историей.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stores = 0
+        self.total_sales = 0
+        self.total_visitors = 0
+        self.efficiency_sum = 0.0
+        self.cities = {}  # город -> [дегустаций, продано, сумма эффективности]
+        self.networks = {}  # сеть -> [дегустаций, продано, сумма эффективности]
+        self.cheese_sales = {}
+
+    def _add(self, report) -> None:
+        sales = report.total_sales
+        self.stores += 1
+        self.total_sales += sales
+        self.total_visitors += report.visitors
+        self.efficiency_sum += report.efficiency
+        for groups, name in ((self.cities, report.city), (self.networks, report.network)):
+            stats = groups.setdefault(name, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += sales
+            stats[2] += report.efficiency
+        for cheese, sold in report.sold_items():
+            self.cheese_sales[cheese] = self.cheese_sales.get(cheese, 0) + sold
+
+    def ranking(self, kind: str) -> list[tuple[str, int, int, float]]:
+        """[(город или сеть, дегустаций, продано, средняя эффективность)] по убыванию продаж."""
+        groups = self.cities if kind == "city" else self.networks
+        with self._lock:
+            rows = [(name, n, sales, eff / n if n else 0.0) for name, (n, sales, eff) in groups.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    @property
+    def average_efficiency(self) -> float:
+        return self.efficiency_sum / self.stores if self.stores else 0.0
+
+
+all_time_stats = AllTimeStats()
+history_feed.register(all_time_stats)
+report_events.subscribe(all_time_stats.add_reports)
+
+
+# ===================== ИТОГИ ДЛЯ МЕНЮ UltimateTelegramBot =====================
+class DateTotals(report_events.ReportAggregate):
+    """Итоги по датам (RunningTotals на дату) — снимки «По дате» без повторного сопоставления."""
+
+    def __init__(self, cheese_types):
+        super().__init__()
+        self.cheese_types = tuple(cheese_types)
+        self.days = {}  # дата -> RunningTotals
+
+    def _add(self, report) -> None:
+        from daily_stats import RunningTotals
+
+        day = datetime.strptime(report.date, '%d.%m.%Y').date()
+        totals = self.days.get(day)
+        if totals is None:
+            totals = self.days[day] = RunningTotals(self.cheese_types)
+        totals.add_report(report)
+
+
+class StatsCache:
+    """
+    Итоги для меню UltimateTelegramBot («Текущий день», «По дате», «За всё время»).
+
+    Считает их DegustationAnalyzer: после первого опроса история сворачивается по месяцам
+    (iter_all_reports) в фоновом потоке, а каждая пачка новых отчётов добавляется к итогам
+    сразу — публикация итогов идёт под общей блокировкой, повторы отсекает report_key. Готовые
+    словари кладутся в общее хранилище (shared_state.py) под ключами stats:<таблица>:...,
+    а бот в любом процессе только читает их — вычисление одно на всех, ответ — чтение ключа.
+    """
+
+    # Сколько последних дат предлагать в меню «По дате»
+    RECENT_DATES = 10
+
+    def __init__(self, config, state):
+        self.config = config
+        self.state = state
+        self.prefix = f"stats:{config.EVENING_SHEET_ID}"
+        self.all_time = AllTimeStats()
+        self.by_date = DateTotals(config.CHEESE_TYPES)
+        self.feed = HistoryFeed()
+        self.feed.register(self.all_time)
+        self.feed.register(self.by_date)
+        self.expected = {}  # дата -> утренних анкет за всю историю листа
+        self.loaded = False
+        self._lock = threading.Lock()  # публикация: свёртка истории и новые пачки из разных потоков
+
+    # ----- сторона анализатора -----
+    def load(self, processor, morning, evening, limit_mb: float = 0) -> None:
+        """Сворачивает историю из снимков листов один раз и публикует все итоги."""
+        started = time.perf_counter()
+        try:
+            if not morning.empty:
+                counts = morning.frame.groupby("day").size()
+                with self._lock:
+                    for day, n in counts.items():
+                        self.expected[day.date()] = max(self.expected.get(day.date(), 0), int(n))
+            self.feed.feed(iter_all_reports(processor, morning, evening, limit_mb))
+        except MemoryLimitError as e:
+            logger.error(f"Итоги за всё время неполные: {e}")
+        finally:
+            self.loaded = True
+        with self._lock:
+            for day in self._dates():
+                self._publish_day(day)
+            self._publish_totals()
+        logger.info(
+            f"Итоги для меню: {self.all_time.stores} отчётов, {len(self.by_date.days)} дат "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
+
+    def _fold(self, reports) -> None:
+        self.all_time.add_reports(reports)
+        self.by_date.add_reports(reports)
+
+    def update(self, reports, daily_stats) -> None:
+        """Добавляет новые отчёты и публикует затронутые даты, сегодня и итоги за всё время."""
+        self._fold(reports)
+        days = {datetime.strptime(r.date, '%d.%m.%Y').date() for r in reports}
+        days.add(datetime.now().date())
+        with self._lock:
+            for day in days:
+                if day in daily_stats.days:
+                    self.expected[day] = max(self.expected.get(day, 0), daily_stats.days[day].expected)
+                self._publish_day(day)
+            self._publish_totals()
+
+    def _dates(self) -> list[date]:
+        with self.by_date._lock:
+            return sorted(self.by_date.days)
+
+    def _publish_day(self, day: date) -> None:
+        from daily_stats import RunningTotals
+
+        totals = self.by_date.days.get(day) or RunningTotals(self.by_date.cheese_types)
+        expected = self.expected.get(day, totals.stores)
+        if not expected and not totals.stores:
+            return
+        with self.by_date._lock:
+            summary = totals.summary(expected, totals.stores)
+        summary['updated_at'] = datetime.now().strftime('%H:%M')
+        self.state.set_obj(f"{self.prefix}:day:{day.isoformat()}", summary)
+
+    def _publish_totals(self) -> None:
+        stats = self.all_time
+        with stats._lock:
+            totals = {
+                'stores': stats.stores,
+                'total_sales': stats.total_sales,
+                'total_visitors': stats.total_visitors,
+                'average_efficiency': round(stats.average_efficiency, 1),
+                'cheese_sales': dict(stats.cheese_sales),
+            }
+        self.state.set_obj(f"{self.prefix}:all", {
+            **totals,
+            'cities': stats.ranking("city"),
+            'networks': stats.ranking("network"),
+            'updated_at': datetime.now().strftime('%d.%m.%Y %H:%M'),
+        })
+        dates = self._dates()[-self.RECENT_DATES:]
+        self.state.set_obj(f"{self.prefix}:dates", [day.isoformat() for day in reversed(dates)])
+
+    # ----- сторона бота -----
+    def day(self, day: date) -> dict | None:
+        """Сводка за дату в формате DataProcessor.generate_summary_report; None — итогов нет."""
+        return self.state.get_obj(f"{self.prefix}:day:{day.isoformat()}")
+
+    def totals(self) -> dict | None:
+        return self.state.get_obj(f"{self.prefix}:all")
+
+    def recent_dates(self) -> list[date]:
+        return [date.fromisoformat(day) for day in self.state.get_obj(f"{self.prefix}:dates") or []]
@@ -0,0 +1,141 @@
+# backfill.py — пересчёт истории отчётов после изменения порогов сопоставления или формулы эффективности
+#
+#   python backfill.py                          # вся история, все ядра, результат в backfill/
+#   python backfill.py --from 2025-10-01 --to 2025-10-31 --workers 4
+#   python backfill.py --project brand-a --force
+#
+# Оба листа загружаются один раз, строки делятся по дате, и каждая дата сопоставляется
+# отдельным процессом (DataProcessor.process_daily_reports). Сопоставляются только анкеты
+# одной даты, поэтому результат совпадает с пересчётом всей истории разом.
+# На каждую дату пишется файл <output>/<YYYY-MM-DD>.json — это и результат, и чекпоинт:
+# прерванный запуск при повторе пропускает уже посчитанные даты.
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+from logging_setup import LOG_FORMAT
+
+logger = logging.getLogger("backfill")
+
+_processor = None  # DataProcessor процесса-воркера
+
+
+def _init_worker(config, log_level):
+    global _processor
+    from data_processor import DataProcessor
+
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    _processor = DataProcessor(config)
+
+
+def checkpoint_path(output_dir: str, day: date) -> str:
+    return os.path.join(output_dir, f"{day.isoformat()}.json")
+
+
+def _recompute_day(day: date, morning_df, evening_df, output_dir: str) -> tuple[date, int]:
+    """Сопоставляет анкеты одной даты и атомарно записывает результат."""
+    reports = _processor.process_daily_reports(morning_df, evening_df, track_processed=False)
+    payload = {
+        "date": day.isoformat(),
+        "morning_rows": len(morning_df),
+        "evening_rows": len(evening_df),
+        "computed_at": datetime.now().isoformat(timespec="seconds"),
+        "reports": [report.to_dict() for report in reports],
+    }
+    path = checkpoint_path(output_dir, day)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)  # файл либо целиком есть, либо его нет
+    return day, len(reports)
+
+
+def iter_reports(output_dir: str):
+    """Читает пересчитанные отчёты (DetailedReport) из output_dir в порядке дат."""
+    from report_record import DetailedReport
+
+    for name in sorted(os.listdir(output_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(output_dir, name), encoding="utf-8") as f:
+            for data in json.load(f)["reports"]:
+                yield DetailedReport.from_dict(data)
+
+
+def run_backfill(args):
+    from google_sheets import GoogleSheetsService
+    from projects import load_projects
+
+    projects = load_projects()
+    if args.project:
+        projects = [p for p in projects if p.PROJECT_NAME == args.project]
+        if not projects:
+            raise SystemExit(f"Проект '{args.project}' не найден в реестре")
+    config = projects[0]
+
+    started = time.perf_counter()
+    sheets = GoogleSheetsService()
+    # Снимки разбираются один раз: воркеры получают готовые даты, ФИО и адреса
+    morning = sheets.get_snapshot(config.MORNING_SHEET_ID, config.MORNING_SHEET_NAME, config.MORNING_COLUMNS)
+    evening = sheets.get_snapshot(config.EVENING_SHEET_ID, config.EVENING_SHEET_NAME, config.EVENING_COLUMNS)
+    loaded = time.perf_counter()
+
+    date_from = date.fromisoformat(args.date_from) if args.date_from else date.min
+    date_to = date.fromisoformat(args.date_to) if args.date_to else date.max
+    days = sorted(d for d in set(morning.dates()) & set(evening.dates()) if date_from <= d <= date_to)
+
+    os.makedirs(args.output, exist_ok=True)
+    todo = [d for d in days if args.force or not os.path.exists(checkpoint_path(args.output, d))]
+    logger.info(
+        f"Листы загружены за {loaded - started:.1f} с: утро={len(morning)}, вечер={len(evening)}. "
+        f"Дат с анкетами: {len(days)}, уже посчитано: {len(days) - len(todo)}, к пересчёту: {len(todo)}"
+    )
+    if not todo:
+        return
+
+    workers = args.workers or os.cpu_count() or 1
+    pairs = 0
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(config, args.log_level)) as pool:
+        futures = [
+            pool.submit(_recompute_day, d, morning.on_date(d), evening.on_date(d), args.output)
+            for d in todo
+        ]
+        for future in as_completed(futures):
+            day, count = future.result()
+            done += 1
+            pairs += count
+            logger.debug(f"{day}: {count} отчётов ({done}/{len(todo)})")
+
+    elapsed = time.perf_counter() - loaded
+    print(
+        f"Пересчитано дат: {done}, отчётов: {pairs} за {elapsed:.2f} с "
+        f"({done / elapsed:.1f} дат/с, {pairs / elapsed:.1f} пар/с, процессов: {workers}). "
+        f"Результат: {os.path.abspath(args.output)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельный пересчёт истории отчётов с чекпоинтами по датам")
+    parser.add_argument("--output", default="backfill", help="папка с результатами по датам")
+    parser.add_argument("--from", dest="date_from", help="первая дата, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="последняя дата, YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=0, help="число процессов (по умолчанию — все ядра)")
+    parser.add_argument("--project", help="имя проекта из PROJECTS_FILE (по умолчанию — первый)")
+    parser.add_argument("--force", action="store_true", help="пересчитать и уже посчитанные даты")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT)
+    logger.setLevel(logging.INFO)  # прогресс пересчёта виден при любом --log-level
+    run_backfill(args)
+
+
+if __name__ == "__main__":
+    main()
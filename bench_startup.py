@@ -0,0 +1,70 @@
+# bench_startup.py — контроль времени холодного старта
+#
+#   python bench_startup.py                 # telegram_webhook и main, бюджет по умолчанию
+#   python bench_startup.py --budget-ms 400 --runs 5
+#
+# Каждый модуль импортируется в свежем интерпретаторе. Проверяется, что
+# медиана времени импорта укладывается в бюджет и что тяжёлые библиотеки
+# при этом не загружены. Код возврата 1, если что-то из этого нарушено.
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = [
+    "pandas", "numpy", "scipy", "rapidfuzz", "gspread",
+    "google.auth", "google.oauth2", "telegram",
+]
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}), file=sys.stderr)
+"""
+
+
+def measure(module: str, runs: int) -> tuple[list[float], list[str]]:
+    timings, heavy = [], []
+    for _ in range(runs):
+        code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+        # Результат — в stderr: stdout занят логами, которые пишет фоновый поток
+        err = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stderr
+        result = json.loads([line for line in err.splitlines() if line.startswith('{"elapsed"')][-1])
+        timings.append(result["elapsed"])
+        heavy = result["heavy"]
+    return timings, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта MD-BOT")
+    parser.add_argument("modules", nargs="*", default=["telegram_webhook", "main"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=500.0,
+                        help="допустимая медиана времени импорта, мс")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        timings, heavy = measure(module, args.runs)
+        median_ms = statistics.median(timings) * 1000
+        status = "OK"
+        if median_ms > args.budget_ms:
+            status = f"ПРЕВЫШЕН БЮДЖЕТ {args.budget_ms:.0f} мс"
+            failed = True
+        if heavy:
+            status = f"ЗАГРУЖЕНЫ ТЯЖЁЛЫЕ МОДУЛИ: {', '.join(heavy)}"
+            failed = True
+        print(f"{module:<20} медиана {median_ms:7.1f} мс (мин {min(timings) * 1000:.1f}) — {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
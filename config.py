@@ -79,4 +79,69 @@ class Config:
 
     TARGET_CONVERSION = 0.5
     CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "5"))
-    END_OF_DAY_TIME = os.getenv("END_OF_DAY_TIME", "22:00")
\ No newline at end of file
+    END_OF_DAY_TIME = os.getenv("END_OF_DAY_TIME", "22:00")
+
+    # === ПРОЕКТЫ ===
+    # JSON-реестр проектов (см. projects.py); без него работает один проект из настроек выше
+    PROJECT_NAME = os.getenv("PROJECT_NAME", "default")
+    PROJECTS_FILE = os.getenv("PROJECTS_FILE")
+    PROJECT_WORKERS = int(os.getenv("PROJECT_WORKERS", "4"))  # потоков для опроса проектов
+
+    # === ЛОГИ ===
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FILE = os.getenv("LOG_FILE", "logs/degustation_analyzer.log")  # пусто — только stdout
+    LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))  # в DEBUG — каждая N-я строка пачки
+
+    # === ИСТОЧНИК ДАННЫХ ===
+    # gspread — боевые Google Sheets, fake — генератор в памяти для нагрузочных тестов
+    SHEETS_BACKEND = os.getenv("SHEETS_BACKEND", "gspread")
+
+    # === ОБЩЕЕ СОСТОЯНИЕ ВОРКЕРОВ ===
+    # sqlite — файл в режиме WAL для нескольких воркеров на одной машине, redis — сервер Redis,
+    # memory — только свой процесс (по умолчанию для fake: сгенерированные данные у каждого процесса свои)
+    SHARED_STATE = os.getenv("SHARED_STATE", "memory" if SHEETS_BACKEND == "fake" else "sqlite")
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "data/shared_state.sqlite3")
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REPORT_DEDUP_TTL = int(os.getenv("REPORT_DEDUP_TTL", str(3 * 24 * 3600)))  # секунды хранения ключей отчётов
+    # Аренда опроса и сводки (run_lease.py): дольше этого упавший исполнитель её не держит, секунды
+    RUN_LEASE_TTL = int(os.getenv("RUN_LEASE_TTL", "600"))
+
+    # === WEBHOOK ===
+    # Размер пула HTTP-соединений к Bot API, общего для всех обработчиков Application
+    TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "16"))
+
+    # === PUSH-ПРИЁМ АНКЕТ (/ingest) ===
+    # Токен, с которым onFormSubmit присылает строки анкет; без токена /ingest выключен
+    INGEST_TOKEN = os.getenv("INGEST_TOKEN")
+    # Интервал опроса-сверки (минуты), когда анкеты приходят через /ingest
+    RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "30"))
+
+    # === СНИМКИ ЛИСТОВ ===
+    # Сколько секунд экраны бота используют уже загруженный и разобранный лист
+    SNAPSHOT_TTL = int(os.getenv("SNAPSHOT_TTL", "60"))
+
+    # === КЭШ ЭКРАНОВ СТАТИСТИКИ ===
+    RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+    RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", "600"))  # секунды
+
+    # === ТРЕНДЫ И РЕЙТИНГИ ===
+    # Как часто агрегаты бота перечитывают всю историю, если новые отчёты не приходят через report_events
+    HISTORY_RELOAD_INTERVAL = int(os.getenv("HISTORY_RELOAD_INTERVAL", "3600"))  # секунды
+    # Потолок RSS процесса (МБ) при свёртке истории по месяцам; 0 — без ограничения.
+    # По умолчанию — с запасом под инстанс Render на 512 МБ
+    MEMORY_LIMIT_MB = int(os.getenv("MEMORY_LIMIT_MB", "450"))
+
+    # === ДАШБОРД ДНЯ ===
+    # Вместо сообщения на каждый отчёт — одно закреплённое сообщение «сегодня», обновляемое на месте
+    LIVE_DASHBOARD = os.getenv("LIVE_DASHBOARD", "false").lower() in ("1", "true", "yes")
+    DASHBOARD_EDIT_INTERVAL = int(os.getenv("DASHBOARD_EDIT_INTERVAL", "60"))  # секунды между правками
+
+    # === ЗАДЕРЖКА ОТЧЁТОВ ===
+    # Цель: отчёт в чате не позже чем через LATENCY_TARGET секунд после отправки вечерней анкеты
+    LATENCY_TARGET = int(os.getenv("LATENCY_TARGET", "900"))
+    LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "3600"))  # окно перцентилей, секунды
+
+    # === ПРОВЕРКА ДАННЫХ ===
+    VALIDATION_MAX_VISITORS = int(os.getenv("VALIDATION_MAX_VISITORS", "500"))  # больше — неправдоподобно
+    VALIDATION_OUTLIER_Z = float(os.getenv("VALIDATION_OUTLIER_Z", "3.0"))  # порог выброса эффективности, σ
+    VALIDATION_MIN_HISTORY = int(os.getenv("VALIDATION_MIN_HISTORY", "5"))  # отчётов магазина до проверки выбросов
@@ -0,0 +1,141 @@
+# daily_stats.py — счётчики дня, которые обновляются по мере поступления анкет
+
+import logging
+from datetime import date, datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class RunningTotals:
+    """Накопительные итоги по отчётам: продажи по городам, сетям, сотрудникам и сырам."""
+
+    def __init__(self, cheese_types):
+        self.stores = 0
+        self.total_sales = 0
+        self.total_visitors = 0
+        self.efficiency_sum = 0.0
+        self.city_sales = {}
+        self.network_sales = {}
+        self.employee_sales = {}
+        self.cheese_sales = {cheese: 0 for cheese in cheese_types}
+
+    def add_report(self, report) -> None:
+        """report — DetailedReport; поля читаются атрибутами, это горячий цикл сводок."""
+        sales = report.total_sales
+        self.stores += 1
+        self.total_sales += sales
+        self.total_visitors += report.visitors
+        self.efficiency_sum += report.efficiency
+        self.city_sales[report.city] = self.city_sales.get(report.city, 0) + sales
+        self.network_sales[report.network] = self.network_sales.get(report.network, 0) + sales
+        self.employee_sales[report.employee] = self.employee_sales.get(report.employee, 0) + sales
+        for cheese, sold in report.sold_items():
+            self.cheese_sales[cheese] = self.cheese_sales.get(cheese, 0) + sold
+
+    def summary(self, expected_reports: int, actual_reports: int) -> dict:
+        """Сводка в формате DataProcessor.generate_summary_report."""
+        best_city = max(self.city_sales.items(), key=lambda x: x[1]) if self.city_sales else ("—", 0)
+        best_network = max(self.network_sales.items(), key=lambda x: x[1]) if self.network_sales else ("—", 0)
+        best_employee = max(self.employee_sales.items(), key=lambda x: x[1]) if self.employee_sales else ("—", 0)
+        best_cheese = max(self.cheese_sales.items(), key=lambda x: x[1]) if self.cheese_sales else ("—", 0)
+
+        return {
+            'best_city': best_city[0], 'best_city_sales': best_city[1],
+            'best_network': best_network[0], 'best_network_sales': best_network[1],
+            'best_employee': best_employee[0], 'best_employee_sales': best_employee[1],
+            'best_cheese': best_cheese[0], 'best_cheese_sales': best_cheese[1],
+            'total_stores': self.stores,
+            'expected_stores': expected_reports,
+            'missing_reports': expected_reports - actual_reports,
+            'total_sales': self.total_sales,
+            'average_efficiency': round(self.efficiency_sum / self.stores, 1) if self.stores else 0.0,
+        }
+
+
+class DayCounters:
+    """Всё, что нужно сводке за один день: ожидаемые магазины, сопоставленные отчёты и итоги."""
+
+    def __init__(self, day: date, cheese_types):
+        self.day = day
+        self.expected_keys = set()  # утренние анкеты (Timestamp|ФИО|адрес)
+        self.matched_keys = set()  # ключи отправленных отчётов
+        self.totals = RunningTotals(cheese_types)
+
+    @property
+    def expected(self) -> int:
+        return len(self.expected_keys)
+
+    @property
+    def matched(self) -> int:
+        return len(self.matched_keys)
+
+    def summary(self) -> dict:
+        return self.totals.summary(self.expected, self.matched)
+
+
+class DailyStats:
+    """
+    Счётчики по дням, которые DegustationAnalyzer пополняет при каждом опросе:
+    новые утренние строки увеличивают «ожидалось», новые отчёты — итоги дня.
+    Сводка в END_OF_DAY_TIME читает готовые числа без повторной загрузки листа.
+    """
+
+    def __init__(self, config: Config | None = None):
+        self.config = config or Config()
+        self.days = {}
+
+    def _day(self, day: date) -> DayCounters:
+        counters = self.days.get(day)
+        if counters is None:
+            counters = self.days[day] = DayCounters(day, self.config.CHEESE_TYPES)
+        return counters
+
+    def get(self, day: date) -> DayCounters:
+        return self._day(day)
+
+    def add_morning_rows(self, morning_df) -> int:
+        """Учитывает новые утренние анкеты; повторно пришедшие строки не считаются. Возвращает число новых."""
+        import pandas as pd
+
+        if morning_df.empty:
+            return 0
+        cols = self.config.MORNING_COLUMNS
+        if 'day' in morning_df:  # SheetSnapshot: дата уже разобрана
+            dates = morning_df['day'].dt.date
+        else:
+            dates = pd.to_datetime(morning_df[cols['date']], format='%m/%d/%Y', errors='coerce').dt.date
+        keys = (
+            morning_df[cols['timestamp']].astype(str) + '|'
+            + morning_df[cols['employee_name']].astype(str) + '|'
+            + morning_df[cols['address']].astype(str)
+        )
+        added = 0
+        for day, key in zip(dates, keys):
+            if pd.isna(day):
+                continue
+            expected_keys = self._day(day).expected_keys
+            if key not in expected_keys:
+                expected_keys.add(key)
+                added += 1
+        return added
+
+    def add_reports(self, reports) -> None:
+        """Учитывает новые сопоставленные отчёты (ключ отчёта — report['key'])."""
+        for report in reports:
+            day = datetime.strptime(report['date'], '%d.%m.%Y').date()
+            counters = self._day(day)
+            if report['key'] in counters.matched_keys:
+                continue
+            counters.matched_keys.add(report['key'])
+            counters.totals.add_report(report)
+
+    def has_report(self, day: date, key: str) -> bool:
+        counters = self.days.get(day)
+        return counters is not None and key in counters.matched_keys
+
+    def prune(self, keep_from: date) -> None:
+        """Удаляет счётчики дней раньше keep_from."""
+        for day in [d for d in self.days if d < keep_from]:
+            del self.days[day]
@@ -1,41 +1,148 @@
 # data_processor.py — 100% РАБОЧИЕ ЛОГИ С ПЕРВОЙ СЕКУНДЫ
 
-import pandas as pd
 from datetime import datetime, date
 from config import Config
 from address_normalizer import AddressNormalizer
+from daily_stats import RunningTotals
+from report_record import DetailedReport
+from logging_setup import LogSampler
 import logging
+import math
+import numbers
 import re
-import numpy as np
-from scipy.optimize import linear_sum_assignment
-from rapidfuzz import fuzz
+import time
 
-# ═══════════════════════════════════════════════
-# ВАЖНО: ПРИНУДИТЕЛЬНО ВКЛЮЧАЕМ ЛОГИРОВАНИЕ В ЭТОМ МОДУЛЕ
-# ═══════════════════════════════════════════════
+# pandas, numpy, scipy и rapidfuzz импортируются внутри методов: модуль подключается
+# при старте сервиса, а тяжёлые библиотеки нужны только при первом сопоставлении.
+
+# Хендлеры и уровень настраивает logging_setup.setup_logging() в точке входа;
+# построчные сообщения сопоставления — DEBUG с прореживанием (LogSampler)
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)  # ← ГАРАНТИРУЕМ, что будет писать INFO
 
-# Если хендлеры ещё не добавлены (т.е. main.py ещё не настроил basicConfig) — добавляем сами
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s | %(name)-20s | %(levelname)-8s | %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+# Пара утро/вечер принимается, если схожесть не ниже порога
+MATCH_THRESHOLD = 0.75
+FIO_WEIGHT = 0.72  # вес ФИО во взвешенном скоре, остальное — адрес
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def norm_fio(name) -> str:
+    """ФИО для сопоставления: нижний регистр, до трёх слов в алфавитном порядке."""
+    if _is_missing(name):
+        return ""
+    s = re.sub(r'[^а-яёa-z\s]', ' ', str(name).lower())
+    words = [w for w in re.findall(r'\b[а-яёa-z]+\b', s) if len(w) > 1]
+    return ' '.join(sorted(words)[:3])
+
+
+def norm_address(addr) -> str:
+    """Адрес для сопоставления: без названий сетей и служебных слов, токены по алфавиту."""
+    if _is_missing(addr):
+        return ""
+    s = str(addr).lower()
+    s = re.sub(r'\b(тц|тк|трц|магнит|мария.?ра|мария|ашан|пятёрочка|перекрёсток|г\.?\s*|город\s*|ул\.?\s*|улица\s*|проспект\s*|пр\.?\s*|дом\s*|д\.?\s*|карла\s+)\b', ' ', s)
+    s = re.sub(r'[^\w\s/,.-]', ' ', s)
+    s = re.sub(r'\s+', ' ', s).strip()
+    tokens = [t.strip(',.') for t in s.split() if len(t) > 1]
+    return ' '.join(sorted(tokens))
+
+
+def score_matrix(m_fio, m_addr, e_fio, e_addr):
+    """
+    Схожесть каждой утренней анкеты с каждой вечерней (матрица len(m) × len(e), 0..1):
+    0.72·ФИО + 0.28·адрес, но не ниже схожести адресов — почти идеальный адрес проходит
+    и при более слабом ФИО. Общая для пакетного (DataProcessor) и онлайн-сопоставления (OnlineMatcher).
+    """
+    import numpy as np
+    from rapidfuzz import fuzz, process
+
+    fio = process.cdist(m_fio, e_fio, scorer=fuzz.token_set_ratio, dtype=np.float64) / 100.0
+    addr = process.cdist(m_addr, e_addr, scorer=fuzz.token_set_ratio, dtype=np.float64) / 100.0
+    return np.maximum(FIO_WEIGHT * fio + (1 - FIO_WEIGHT) * addr, addr)
+
+
+def _row_reader(df, columns):
+    """
+    Функция «позиция -> словарь колонок» для строк df. Значения берутся из массивов колонок
+    (df[col].array: Timestamp для дат, str для category), а не через df.iloc[pos] — собирать
+    Series из широкой разнотипной строки на каждую пару в разы дороже.
+    """
+    arrays = {col: df[col].array for col in dict.fromkeys(columns) if col in df}
+    return lambda pos: {col: arr[pos] for col, arr in arrays.items()}
+
+
+def form_columns(columns: dict) -> list[str]:
+    """Все колонки анкеты из карты MORNING_/EVENING_COLUMNS (вложенные карты сыров разворачиваются)."""
+    result = []
+    for value in columns.values():
+        result.extend(value.values() if isinstance(value, dict) else [value])
+    return result
+
+
+_NO_STOCK = ('', 'nan', 'NaN', 'нет', 'не было', 'отсутствует')
+_SOLD_OUT = ('все продано', 'всё ушло', 'все ушло', 'разобрали')
+_STOCK_WORDS = _SOLD_OUT + ('много', 'более', 'больше')
+
+
+def parse_stock(value) -> int:
+    """Остаток/число из ячейки формы: числа как есть, текст вроде «около 20», «10-15», «нет» — разбором."""
+    if _is_missing(value) or value in _NO_STOCK:
+        return 0
+    if isinstance(value, numbers.Number):  # в т.ч. numpy.int64 из числовых колонок pandas
+        return int(value)
+    if isinstance(value, str):
+        text = value.lower().strip()
+        if any(x in text for x in _SOLD_OUT):
+            nums = re.findall(r'\d+', value)
+            return int(nums[0]) if nums else 0
+        approx = re.search(r'(?:≈|~|примерно|около|порядка)\s*(\d+)', text)
+        if approx:
+            return int(approx.group(1))
+        rng = re.search(r'(\d+)\s*[-–—−]\s*(\d+)|(\d+)\s+до\s+(\d+)', text)
+        if rng:
+            nums = [int(x) for x in rng.groups() if x]
+            return int(sum(nums) / len(nums))
+        nums = re.findall(r'\d+', value)
+        if nums:
+            return int(nums[0])
+        if 'много' in text:
+            return 50
+        if 'более' in text or 'больше' in text:
+            n = re.search(r'\d+', text)
+            return int(n.group()) + 10 if n else 50
+    return 0
+
+
+def is_unparsed_stock(value) -> bool:
+    """True, если parse_stock вернёт 0 только потому, что не понял текст (не «нет» и не число)."""
+    if not isinstance(value, str) or value in _NO_STOCK:
+        return False
+    text = value.lower().strip()
+    if text in _NO_STOCK or re.search(r'\d', text):
+        return False
+    return not any(x in text for x in _STOCK_WORDS)
 
-# Тестовая строка — ДОЛЖНА появиться при каждом импорте модуля!
-logger.info("data_processor.py ЗАГРУЖЕН — ЛОГИ РАБОТАЮТ НА 100%!")
-# ═══════════════════════════════════════════════
 
 class DataProcessor:
-    def __init__(self):
-        self.config = Config()
+    def __init__(self, config: Config | None = None):
+        self.config = config or Config()
+        self.cheese_types = tuple(self.config.CHEESE_TYPES)  # общий для всех DetailedReport
         self.normalizer = AddressNormalizer()
         self.processed_pairs = set()
         logger.info("DataProcessor инициализирован")
 
-    def process_daily_reports(self, morning_df, evening_df):
+    def process_daily_reports(self, morning_df, evening_df, track_processed=True):
+        """
+        Сопоставляет утренние и вечерние анкеты и возвращает детальные отчёты.
+        track_processed=False — пары не запоминаются в processed_pairs (для экранов
+        статистики, которые пересчитывают уже отправленные отчёты).
+        """
+        import pandas as pd
+        from scipy.optimize import linear_sum_assignment
+
         reports = []
+        started = time.perf_counter()
 
         if morning_df.empty or evening_df.empty:
             logger.info("Один из датафреймов пустой — ничего не сопоставляем")
@@ -48,75 +155,55 @@ class DataProcessor:
         m_df = m_df.reset_index(drop=True)
         e_df = e_df.reset_index(drop=True)
 
-        logger.info(f"process_daily_reports: Утренних: {len(m_df)}, Вечерних: {len(e_df)}")
-
-        # === НОРМАЛИЗАЦИЯ ФИО ===
-        def norm_fio(name):
-            if pd.isna(name):
-                return ""
-            s = re.sub(r'[^а-яёa-z\s]', ' ', str(name).lower())
-            words = [w for w in re.findall(r'\b[а-яёa-z]+\b', s) if len(w) > 1]
-            return ' '.join(sorted(words)[:3])
-
-        m_df['fio'] = m_df[self.config.MORNING_COLUMNS['employee_name']].apply(norm_fio)
-        e_df['fio'] = e_df[self.config.EVENING_COLUMNS['employee_name']].apply(norm_fio)
-
-        # === НОРМАЛИЗАЦИЯ АДРЕСА ===
-        def norm_address(addr):
-            if pd.isna(addr):
-                return ""
-            s = str(addr).lower()
-            s = re.sub(r'\b(тц|тк|трц|магнит|мария.?ра|мария|ашан|пятёрочка|перекрёсток|г\.?\s*|город\s*|ул\.?\s*|улица\s*|проспект\s*|пр\.?\s*|дом\s*|д\.?\s*|карла\s+)\b', ' ', s)
-            s = re.sub(r'[^\w\s/,.-]', ' ', s)
-            s = re.sub(r'\s+', ' ', s).strip()
-            tokens = [t.strip(',.') for t in s.split() if len(t) > 1]
-            return ' '.join(sorted(tokens))
-
-        m_df['addr'] = m_df[self.config.MORNING_COLUMNS['address']].apply(norm_address)
-        e_df['addr'] = e_df[self.config.EVENING_COLUMNS['address']].apply(norm_address)
-
-        # === ДАТЫ ===
-        def to_date(val):
-            try:
-                # Даты в таблицах в формате MM/DD/YYYY (например, 10/31/2025)
-                return pd.to_datetime(val, format='%m/%d/%Y', errors='coerce').date()
-            except Exception:
-                return None
 
-        m_df['date'] = m_df[self.config.MORNING_COLUMNS['date']].apply(to_date)
-        e_df['date'] = e_df[self.config.EVENING_COLUMNS['date']].apply(to_date)
+        # Снимок листа (SheetSnapshot) приносит готовые fio, addr и day — тогда ничего не разбираем
+        for df, columns in ((m_df, self.config.MORNING_COLUMNS), (e_df, self.config.EVENING_COLUMNS)):
+            if 'fio' not in df:
+                df['fio'] = df[columns['employee_name']].map(norm_fio)
+            if 'addr' not in df:
+                df['addr'] = df[columns['address']].map(norm_address)
+            # Даты в таблицах в формате MM/DD/YYYY (например, 10/31/2025)
+            day = df['day'] if 'day' in df else pd.to_datetime(df[columns['date']], format='%m/%d/%Y', errors='coerce')
+            df['date'] = day.dt.date
 
-        m_df = m_df.dropna(subset=['date'])
-        e_df = e_df.dropna(subset=['date'])
+        m_df = m_df.dropna(subset=['date']).reset_index(drop=True)
+        e_df = e_df.dropna(subset=['date']).reset_index(drop=True)
 
-        # === МАТРИЦА СХОЖЕСТИ ===
+        # === СОПОСТАВЛЕНИЕ ПО ДАТАМ ===
+        # Пары бывают только внутри одной даты: матрица и венгерский алгоритм — на блок даты,
+        # а не на всю историю (n × m) разом
         n, m = len(m_df), len(e_df)
-        scores = np.zeros((n, m))
-
-        for i, mr in m_df.iterrows():
-            for j, er in e_df.iterrows():
-                if mr['date'] != er['date']:
-                    continue
-                fio_score = fuzz.token_set_ratio(mr['fio'], er['fio']) / 100.0
-                addr_score = fuzz.token_set_ratio(mr['addr'], er['addr']) / 100.0
-                # Базовый взвешенный скор
-                weighted = 0.72 * fio_score + 0.28 * addr_score
-                # Если адрес совпал почти идеально — даём шансу пройти даже при более слабом ФИО
-                total_score = max(weighted, addr_score)
-                scores[i, j] = total_score
-
-        # === СОПОСТАВЛЕНИЕ ===
-        if n > 0 and m > 0:
-            cost_matrix = 1.0 - scores
-            row_ind, col_ind = linear_sum_assignment(cost_matrix)
-            used_morning_indices = set()
-
-            for r, c in zip(row_ind, col_ind):
-                score = scores[r, c]
-                if score < 0.75:
+        rejected = 0
+        rejected_log = LogSampler(logger)
+        matched_log = LogSampler(logger)
+        evening_by_day = e_df.groupby('date').indices
+        morning_row_at = _row_reader(
+            m_df, form_columns(self.config.MORNING_COLUMNS) + ['date', 'fio', 'addr', 'stock_unparsed']
+        )
+        evening_row_at = _row_reader(
+            e_df, form_columns(self.config.EVENING_COLUMNS) + ['date', 'fio', 'addr', 'normalized_address', 'stock_unparsed']
+        )
+
+        for day, m_pos in m_df.groupby('date', sort=True).indices.items():
+            e_pos = evening_by_day.get(day)
+            if e_pos is None:
+                continue
+            scores = score_matrix(
+                m_df['fio'].values[m_pos], m_df['addr'].values[m_pos],
+                e_df['fio'].values[e_pos], e_df['addr'].values[e_pos],
+            )
+            row_ind, col_ind = linear_sum_assignment(1.0 - scores)
+
+            for i, j in zip(row_ind, col_ind):
+                score = scores[i, j]
+                r, c = m_pos[i], e_pos[j]
+                if score < MATCH_THRESHOLD:
+                    rejected += 1
+                    if not rejected_log.hit():
+                        continue
                     # Детальное логирование отклонённых пар для отладки
-                    mr = m_df.iloc[r]
-                    er = e_df.iloc[c]
+                    mr = morning_row_at(r)
+                    er = evening_row_at(c)
                     logger.debug(
                         "Отклонена пара (низкий score): %s | %s | score=%.3f, fio_m='%s', fio_e='%s', addr_m='%s', addr_e='%s'",
                         mr.get(self.config.MORNING_COLUMNS['employee_name'], '')[:25],
@@ -128,33 +215,41 @@ class DataProcessor:
                         er.get('addr', ''),
                     )
                     continue
-                if r in used_morning_indices:
-                    continue
 
-                used_morning_indices.add(r)
-                morning_row = m_df.iloc[r]
-                evening_row = e_df.iloc[c]
+                morning_row = morning_row_at(r)
+                evening_row = evening_row_at(c)
 
                 pair_key = f"{morning_row['date']}_{morning_row['fio']}_{morning_row['addr']}"
-                if pair_key in self.processed_pairs:
+                if track_processed and pair_key in self.processed_pairs:
                     continue
 
-                report = self._generate_detailed_report(morning_row, evening_row)
+                report = self.build_report(morning_row, evening_row)
                 if report:
                     reports.append(report)
-                    self.processed_pairs.add(pair_key)
-                    logger.info(f"Сопоставлено -> {morning_row[self.config.MORNING_COLUMNS['employee_name']][:25]:<25} | "
-                                f"{evening_row[self.config.EVENING_COLUMNS['address']][:40]:<40} | score={score:.3f} | продано={report['total_sales']} шт.")
-
-        logger.info(f"ИТОГО сопоставлено пар: {len(reports)} из {min(len(m_df), len(e_df))}")
+                    if track_processed:
+                        self.processed_pairs.add(pair_key)
+                    if matched_log.hit():
+                        logger.debug(
+                            "Сопоставлено -> %-25s | %-40s | score=%.3f | продано=%s шт.",
+                            morning_row[self.config.MORNING_COLUMNS['employee_name']][:25],
+                            evening_row[self.config.EVENING_COLUMNS['address']][:40],
+                            score,
+                            report.total_sales,
+                        )
+
+        # Одна строка на пачку вместо строки на каждую пару
+        logger.info(
+            f"Сопоставлено пар: {len(reports)} из {min(n, m)} (утро={n}, вечер={m}, "
+            f"отклонено по score={rejected}) за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
         return reports
 
-    def _generate_detailed_report(self, morning_row, evening_row):
+    def build_report(self, morning_row, evening_row):
+        """Детальный отчёт по сопоставленной паре строк (утро, вечер); None — если остатки не разобрать."""
         try:
-            sales_data = {}
-            total_sales = 0
+            starts, ends, solds = [], [], []
 
-            for cheese in self.config.CHEESE_TYPES:
+            for cheese in self.cheese_types:
                 start_col = self.config.MORNING_COLUMNS['cheese_start'][cheese]
                 end_col = self.config.EVENING_COLUMNS['cheese_end'][cheese]
 
@@ -165,97 +260,63 @@ class DataProcessor:
                     logger.warning(f"Пропущен сыр {cheese}: start={start_qty}, end={end_qty}")
                     return None
 
-                sold = max(0, start_qty - end_qty)
-                sales_data[cheese] = {'start': start_qty, 'end': end_qty, 'sold': sold}
-                total_sales += sold
+                starts.append(start_qty)
+                ends.append(end_qty)
+                solds.append(max(0, start_qty - end_qty))
 
             visitors = self._safe_int_convert(evening_row.get(self.config.EVENING_COLUMNS['visitors'], 0))
             if visitors is None:
                 logger.warning("Не удалось получить количество посетителей")
                 return None
 
+            total_sales = sum(solds)
             conversion = total_sales / visitors if visitors > 0 else 0
-            max_possible = sum(d['start'] for d in sales_data.values())
+            max_possible = sum(starts)
             stock_factor = min(1.0, max_possible / (visitors * 2)) if visitors > 0 else 1.0
             efficiency = (conversion / self.config.TARGET_CONVERSION) * 100 * stock_factor
 
-            report = {
-                'date': pd.to_datetime(evening_row[self.config.EVENING_COLUMNS['date']]).strftime('%d.%m.%Y'),
-                'city': evening_row[self.config.EVENING_COLUMNS['city']],
-                'network': evening_row[self.config.EVENING_COLUMNS['network_name']],
-                'employee': evening_row[self.config.EVENING_COLUMNS['employee_name']],
-                'visitors': visitors,
-                'cheese_data': sales_data,
-                'total_sales': total_sales,
-                'efficiency': round(efficiency, 1),
-                'normalized_address': evening_row.get('normalized_address', evening_row[self.config.EVENING_COLUMNS['address']])
-            }
-            logger.info(f"Отчёт успешно сформирован: {report['city']} | {report['employee']} | продано {total_sales} шт.")
+            report = DetailedReport(
+                date=evening_row['date'].strftime('%d.%m.%Y'),
+                city=evening_row[self.config.EVENING_COLUMNS['city']],
+                network=evening_row[self.config.EVENING_COLUMNS['network_name']],
+                employee=evening_row[self.config.EVENING_COLUMNS['employee_name']],
+                visitors=visitors,
+                total_sales=total_sales,
+                efficiency=round(efficiency, 1),
+                normalized_address=evening_row.get('normalized_address', evening_row[self.config.EVENING_COLUMNS['address']]),
+                cheese_types=self.cheese_types,
+                start=starts,
+                end=ends,
+                sold=solds,
+                submitted_at=self._submitted_at(evening_row),
+                # Текст в остатках снимок листа отмечает при разборе (SheetSnapshot, колонка stock_unparsed)
+                flags=('stock_text',) if morning_row.get('stock_unparsed') or evening_row.get('stock_unparsed') else (),
+            )
             return report
 
         except Exception as e:
             logger.error(f"Ошибка при генерации отчёта: {e}", exc_info=True)
             return None
 
+    def _submitted_at(self, evening_row):
+        """Timestamp вечерней анкеты как datetime (в снимке листа колонка уже разобрана)."""
+        value = evening_row.get(self.config.EVENING_COLUMNS.get('timestamp'))
+        if not isinstance(value, datetime) or value != value:  # NaT не равен сам себе
+            return None
+        return value.to_pydatetime() if hasattr(value, 'to_pydatetime') else value
+
     def _safe_int_convert(self, value):
-        if pd.isna(value) or value in ['', 'nan', 'NaN', 'нет', 'не было', 'отсутствует']:
-            return 0
-        if isinstance(value, (int, float)):
-            return int(value)
-        if isinstance(value, str):
-            text = value.lower().strip()
-            if any(x in text for x in ['все продано', 'всё ушло', 'все ушло', 'разобрали']):
-                nums = re.findall(r'\d+', value)
-                return int(nums[0]) if nums else 0
-            approx = re.search(r'(?:≈|~|примерно|около|порядка)\s*(\d+)', text)
-            if approx:
-                return int(approx.group(1))
-            rng = re.search(r'(\d+)\s*[-–—−]\s*(\d+)|(\d+)\s+до\s+(\d+)', text)
-            if rng:
-                nums = [int(x) for x in rng.groups() if x]
-                return int(sum(nums) / len(nums))
-            nums = re.findall(r'\d+', value)
-            if nums:
-                return int(nums[0])
-            if 'много' in text:
-                return 50
-            if 'более' in text or 'больше' in text:
-                n = re.search(r'\d+', text)
-                return int(n.group()) + 10 if n else 50
-        return 0
+        return parse_stock(value)
 
     def generate_summary_report(self, all_reports, expected_reports, actual_reports):
         if not all_reports:
             logger.info("Нет отчётов для сводки")
             return None
 
-        city_sales = {}
-        network_sales = {}
-        employee_sales = {}
-        cheese_sales = {cheese: 0 for cheese in self.config.CHEESE_TYPES}
-
+        totals = RunningTotals(self.config.CHEESE_TYPES)
         for report in all_reports:
-            city_sales[report['city']] = city_sales.get(report['city'], 0) + report['total_sales']
-            network_sales[report['network']] = network_sales.get(report['network'], 0) + report['total_sales']
-            employee_sales[report['employee']] = employee_sales.get(report['employee'], 0) + report['total_sales']
-            for cheese, data in report['cheese_data'].items():
-                cheese_sales[cheese] += data['sold']
-
-        best_city = max(city_sales.items(), key=lambda x: x[1]) if city_sales else ("—", 0)
-        best_network = max(network_sales.items(), key=lambda x: x[1]) if network_sales else ("—", 0)
-        best_employee = max(employee_sales.items(), key=lambda x: x[1]) if employee_sales else ("—", 0)
-        best_cheese = max(cheese_sales.items(), key=lambda x: x[1]) if cheese_sales else ("—", 0)
-
-        result = {
-            'best_city': best_city[0], 'best_city_sales': best_city[1],
-            'best_network': best_network[0], 'best_network_sales': best_network[1],
-            'best_employee': best_employee[0], 'best_employee_sales': best_employee[1],
-            'best_cheese': best_cheese[0], 'best_cheese_sales': best_cheese[1],
-            'total_stores': len(all_reports),
-            'expected_stores': expected_reports,
-            'missing_reports': expected_reports - actual_reports,
-            'total_sales': sum(r['total_sales'] for r in all_reports),
-            'average_efficiency': round(sum(r['efficiency'] for r in all_reports) / len(all_reports), 1)
-        }
+            totals.add_report(report)
+
+        result = totals.summary(expected_reports, actual_reports)
         logger.info(f"Сводный отчёт сформирован: {result['total_stores']} магазинов, {result['total_sales']} шт. продано")
-        return result
\ No newline at end of file
+        return result
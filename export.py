@@ -0,0 +1,212 @@
+# export.py — выгрузка сопоставленных отчётов в CSV/XLSX потоком, по одной дате за раз
+
+import csv
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("xlsx", "csv")
+
+# Фильтры команды /export: «город=Нижний Новгород сеть=Магнит». Значение — слова после «=»
+# до следующего фильтра, даты или формата; пробелы вокруг «=» допускаются
+_FILTER_RE = re.compile(r'^(город|сеть|city|network)[=:](.*)$', re.IGNORECASE)
+_FILTER_SPACES_RE = re.compile(r'(город|сеть|city|network)\s*([=:])\s*', re.IGNORECASE)
+_FILTER_KEYS = {"город": "city", "city": "city", "сеть": "network", "network": "network"}
+# Фильтр -> (колонка утреннего листа, как назвать в сообщении)
+_FILTER_COLUMNS = {"city": ("city", "город"), "network": ("network_name", "сеть")}
+_DATE_FORMATS = ('%d.%m.%Y', '%Y-%m-%d', '%d.%m.%y')
+
+
+def _normalize(value) -> str:
+    """Город или сеть для сравнения: регистр, ё/е и лишние пробелы не важны."""
+    return " ".join(str(value).split()).casefold().replace("ё", "е")
+
+
+class ExportRequest:
+    """Параметры выгрузки: диапазон дат (None — без границы), фильтры и формат файла."""
+
+    __slots__ = ('date_from', 'date_to', 'city', 'network', 'fmt')
+
+    def __init__(self, date_from=None, date_to=None, city=None, network=None, fmt="xlsx"):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.city = city
+        self.network = network
+        self.fmt = fmt
+
+    @classmethod
+    def parse(cls, text: str) -> "ExportRequest":
+        """
+        Аргументы /export: [с] [по] [csv|xlsx] [город=...] [сеть=...].
+        Одна дата — выгрузка за этот день, без дат — вся история. ValueError — непонятный аргумент.
+        """
+        request = cls()
+        dates = []
+        field = None  # фильтр, к значению которого добавляются слова
+        given = set()
+        for token in _FILTER_SPACES_RE.sub(r'\1\2', text).split():
+            match = _FILTER_RE.match(token)
+            if match:
+                field = _FILTER_KEYS[match.group(1).lower()]
+                given.add(field)
+                setattr(request, field, match.group(2) or None)
+            elif token.lower() in FORMATS:
+                request.fmt = token.lower()
+                field = None
+            else:
+                try:
+                    dates.append(_parse_date(token))
+                    field = None
+                except ValueError:
+                    if field is None:
+                        raise
+                    value = getattr(request, field)
+                    setattr(request, field, f"{value} {token}" if value else token)
+        if any(getattr(request, field) is None for field in given):
+            raise ValueError("у фильтра нет значения: город=Москва, сеть=Магнит")
+        if len(dates) > 2:
+            raise ValueError("нужно не больше двух дат: начало и конец")
+        if dates:
+            request.date_from = dates[0]
+            request.date_to = dates[-1]
+        if request.date_from and request.date_to and request.date_from > request.date_to:
+            request.date_from, request.date_to = request.date_to, request.date_from
+        return request
+
+    def check_filters(self, morning, columns: dict) -> None:
+        """
+        Сверяет город и сеть с утренним листом (SheetSnapshot) и приводит их к написанию
+        из листа; ValueError — такого значения в анкетах нет, выгрузка была бы пустой.
+        Сравнение — по _normalize: так же отчёты фильтрует iter_reports.
+        """
+        for field, (column, label) in _FILTER_COLUMNS.items():
+            value = getattr(self, field)
+            if not value or morning.empty:
+                continue
+            known = {_normalize(v): str(v) for v in morning.frame[columns[column]].dropna().unique()}
+            canonical = known.get(_normalize(value))
+            if canonical is None:
+                examples = ", ".join(sorted(known.values())[:5])
+                raise ValueError(f"{label} '{value}' не встречается в анкетах (есть: {examples})")
+            setattr(self, field, canonical)
+
+    def describe(self) -> str:
+        period = "вся история"
+        if self.date_from:
+            period = self.date_from.strftime('%d.%m.%Y')
+            if self.date_to != self.date_from:
+                period += f" — {self.date_to.strftime('%d.%m.%Y')}"
+        filters = [f"{label}: {value}" for label, value in (("город", self.city), ("сеть", self.network)) if value]
+        return ", ".join([period] + filters)
+
+
+def _parse_date(token: str) -> date:
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(token, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"не понял '{token}': даты в формате ДД.ММ.ГГГГ, формат — csv или xlsx")
+
+
+def iter_reports(processor, morning, evening, request: ExportRequest):
+    """
+    Отчёты DataProcessor за диапазон дат: снимки листов (SheetSnapshot) режутся по датам,
+    и каждая дата сопоставляется отдельно — в памяти только отчёты текущего дня.
+    Город и сеть сравниваются нормализованными: в утренней и вечерней анкете их пишут по-разному.
+    """
+    city = _normalize(request.city) if request.city else None
+    network = _normalize(request.network) if request.network else None
+    days = sorted(set(morning.dates()) & set(evening.dates()))
+    for day in days:
+        if request.date_from and day < request.date_from:
+            continue
+        if request.date_to and day > request.date_to:
+            break
+        reports = processor.process_daily_reports(morning.on_date(day), evening.on_date(day), track_processed=False)
+        for report in reports:
+            if city and _normalize(report.city) != city:
+                continue
+            if network and _normalize(report.network) != network:
+                continue
+            yield report
+
+
+def header(cheese_types) -> list[str]:
+    columns = ["Дата", "Город", "Сеть", "Сотрудник", "Адрес", "Посетителей", "Продано, шт.", "Эффективность, %"]
+    for cheese in cheese_types:
+        columns += [f"{cheese}: начало", f"{cheese}: конец", f"{cheese}: продано"]
+    return columns
+
+
+def report_row(report) -> list:
+    row = [
+        report.date, report.city, report.network, report.employee, report.normalized_address,
+        report.visitors, report.total_sales, report.efficiency,
+    ]
+    n = len(report.cheese_types)
+    stock = report.stock
+    for i in range(n):
+        row += [stock[i], stock[n + i], stock[2 * n + i]]
+    return row
+
+
+def write_csv(path: str, reports, cheese_types) -> int:
+    # utf-8-sig — чтобы Excel сразу открыл кириллицу; ';' — разделитель русской локали
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(header(cheese_types))
+        count = 0
+        for report in reports:
+            writer.writerow(report_row(report))
+            count += 1
+    return count
+
+
+def write_xlsx(path: str, reports, cheese_types) -> int:
+    # write_only: строки сразу уходят во временный XML на диске, книга целиком в памяти не строится
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Отчёты")
+    sheet.append(header(cheese_types))
+    count = 0
+    for report in reports:
+        sheet.append(report_row(report))
+        count += 1
+    workbook.save(path)
+    return count
+
+
+def export_reports(processor, morning, evening, request: ExportRequest) -> tuple[str, int]:
+    """
+    Пишет отчёты во временный файл и возвращает (путь, число отчётов); файл удаляет вызывающий.
+    Без openpyxl XLSX заменяется на CSV.
+    """
+    fmt = request.fmt
+    if fmt == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            logger.warning("openpyxl не установлен — выгрузка в CSV")
+            fmt = request.fmt = "csv"
+
+    started = time.perf_counter()
+    fd, path = tempfile.mkstemp(prefix="degustation_export_", suffix=f".{fmt}")
+    os.close(fd)
+    writer = write_xlsx if fmt == "xlsx" else write_csv
+    try:
+        count = writer(path, iter_reports(processor, morning, evening, request), processor.cheese_types)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(
+        f"Выгрузка {fmt} ({request.describe()}): {count} отчётов, "
+        f"{os.path.getsize(path) / 1024:.0f} КБ за {time.perf_counter() - started:.1f} с"
+    )
+    return path, count
@@ -0,0 +1,308 @@
+# fake_backends.py — локальные заглушки Google Sheets и Telegram Bot API для нагрузочных тестов
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from telegram import Bot
+from telegram.request import BaseRequest
+
+from config import Config
+from sheet_snapshot import FORM_DATE_FORMAT, FORM_TIMESTAMP_FORMAT
+from sheets_backend import SheetsBackend, SheetsRateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+class FakeSheetsBackend(SheetsBackend):
+    """
+    Генератор утренних/вечерних анкет в памяти процесса.
+
+    Каждая «дегустация» i — это утренняя строка и (с вероятностью evening_completion)
+    вечерняя строка того же промоутера по тому же адресу. Строки детерминированы по seed,
+    поэтому повторные чтения возвращают одно и то же. Лист растёт со скоростью
+    rows_per_minute, каждое чтение можно задержать на latency (+ jitter) секунд
+    и с вероятностью rate_limit_probability ответить 429.
+
+    Ключ отчёта — дата, промоутер и адрес, поэтому повторов (магазин, промоутер, день) нет:
+    история обходит не меньше магазинов, чем строк в дне, а каждая строка роста листа
+    получает свой, ещё не встречавшийся магазин.
+    """
+
+    name = "fake"
+
+    CITIES = {
+        "Москва": ["Магнит", "Пятёрочка", "Перекрёсток"],
+        "Казань": ["Магнит", "Бахетле"],
+        "Новосибирск": ["Мария-Ра", "Ярче"],
+        "Екатеринбург": ["Монетка", "Пятёрочка"],
+    }
+    STREETS = ["Ленина", "Гагарина", "Мира", "Советская", "Кирова", "Пушкина", "Победы", "Садовая"]
+    SURNAMES = ["Иванова", "Петрова", "Смирнова", "Кузнецова", "Попова", "Соколова", "Лебедева", "Козлова"]
+    NAMES = ["Анна", "Мария", "Елена", "Ольга", "Наталья", "Ирина", "Татьяна", "Светлана"]
+    STOCK_TEXTS = ["около {n}", "примерно {n}", "{n}-{m}", "нет"]
+
+    def __init__(
+        self,
+        config: Config | None = None,
+        initial_rows: int = 500,
+        rows_per_minute: float = 0.0,
+        history_days: int = 30,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        rate_limit_probability: float = 0.0,
+        evening_completion: float = 0.9,
+        evening_delay: float = 0.0,
+        stores: int = 60,
+        seed: int = 42,
+    ):
+        self.config = config or Config()
+        self.morning_sheet_id = self.config.MORNING_SHEET_ID
+        self.evening_sheet_id = self.config.EVENING_SHEET_ID
+        self.initial_rows = initial_rows
+        self.rows_per_minute = rows_per_minute
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.evening_completion = evening_completion
+        self.evening_delay = timedelta(seconds=evening_delay)
+        self.seed = seed
+
+        self._started_at = datetime.now()
+        self._history_start = self._started_at - timedelta(days=history_days)
+        self._history_step = (self._started_at - self._history_start) / max(initial_rows, 1)
+        self._random = random.Random(seed)
+        self._fault_random = random.Random(seed + 1)
+        self._lock = threading.Lock()
+        self._tastings = []  # (morning_time, morning_row, evening_time | None, evening_row | None)
+        # История по кругу обходит history_stores магазинов; строки роста — магазины после них
+        self.history_stores = max(stores, -(-initial_rows // max(history_days, 1)) + 1)
+        self.stats = {"requests": 0, "rate_limited": 0, "rows_served": 0}
+
+    @classmethod
+    def from_env(cls, config: Config | None = None, **overrides) -> "FakeSheetsBackend":
+        """Параметры генератора из переменных окружения FAKE_SHEETS_*; overrides имеют приоритет."""
+        params = dict(
+            initial_rows=int(os.getenv("FAKE_SHEETS_ROWS", "500")),
+            rows_per_minute=float(os.getenv("FAKE_SHEETS_ROWS_PER_MINUTE", "0")),
+            history_days=int(os.getenv("FAKE_SHEETS_HISTORY_DAYS", "30")),
+            latency=float(os.getenv("FAKE_SHEETS_LATENCY", "0")),
+            latency_jitter=float(os.getenv("FAKE_SHEETS_LATENCY_JITTER", "0")),
+            rate_limit_probability=float(os.getenv("FAKE_SHEETS_429_RATE", "0")),
+            evening_delay=float(os.getenv("FAKE_SHEETS_EVENING_DELAY", "0")),
+            seed=int(os.getenv("FAKE_SHEETS_SEED", "42")),
+        )
+        params.update(overrides)
+        return cls(config=config, **params)
+
+    # ===================== ГЕНЕРАЦИЯ =====================
+    def _store(self, i: int) -> tuple[str, str, str, str]:
+        """Магазин номер i: (город, сеть, адрес, промоутер). Пара (улица, дом) у каждого i своя."""
+        rnd = random.Random(self.seed * 1_000_003 + i)
+        cities = list(self.CITIES)
+        city = cities[i % len(cities)]
+        network = rnd.choice(self.CITIES[city])
+        address = f"г. {city}, ул. {self.STREETS[i % len(self.STREETS)]}, д. {i // len(self.STREETS) + 1}"
+        employee = f"{rnd.choice(self.SURNAMES)} {rnd.choice(self.NAMES)}"
+        return city, network, address, employee
+
+    def _stock_value(self, n: int):
+        """Остаток так, как его вводят промоутеры: чаще числом, иногда текстом."""
+        roll = self._random.random()
+        if roll < 0.85:
+            return n
+        if roll < 0.95:
+            return str(n)
+        template = self._random.choice(self.STOCK_TEXTS)
+        return template.format(n=n, m=n + 2)
+
+    def _generate_tasting(self, index: int, morning_time: datetime):
+        rnd = self._random
+        if index < self.initial_rows:
+            city, network, address, employee = self._store(index % self.history_stores)
+        else:
+            city, network, address, employee = self._store(self.history_stores + index - self.initial_rows)
+        date_str = morning_time.strftime(FORM_DATE_FORMAT)
+        morning = self.config.MORNING_COLUMNS
+        evening = self.config.EVENING_COLUMNS
+
+        starts = {cheese: rnd.randint(10, 60) for cheese in self.config.CHEESE_TYPES}
+        morning_row = {
+            morning["timestamp"]: morning_time.strftime(FORM_TIMESTAMP_FORMAT),
+            morning["employee_name"]: employee,
+            morning["city"]: city,
+            morning["network_name"]: network,
+            morning["date"]: date_str,
+            morning["address"]: address,
+        }
+        for cheese, qty in starts.items():
+            morning_row[morning["cheese_start"][cheese]] = self._stock_value(qty)
+
+        if rnd.random() >= self.evening_completion:
+            return morning_time, morning_row, None, None
+
+        evening_time = morning_time + self.evening_delay
+        evening_row = {
+            evening["timestamp"]: evening_time.strftime(FORM_TIMESTAMP_FORMAT),
+            evening["employee_name"]: employee,
+            evening["date"]: date_str,
+            evening["city"]: city,
+            evening["network_name"]: network,
+            evening["address"]: address,
+            evening["visitors"]: rnd.randint(10, 120),
+        }
+        for cheese, qty in starts.items():
+            evening_row[evening["cheese_end"][cheese]] = self._stock_value(max(0, qty - rnd.randint(0, 15)))
+        return morning_time, morning_row, evening_time, evening_row
+
+    def _visible_count(self, now: datetime) -> int:
+        elapsed_minutes = (now - self._started_at).total_seconds() / 60
+        return self.initial_rows + int(self.rows_per_minute * max(0.0, elapsed_minutes))
+
+    def _ensure_generated(self, count: int) -> None:
+        while len(self._tastings) < count:
+            index = len(self._tastings)
+            if index < self.initial_rows:
+                morning_time = self._history_start + self._history_step * index
+            else:
+                minutes = (index - self.initial_rows + 1) / self.rows_per_minute
+                morning_time = self._started_at + timedelta(minutes=minutes)
+            self._tastings.append(self._generate_tasting(index, morning_time))
+
+    # ===================== SheetsBackend =====================
+    def get_records(self, sheet_id: str, sheet_name: str) -> list[dict]:
+        delay = self.latency + (random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rate_limit_probability and self._fault_random.random() < self.rate_limit_probability:
+                self.stats["rate_limited"] += 1
+                raise SheetsRateLimitError("Fake 429: Quota exceeded for quota metric 'Read requests'")
+
+            now = datetime.now()
+            self._ensure_generated(self._visible_count(now))
+
+            if sheet_id == self.morning_sheet_id:
+                rows = [m_row for m_time, m_row, _, _ in self._tastings if m_time <= now]
+            elif sheet_id == self.evening_sheet_id:
+                rows = [e_row for _, _, e_time, e_row in self._tastings if e_row and e_time <= now]
+            else:
+                raise ValueError(
+                    f"Ошибка 404: таблица с ключом {sheet_id} не найдена или отсутствуют права доступа."
+                )
+            self.stats["rows_served"] += len(rows)
+            return rows
+
+
+class FakeProjectsBackend(SheetsBackend):
+    """Несколько FakeSheetsBackend (по одному на проект) за одним источником: запрос уходит по sheet_id."""
+
+    name = "fake"
+
+    def __init__(self, backends: list[FakeSheetsBackend]):
+        self.backends = backends
+        self._by_sheet = {}
+        for backend in backends:
+            self._by_sheet[backend.morning_sheet_id] = backend
+            self._by_sheet[backend.evening_sheet_id] = backend
+
+    @classmethod
+    def from_env(cls, projects) -> "FakeProjectsBackend":
+        """Генератор на каждый проект с параметрами FAKE_SHEETS_*; seed сдвигается, чтобы данные различались."""
+        seed = int(os.getenv("FAKE_SHEETS_SEED", "42"))
+        return cls([
+            FakeSheetsBackend.from_env(project, seed=seed + offset * 1000)
+            for offset, project in enumerate(projects)
+        ])
+
+    @property
+    def stats(self) -> dict:
+        total = {"requests": 0, "rate_limited": 0, "rows_served": 0}
+        for backend in self.backends:
+            for key in total:
+                total[key] += backend.stats[key]
+        return total
+
+    def get_records(self, sheet_id: str, sheet_name: str) -> list[dict]:
+        backend = self._by_sheet.get(sheet_id)
+        if backend is None:
+            raise ValueError(
+                f"Ошибка 404: таблица с ключом {sheet_id} не найдена или отсутствуют права доступа."
+            )
+        return backend.get_records(sheet_id, sheet_name)
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    Приёмник запросов к Telegram Bot API: ничего не отправляет в сеть, отвечает
+    правдоподобными JSON-ответами и запоминает каждый вызов в self.calls.
+    Подключается как request= для telegram.Bot или ApplicationBuilder.request().
+    """
+
+    MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendDocument"}
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 42):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = []  # (метод, параметры, время ответа)
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self) -> None:
+        return
+
+    async def shutdown(self) -> None:
+        return
+
+    def count(self, api_method: str) -> int:
+        return sum(1 for method, _, _ in self.calls if method == api_method)
+
+    def _message(self, params: dict) -> dict:
+        try:
+            chat_id = int(params.get("chat_id", 0))
+        except (TypeError, ValueError):
+            chat_id = 0
+        return {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.calls.append((api_method, params, time.perf_counter()))
+            body = {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}}
+            return 429, json.dumps(body).encode()
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_md_bot"}
+        elif api_method in self.MESSAGE_METHODS:
+            result = self._message(params)
+        else:
+            result = True
+
+        self.calls.append((api_method, params, time.perf_counter()))
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def create_fake_bot(request: FakeTelegramRequest | None = None, token: str = "123456:FAKE") -> Bot:
+    """Bot, все вызовы которого уходят в FakeTelegramRequest."""
+    request = request or FakeTelegramRequest()
+    return Bot(token, request=request, get_updates_request=request)
@@ -1,70 +1,61 @@
-import gspread
-import pandas as pd
-from google.oauth2.service_account import Credentials
-from google.auth.transport.requests import Request
-from datetime import datetime, timedelta
+import time
+import threading
 import logging
-from gspread.exceptions import WorksheetNotFound
+from typing import TYPE_CHECKING
 from config import Config
+from sheets_backend import SheetsBackend, SheetsRateLimitError, create_backend
+from shared_state import SharedState, get_shared_state
 
-logger = logging.getLogger(__name__)
+if TYPE_CHECKING:
+    import pandas as pd
+    from sheet_snapshot import SheetSnapshot
 
+logger = logging.getLogger(__name__)
 
-class GoogleSheetsService:
-    def __init__(self):
-        self.scope = [
-            'https://spreadsheets.google.com/feeds',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        self._client_cache = None
-        self._client_timestamp = None
-        self.CLIENT_CACHE_TTL = 300  # 5 минут (меньше срока жизни access_token ~1h)
-        self.config = Config()
 
-    def _get_fresh_client(self) -> gspread.Client:
-        """Создаёт новый клиент, используя credentials из Config (локально и на Render)."""
-        try:
-            creds_dict = self.config.GOOGLE_CREDENTIALS
+def _frame_digest(df: "pd.DataFrame") -> bytes:
+    """Хэш содержимого листа (колонки и все значения строк) — понять, изменился ли лист с прошлого чтения."""
+    import hashlib
 
-            required_keys = ["type", "project_id", "private_key", "client_email", "client_id"]
-            missing = [k for k in required_keys if k not in creds_dict]
-            if missing:
-                raise ValueError(f"Missing required keys in credentials JSON: {missing}")
+    import pandas as pd
 
-            pk_preview = creds_dict.get("private_key", "")[:40].replace("\n", "\\n")
-            logger.info(f"Credentials loaded from Config. private_key preview: {pk_preview}...")
+    digest = hashlib.blake2b(repr(list(df.columns)).encode(), digest_size=16)
+    if not df.empty:
+        try:
+            hashes = pd.util.hash_pandas_object(df, index=False)
+        except TypeError:  # в ячейках списки или словари — хэшируем текст
+            hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+        digest.update(hashes.to_numpy().tobytes())
+    return digest.hexdigest().encode()
 
-            creds = Credentials.from_service_account_info(creds_dict, scopes=self.scope)
 
+class GoogleSheetsService:
+    def __init__(self, backend: SheetsBackend | None = None, state: SharedState | None = None):
+        self.config = Config()
+        self.backend = backend or create_backend(self.config.SHEETS_BACKEND, self.config)
+        self.state = state or get_shared_state()  # снимки общие для воркеров (shared_state.py)
+        self.RATE_LIMIT_RETRIES = 3
+        self.RATE_LIMIT_BACKOFF = 2.0  # секунды, удваивается на каждой попытке
+        self._snapshots = {}  # (sheet_id, sheet_name) -> SheetSnapshot
+        self._revisions = {}  # (sheet_id, sheet_name) -> ревизия снимка в общем хранилище
+        self._snapshot_lock = threading.Lock()
+
+    def _fetch_records(self, sheet_id: str, sheet_name: str) -> list[dict]:
+        """Читает строки через backend, повторяя запрос при 429 с экспоненциальной паузой."""
+        delay = self.RATE_LIMIT_BACKOFF
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
             try:
-                creds.refresh(Request())
-                logger.info("Access token refreshed successfully")
-            except Exception as refresh_err:
-                logger.error(f"Token refresh failed with exception: {refresh_err}", exc_info=True)
-
-            client = gspread.authorize(creds)
-            logger.info("New Google Sheets client created successfully")
-            return client
-
-        except Exception as e:
-            logger.error(f"❌ Auth failed during client creation: {e}", exc_info=True)
-            raise
-
-    def _get_client(self) -> gspread.Client:
-        """Возвращает кэшированный клиент или создаёт новый при истечении TTL."""
-        now = datetime.now()
-        cache_expired = (
-            self._client_cache is None or
-            self._client_timestamp is None or
-            (now - self._client_timestamp).total_seconds() > self.CLIENT_CACHE_TTL
-        )
-
-        if cache_expired:
-            logger.info("Creating new Google Sheets client (cache expired or first call)")
-            self._client_cache = self._get_fresh_client()
-            self._client_timestamp = now
-
-        return self._client_cache
+                return self.backend.get_records(sheet_id, sheet_name)
+            except SheetsRateLimitError as e:
+                if attempt == self.RATE_LIMIT_RETRIES:
+                    raise
+                wait = e.retry_after or delay
+                logger.warning(
+                    f"429 от источника данных ({self.backend.name}), попытка {attempt + 1}/"
+                    f"{self.RATE_LIMIT_RETRIES}, ждём {wait:.1f} с"
+                )
+                time.sleep(wait)
+                delay *= 2
 
     def _resolve_sheet_name(self, sheet_id: str, sheet_name: str | None) -> str:
         """Определяет имя листа, если оно не передано явно."""
@@ -82,8 +73,143 @@ class GoogleSheetsService:
         )
         return "Form Responses 1"
 
-    def get_sheet_data(self, sheet_id: str, sheet_name: str | None = None) -> pd.DataFrame:
-        """Получает данные из Google Sheets в виде pandas DataFrame."""
+    def _columns_for(self, sheet_id: str) -> dict:
+        if sheet_id == self.config.EVENING_SHEET_ID:
+            return self.config.EVENING_COLUMNS
+        return self.config.MORNING_COLUMNS
+
+    def get_snapshot(
+        self,
+        sheet_id: str,
+        sheet_name: str | None = None,
+        columns: dict | None = None,
+        max_age: float = 0.0,
+    ) -> "SheetSnapshot":
+        """
+        Типизированный снимок листа (см. sheet_snapshot.py). Снимок моложе max_age секунд
+        отдаётся из памяти, а если в памяти его нет или другой воркер обновил лист —
+        из общего хранилища: экраны бота за одно нажатие читают лист по нескольку раз,
+        и воркеры не читают один и тот же лист каждый сам.
+        columns — карта колонок листа; по умолчанию MORNING_/EVENING_COLUMNS по sheet_id.
+        """
+        from sheet_snapshot import SheetSnapshot
+
+        sheet_name = self._resolve_sheet_name(sheet_id, sheet_name)
+        key = (sheet_id, sheet_name)
+        columns = columns or self._columns_for(sheet_id)
+        if max_age > 0:
+            snapshot = self._cached_snapshot(key, columns, max_age)
+            if snapshot is not None:
+                return snapshot
+            # Лист читает один воркер, остальные ждут и берут его снимок из хранилища
+            with self.state.lock(f"sheet:{sheet_id}:{sheet_name}"):
+                snapshot = self._cached_snapshot(key, columns, max_age)
+                if snapshot is not None:
+                    return snapshot
+                return self._fetch_snapshot(key, columns)
+        return self._fetch_snapshot(key, columns)
+
+    def _fetch_snapshot(self, key, columns) -> "SheetSnapshot":
+        """
+        Читает лист. Если содержимое не изменилось с последнего общего снимка (тот же хэш строк),
+        снимок не разбирается и не записывается заново — в хранилище обновляется только время чтения.
+        """
+        from sheet_snapshot import SheetSnapshot
+
+        raw = self.get_sheet_data(*key)
+        digest = _frame_digest(raw)
+        shared_key = f"sheet:{key[0]}:{key[1]}"
+        if self.state.get(f"{shared_key}:digest") == digest:
+            snapshot = self._cached_snapshot(key, columns, float("inf"))
+            if snapshot is not None:
+                snapshot.fetched_at = time.monotonic()
+                self.state.set(f"{shared_key}:fetched", repr(time.time()).encode())
+                return snapshot
+        snapshot = SheetSnapshot.from_frame(raw, columns)
+        self._share_snapshot(key, snapshot, digest)
+        return snapshot
+
+    def _cached_snapshot(self, key, columns, max_age: float) -> "SheetSnapshot | None":
+        """Снимок моложе max_age: свой, если его ревизия совпадает с общей, иначе из хранилища."""
+        from sheet_snapshot import SheetSnapshot
+
+        shared_key = f"sheet:{key[0]}:{key[1]}"
+        revision = self.state.get_int(f"{shared_key}:rev")
+        with self._snapshot_lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and self._revisions.get(key) != revision:
+                snapshot = None
+        if snapshot is None and revision:
+            shared = self.state.get_obj(shared_key)
+            if shared is not None:
+                shared_revision, frame = shared
+                snapshot = SheetSnapshot(frame, columns)
+                with self._snapshot_lock:
+                    self._snapshots[key] = snapshot
+                    self._revisions[key] = shared_revision
+        if snapshot is None:
+            return None
+        # Возраст — по последнему чтению листа любым воркером, даже если снимок не менялся
+        fetched = self.state.get(f"{shared_key}:fetched")
+        age = time.time() - float(fetched) if fetched is not None else time.monotonic() - snapshot.fetched_at
+        return snapshot if age < max_age else None
+
+    def _share_snapshot(self, key, snapshot, digest: bytes | None = None) -> None:
+        """
+        Кладёт снимок в общее хранилище с новой ревизией и запоминает его у себя.
+        digest — хэш прочитанных строк листа; у снимка, дополненного через /ingest, его нет.
+        """
+        shared_key = f"sheet:{key[0]}:{key[1]}"
+        revision = self.state.incr(f"{shared_key}:rev")
+        self.state.set_obj(shared_key, (revision, snapshot.frame))
+        if digest is not None:
+            self.state.set(f"{shared_key}:digest", digest)
+        else:
+            self.state.delete(f"{shared_key}:digest")
+        age = time.monotonic() - snapshot.fetched_at
+        self.state.set(f"{shared_key}:fetched", repr(time.time() - age).encode())
+        with self._snapshot_lock:
+            self._snapshots[key] = snapshot
+            self._revisions[key] = revision
+
+    def append_rows(
+        self,
+        sheet_id: str,
+        rows: list[dict],
+        sheet_name: str | None = None,
+        columns: dict | None = None,
+    ) -> "pd.DataFrame":
+        """
+        Добавляет строки анкет (push из /ingest) в снимок листа в памяти и возвращает
+        добавленные разобранные строки; уже известные строки не дублируются. Лист читается,
+        только если снимка ещё нет, — и тогда присланная строка обычно уже в нём.
+        columns — карта колонок листа (у каждого проекта своя); по умолчанию — по sheet_id.
+        """
+        import pandas as pd
+
+        sheet_name = self._resolve_sheet_name(sheet_id, sheet_name)
+        key = (sheet_id, sheet_name)
+        columns = columns or self._columns_for(sheet_id)
+        # Под общей блокировкой листа: строки от разных воркеров добавляются к одному снимку
+        with self.state.lock(f"sheet:{sheet_id}:{sheet_name}"):
+            snapshot = self._cached_snapshot(key, columns, float("inf"))
+            if snapshot is None:
+                snapshot = self._fetch_snapshot(key, columns)
+            snapshot, added = snapshot.append(pd.DataFrame(rows))
+            if not added.empty:
+                self._share_snapshot(key, snapshot)
+        return added
+
+    def get_sheet_data(self, sheet_id: str, sheet_name: str | None = None, typed: bool = False):
+        """
+        Получает данные из Google Sheets в виде pandas DataFrame.
+        typed=True — вместо сырого DataFrame возвращает разобранный SheetSnapshot.
+        """
+        import pandas as pd
+
+        if typed:
+            return self.get_snapshot(sheet_id, sheet_name)
+
         if not sheet_id or not isinstance(sheet_id, str) or sheet_id.strip() == "":
             error_msg = "Ошибка: sheet_id пуст или некорректен."
             logger.error(error_msg)
@@ -92,28 +218,7 @@ class GoogleSheetsService:
         sheet_name = self._resolve_sheet_name(sheet_id, sheet_name)
         logger.info(f"Запрос данных с листа '{sheet_name}' в таблице с ключом: {sheet_id}")
         try:
-            client = self._get_client()
-            try:
-                sheet = client.open_by_key(sheet_id).worksheet(sheet_name)
-            except WorksheetNotFound:
-                available_sheets = [ws.title for ws in client.open_by_key(sheet_id).worksheets()]
-                error_msg = (
-                    f"Лист '{sheet_name}' не найден в таблице с ключом {sheet_id}. "
-                    f"Доступные листы: {available_sheets}"
-                )
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-            except gspread.exceptions.APIError as api_error:
-                if api_error.response.status_code == 404:
-                    logger.error(
-                        f"Ошибка 404: таблица с ключом {sheet_id} не найдена или отсутствуют права доступа."
-                    )
-                    raise ValueError(
-                        f"Ошибка 404: таблица с ключом {sheet_id} не найдена или отсутствуют права доступа."
-                    )
-                else:
-                    raise
-            records = sheet.get_all_records()
+            records = self._fetch_records(sheet_id, sheet_name)
             df = pd.DataFrame(records)
             logger.info(
                 f"Загружено {len(df)} строк с листа '{sheet_name}' (ключ: {sheet_id}). "
@@ -125,57 +230,3 @@ class GoogleSheetsService:
                 logger.critical("Постоянная ошибка аутентификации — проверьте GOOGLE_CREDENTIALS_JSON/Config!")
             logger.error(f"Ошибка при получении данных листа: {e}", exc_info=True)
             raise
-
-    def get_new_records(
-        self,
-        sheet_id: str,
-        last_check_time: datetime,
-        sheet_name: str | None = None
-    ) -> pd.DataFrame:
-        """Возвращает только новые записи, добавленные после last_check_time."""
-        df = self.get_sheet_data(sheet_id, sheet_name)
-        if df.empty:
-            logger.info("Лист пустой — новых записей нет")
-            return df
-
-        # Поддерживаем разные варианты названий колонки времени
-        possible_timestamp_cols = [
-            "timestamp",
-            "Timestamp",
-            self.config.MORNING_COLUMNS.get("timestamp"),
-            self.config.EVENING_COLUMNS.get("timestamp"),
-        ]
-        possible_timestamp_cols = [c for c in possible_timestamp_cols if c]
-
-        timestamp_col = next((c for c in possible_timestamp_cols if c in df.columns), None)
-
-        if not timestamp_col:
-            logger.warning(
-                f"⚠️ Колонка времени не найдена ни под одним из имён {possible_timestamp_cols} — возвращаем все записи"
-            )
-            return df
-
-            logger.info(f"Используем колонку времени '{timestamp_col}' для фильтрации новых записей")
-
-        # Преобразуем в datetime (гибко: поддерживаем разные форматы)
-        try:
-            df[timestamp_col] = pd.to_datetime(df[timestamp_col], errors='coerce')
-            # Если много NaT — пробуем формат dd.mm.yyyy HH:MM
-            if df[timestamp_col].isna().sum() > len(df) * 0.5:
-                df[timestamp_col] = pd.to_datetime(
-                    df[timestamp_col],
-                    format='%d.%m.%Y %H:%M',
-                    errors='coerce'
-                )
-        except Exception as parse_err:
-            logger.error(f"⚠️ Failed to parse '{timestamp_col}' column: {parse_err}")
-            return df
-
-        before = len(df)
-        mask = df[timestamp_col] > last_check_time
-        new_df = df[mask].copy()
-        logger.info(
-            f"Найдено {len(new_df)} новых записей (из {before}) после {last_check_time} "
-            f"по колонке '{timestamp_col}'"
-        )
-        return new_df
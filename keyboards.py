@@ -0,0 +1,147 @@
+# keyboards.py — постраничные инлайн-клавиатуры с короткими ID в callback_data
+
+import itertools
+import threading
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from shared_state import SharedState, get_shared_state
+
+# Telegram ограничивает callback_data 64 байтами — длинные адреса туда не помещаются,
+# поэтому в кнопках только короткие ID
+PAGE_SIZE = 8
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _base36(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if n == 0:
+            return out
+
+
+class CallbackIndex:
+    """
+    Серверный индекс «значение ↔ короткий ID» для кнопок меню.
+    В callback_data уходит только ID ("city_1a"), а само значение достаётся из памяти.
+    Пока значение в индексе, оно получает один и тот же ID. Индекс ограничен maxsize
+    записями: давно не показанные и не нажатые значения вытесняются (LRU), кнопка
+    с вытесненным ID отвечает «меню устарело», а при следующем показе значение получит новый ID.
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._ids = {}  # значение -> ID
+        self._values = OrderedDict()  # ID -> значение, от давно использованных к недавним
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def id_for(self, value: str) -> str:
+        with self._lock:
+            short_id = self._ids.get(value)
+            if short_id is None:
+                short_id = _base36(next(self._counter))
+                self._ids[value] = short_id
+                self._values[short_id] = value
+                if len(self._values) > self.maxsize:
+                    _, evicted = self._values.popitem(last=False)
+                    del self._ids[evicted]
+            else:
+                self._values.move_to_end(short_id)
+            return short_id
+
+    def resolve(self, short_id: str) -> str | None:
+        """Значение по ID или None, если ID неизвестен (меню от прошлого запуска или вытесненное значение)."""
+        with self._lock:
+            value = self._values.get(short_id)
+            if value is not None:
+                self._values.move_to_end(short_id)
+            return value
+
+
+class SharedCallbackIndex:
+    """
+    Индекс кнопок в общем хранилище (shared_state.py): ID, выданный одним воркером webhook,
+    находит любой другой. ID берутся из общего счётчика; запись «значение → ID» живёт ttl
+    секунд с выдачи, «ID → значение» — вдвое дольше, так что показанная кнопка работает
+    не меньше ttl. Истёкшие записи удаляет само хранилище, индекс не растёт.
+    """
+
+    def __init__(self, state: SharedState, ttl: float = 7 * 86400.0):
+        self.state = state
+        self.ttl = ttl
+
+    def id_for(self, value: str) -> str:
+        value_key = f"cb:value:{value}"
+        short_id = self.state.get(value_key)
+        if short_id is not None:
+            return short_id.decode()
+        short_id = _base36(self.state.incr("cb:seq"))
+        self.state.set(f"cb:id:{short_id}", str(value).encode(), ttl=2 * self.ttl)
+        if not self.state.add(value_key, short_id.encode(), ttl=self.ttl):
+            existing = self.state.get(value_key)  # другой воркер выдал ID раньше
+            if existing is not None:
+                return existing.decode()
+        return short_id
+
+    def resolve(self, short_id: str) -> str | None:
+        value = self.state.get(f"cb:id:{short_id}")
+        return None if value is None else value.decode()
+
+
+callback_index = CallbackIndex()
+_shared_index = None
+
+
+def get_callback_index() -> CallbackIndex | SharedCallbackIndex:
+    """
+    Индекс кнопок процесса: общий, если хранилище общее для воркеров (SQLite, Redis),
+    иначе LRU в памяти — при SHARED_STATE=memory процесс один.
+    """
+    global _shared_index
+    state = get_shared_state()
+    if state.name == "memory":
+        return callback_index
+    if _shared_index is None:
+        _shared_index = SharedCallbackIndex(state)
+    return _shared_index
+
+
+def _label(item: str, width: int | None) -> str:
+    if width and len(item) > width:
+        return item[:width] + "..."
+    return item
+
+
+def build_page(items: list, kind: str, page: int, label_width: int | None = None,
+               page_size: int = PAGE_SIZE) -> InlineKeyboardMarkup:
+    """
+    Клавиатура одной страницы: кнопки "{kind}_{ID}" для элементов страницы и навигация
+    "page_{kind}_{N}". Кнопки строятся только для показываемой страницы.
+    """
+    index = get_callback_index()
+    total_pages = max(1, -(-len(items) // page_size))
+    page = min(max(page, 0), total_pages - 1)
+
+    rows = [
+        [InlineKeyboardButton(_label(item, label_width), callback_data=f"{kind}_{index.id_for(item)}")]
+        for item in items[page * page_size:(page + 1) * page_size]
+    ]
+
+    if total_pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("« Назад", callback_data=f"page_{kind}_{page - 1}"))
+        nav.append(InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data="noop"))
+        if page < total_pages - 1:
+            nav.append(InlineKeyboardButton("Вперёд »", callback_data=f"page_{kind}_{page + 1}"))
+        rows.append(nav)
+
+    return InlineKeyboardMarkup(rows)
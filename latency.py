@@ -0,0 +1,98 @@
+# latency.py — задержка отчёта от отправки вечерней анкеты до сообщения в Telegram
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Этапы пути отчёта (секунды):
+#   poll_lag   — от Timestamp вечерней анкеты до опроса, который её увидел;
+#   queue_wait — от опроса до начала отправки (сопоставление и очередь сообщений);
+#   delivery   — от Timestamp анкеты до ответа Telegram, то есть всё время целиком.
+STAGES = ("poll_lag", "queue_wait", "delivery")
+PERCENTILES = (50, 95, 99)
+
+
+def _percentile(values: list[float], p: int) -> float:
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    rank = max(0, -(-p * len(values) // 100) - 1)  # ceil(p*n/100) - 1
+    return values[min(rank, len(values) - 1)]
+
+
+class LatencyTracker:
+    """
+    Скользящее окно замеров по этапам. Старые замеры вытесняются по времени
+    (window секунд) и по количеству (maxlen на этап); перцентили считаются
+    по запросу сортировкой окна — замеров в окне сотни, а не миллионы.
+    """
+
+    def __init__(self, window: float = 3600.0, target: float = 900.0, maxlen: int = 10000):
+        self.window = window
+        self.target = target
+        self._samples = {stage: deque(maxlen=maxlen) for stage in STAGES}  # (monotonic, секунды)
+        self._lock = threading.Lock()
+        self.over_target = 0  # отчётов с delivery выше цели с запуска
+
+    def record(self, stage: str, seconds: float, label: str = "") -> None:
+        seconds = max(0.0, seconds)  # часы сервера и формы могут слегка расходиться
+        with self._lock:
+            self._samples[stage].append((time.monotonic(), seconds))
+            if stage == "delivery" and self.target and seconds > self.target:
+                self.over_target += 1
+                exceeded = True
+            else:
+                exceeded = False
+        if exceeded:
+            logger.warning(
+                f"Отчёт {label} доставлен через {seconds / 60:.1f} мин после анкеты "
+                f"(цель {self.target / 60:.0f} мин)"
+            )
+
+    def record_since(self, stage: str, started: datetime | None, label: str = "") -> None:
+        """Замер от момента started (Timestamp анкеты) до текущего времени; без started — пропуск."""
+        if started is not None:
+            self.record(stage, (datetime.now() - started).total_seconds(), label)
+
+    def _window(self, stage: str) -> list[float]:
+        cutoff = time.monotonic() - self.window
+        samples = self._samples[stage]
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return sorted(seconds for _, seconds in samples)
+
+    def percentiles(self, stage: str) -> dict:
+        """{'count', 'p50', 'p95', 'p99', 'max'} за окно; пустое окно — только count=0."""
+        with self._lock:
+            values = self._window(stage)
+        if not values:
+            return {'count': 0}
+        result = {'count': len(values)}
+        for p in PERCENTILES:
+            result[f'p{p}'] = round(_percentile(values, p), 1)
+        result['max'] = round(values[-1], 1)
+        return result
+
+    def snapshot(self) -> dict:
+        """Все этапы разом — для /metrics и логов."""
+        return {
+            'window_seconds': self.window,
+            'target_seconds': self.target,
+            'over_target_total': self.over_target,
+            **{stage: self.percentiles(stage) for stage in STAGES},
+        }
+
+    def log_summary(self) -> None:
+        delivery = self.percentiles("delivery")
+        if delivery['count']:
+            logger.info(
+                f"Задержка доставки за {self.window / 60:.0f} мин: p50={delivery['p50']} с, "
+                f"p95={delivery['p95']} с, p99={delivery['p99']} с ({delivery['count']} отчётов)"
+            )
+
+
+latency_tracker = LatencyTracker(window=Config.LATENCY_WINDOW, target=Config.LATENCY_TARGET)
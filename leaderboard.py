@@ -0,0 +1,124 @@
+# leaderboard.py — рейтинги городов, сетей, промоутеров и сыров, обновляемые по каждому отчёту
+
+from bisect import bisect_left, insort
+from datetime import date, datetime
+
+import report_events
+from aggregates import history_feed
+
+# Измерения рейтинга: имя -> поле отчёта (сыры разворачиваются из cheese_data)
+DIMENSIONS = {
+    "city": "city",
+    "network": "network",
+    "employee": "employee",
+    "cheese": None,
+}
+METRICS = ("sales", "efficiency")
+
+
+class Leaderboard:
+    """
+    Рейтинг ключей по продажам и средней эффективности.
+
+    Для каждой метрики хранится отсортированный список (значение, ключ). Отчёт меняет
+    итоги одного ключа: старая запись находится и удаляется bisect'ом, новая вставляется
+    insort'ом — без пересортировки и без прохода по всем отчётам. Топ и «хвост» — срезы списка.
+    """
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self._totals = {}  # ключ -> [продажи, сумма эффективности, число дегустаций]
+        self._ranked = {metric: [] for metric in metrics}
+
+    def __len__(self):
+        return len(self._totals)
+
+    @staticmethod
+    def _value(metric: str, totals) -> float:
+        if metric == "sales":
+            return totals[0]
+        return round(totals[1] / totals[2], 1) if totals[2] else 0.0
+
+    def add(self, key: str, sales: int, efficiency: float = 0.0) -> None:
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = [0, 0.0, 0]
+        else:
+            for metric in self.metrics:
+                ranked = self._ranked[metric]
+                del ranked[bisect_left(ranked, (self._value(metric, totals), key))]
+
+        totals[0] += sales
+        totals[1] += efficiency
+        totals[2] += 1
+        for metric in self.metrics:
+            insort(self._ranked[metric], (self._value(metric, totals), key))
+
+    def top(self, metric: str = "sales", k: int = 10) -> list[tuple[str, float]]:
+        """k лучших ключей: [(ключ, значение)] по убыванию."""
+        return [(key, value) for value, key in reversed(self._ranked[metric][-k:])]
+
+    def bottom(self, metric: str = "sales", k: int = 10) -> list[tuple[str, float]]:
+        """k худших ключей: [(ключ, значение)] по возрастанию."""
+        return [(key, value) for value, key in self._ranked[metric][:k]]
+
+    def count(self, key: str) -> int:
+        totals = self._totals.get(key)
+        return totals[2] if totals else 0
+
+
+class Leaderboards(report_events.ReportAggregate):
+    """
+    Рейтинги по всем измерениям за всё время и по дням; пополняются через report_events,
+    историю получают из общего прохода aggregates.history_feed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.all_time = self._new_set()
+        self.days = {}  # дата -> {измерение: Leaderboard}
+
+    @staticmethod
+    def _new_set() -> dict:
+        # У сыров нет своей эффективности — только продажи
+        return {dim: Leaderboard(("sales",) if dim == "cheese" else METRICS) for dim in DIMENSIONS}
+
+    def _add(self, report) -> None:
+        day = datetime.strptime(report.date, '%d.%m.%Y').date()
+        day_set = self.days.get(day)
+        if day_set is None:
+            day_set = self.days[day] = self._new_set()
+
+        for boards in (self.all_time, day_set):
+            for dim, field in DIMENSIONS.items():
+                if field is None:
+                    for cheese, sold in report.sold_items():
+                        boards[dim].add(cheese, sold)
+                else:
+                    boards[dim].add(str(getattr(report, field)), report.total_sales, report.efficiency)
+
+    def board(self, dim: str, day: date | None = None) -> Leaderboard | None:
+        """Рейтинг измерения за день day или за всё время (day=None)."""
+        if day is None:
+            return self.all_time[dim]
+        boards = self.days.get(day)
+        return boards[dim] if boards else None
+
+    def top(self, dim: str, metric: str = "sales", k: int = 10, day: date | None = None):
+        board = self.board(dim, day)
+        if board is None:
+            return []
+        with self._lock:
+            return board.top(metric, k)
+
+    def bottom(self, dim: str, metric: str = "sales", k: int = 10, day: date | None = None):
+        board = self.board(dim, day)
+        if board is None:
+            return []
+        with self._lock:
+            return board.bottom(metric, k)
+
+
+leaderboards = Leaderboards()
+history_feed.register(leaderboards)
+report_events.subscribe(leaderboards.add_reports)
@@ -0,0 +1,57 @@
+# live_dashboard.py — одно закреплённое сообщение «сегодня» на чат вместо потока новых сообщений
+
+import logging
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+
+class LiveDashboard:
+    """
+    Держит по одному сообщению-сводке за день в каждом чате и обновляет его через
+    edit_message_text. Правки ограничены: не чаще одной за interval секунд на чат,
+    промежуточные версии текста просто заменяют друг друга, последняя уходит при flush().
+    В новый день создаётся и закрепляется новое сообщение.
+    """
+
+    def __init__(self, telegram_bot, interval: float = 60.0):
+        self.telegram_bot = telegram_bot
+        self.interval = interval
+        self._messages = {}  # chat_id -> (день, message_id)
+        self._last_edit = {}  # chat_id -> time.monotonic() последней правки
+        self._pending = {}  # chat_id -> (день, текст), ещё не показанный в чате
+        self._shown = {}  # chat_id -> текст, который сейчас в сообщении
+
+    async def update(self, chat_id, day: date, text: str) -> None:
+        """Запоминает новую версию сводки и показывает её, если позволяет интервал."""
+        if self._shown.get(chat_id) == text and self._messages.get(chat_id, (None,))[0] == day:
+            return
+        self._pending[chat_id] = (day, text)
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id=None, force: bool = False) -> None:
+        """Отправляет отложенные версии, у которых истёк интервал (или все при force=True)."""
+        chats = [chat_id] if chat_id is not None else list(self._pending)
+        for chat in chats:
+            if chat not in self._pending:
+                continue
+            day, text = self._pending[chat]
+            current = self._messages.get(chat)
+
+            if current is None or current[0] != day:
+                message_id = await self.telegram_bot.send_and_pin(text, chat_id=chat)
+                if message_id is None:
+                    continue
+                self._messages[chat] = (day, message_id)
+            else:
+                elapsed = time.monotonic() - self._last_edit.get(chat, 0.0)
+                if not force and elapsed < self.interval:
+                    continue
+                if not await self.telegram_bot.edit_message(current[1], text, chat_id=chat):
+                    continue
+
+            self._last_edit[chat] = time.monotonic()
+            self._shown[chat] = text
+            del self._pending[chat]
+            logger.info(f"Дашборд дня обновлён в чате {chat}")
@@ -0,0 +1,415 @@
+# loadtest.py — нагрузочный прогон всей цепочки на одной машине без Google API и Telegram
+#
+#   python loadtest.py pipeline --rows 2000 --rows-per-minute 120 --duration 60
+#   python loadtest.py updates --target webhook --rate 50 --concurrency 40 --duration 60
+#   python loadtest.py updates --updates recorded.jsonl --repeat 10
+#
+# Сервисы подменяются заглушками из fake_backends: листы генерируются в памяти
+# (с задержкой, 429 и ростом строк), сообщения уходят в FakeTelegramRequest.
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+
+from fake_backends import FakeSheetsBackend, FakeTelegramRequest, create_fake_bot
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _quiet_logs(level):
+    logging.getLogger().setLevel(level)
+    for name in list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(level)
+
+
+def run_pipeline(args):
+    """check_for_new_reports → сопоставление → отправка в цикле, с замером каждого опроса."""
+    from main import DegustationAnalyzer
+    from google_sheets import GoogleSheetsService
+    from telegram_bot import UltimateTelegramBot
+    from latency import latency_tracker
+
+    _quiet_logs(args.log_level)
+
+    backend = FakeSheetsBackend(
+        initial_rows=args.rows,
+        rows_per_minute=args.rows_per_minute,
+        latency=args.sheets_latency,
+        latency_jitter=args.sheets_jitter,
+        rate_limit_probability=args.rate_limit,
+        seed=args.seed,
+    )
+    sheets = GoogleSheetsService(backend=backend)
+    sheets.RATE_LIMIT_BACKOFF = 0.05
+
+    request = FakeTelegramRequest(latency=args.telegram_latency)
+    telegram_bot = UltimateTelegramBot()
+    telegram_bot.set_bot(create_fake_bot(request))
+    telegram_bot.config.CHAT_ID = args.chat_id
+
+    analyzer = DegustationAnalyzer(sheets_service=sheets, telegram_bot=telegram_bot)
+
+    poll_durations = []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        analyzer.check_for_new_reports()
+        poll_durations.append(time.perf_counter() - t0)
+        time.sleep(args.poll_interval)
+    elapsed = time.perf_counter() - started
+
+    sent = request.count("sendMessage")
+    print("=" * 60)
+    print(f"Длительность:        {elapsed:.1f} с, опросов: {len(poll_durations)}")
+    print(f"Опрос p50/p95/max:   {_percentile(poll_durations, 50) * 1000:.0f} / "
+          f"{_percentile(poll_durations, 95) * 1000:.0f} / {max(poll_durations, default=0) * 1000:.0f} мс")
+    print(f"Отчётов отправлено:  {sent} ({sent / elapsed:.1f} отч/с)")
+    print(f"Чтений листов:       {backend.stats['requests']} (429: {backend.stats['rate_limited']}, "
+          f"строк отдано: {backend.stats['rows_served']})")
+    delivery = latency_tracker.percentiles("delivery")
+    if delivery['count']:
+        print(f"Анкета → чат p50/p95/p99: {delivery['p50']} / {delivery['p95']} / {delivery['p99']} с "
+              f"({delivery['count']} отчётов)")
+    print("=" * 60)
+
+
+# ===================== ОБНОВЛЕНИЯ TELEGRAM =====================
+# Сценарии синтетических пользователей: каждый — цепочка нажатий из меню /start
+SCENARIOS = ("start", "store", "city", "date", "network")
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"}
+
+
+def _command(user_id, text):
+    return {"message": {
+        "message_id": 1, "date": int(time.time()), "text": text,
+        "chat": {"id": user_id, "type": "private"}, "from": _user(user_id),
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+    }}
+
+
+def _callback(user_id, data):
+    return {"callback_query": {
+        "id": f"{user_id}-{data}", "chat_instance": str(user_id), "data": data, "from": _user(user_id),
+        "message": {"message_id": 1, "date": int(time.time()), "text": "menu",
+                    "chat": {"id": user_id, "type": "private"}},
+    }}
+
+
+def update_kind(update) -> str:
+    """Вид обновления для отчёта: команда, history_* или префикс кнопки (date, city, ...)."""
+    if "message" in update:
+        return (update["message"].get("text") or "message").split()[0]
+    data = (update.get("callback_query") or {}).get("data", "")
+    return data if data.startswith("history_") else data.partition("_")[0]
+
+
+def synthetic_sessions(snapshot, config, mix: dict, days: int, seed: int = 42):
+    """
+    Бесконечный поток сессий синтетических пользователей. Даты, города, сети и адреса
+    берутся из утреннего снимка (последние days дат), а ID кнопок city_/network_/address_ —
+    из того же индекса кнопок (keyboards.get_callback_index), которым их выдаёт бот, поэтому нажатия находят
+    значения, как у живого пользователя. Каждая сессия — новый пользователь.
+    """
+    from keyboards import get_callback_index
+
+    callback_index = get_callback_index()
+    columns = config.MORNING_COLUMNS
+    rows = []
+    for day in sorted(snapshot.dates())[-days:]:
+        frame = snapshot.on_date(day).dropna(subset=[columns['city'], columns['network_name'], columns['address']])
+        rows += [(day, *row) for row in frame[[columns['city'], columns['network_name'], columns['address']]].itertuples(index=False)]
+    if not rows:
+        raise ValueError("В утреннем листе нет строк для синтетических сессий")
+
+    rnd = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    for user_id in itertools.count(100000):
+        scenario = rnd.choices(names, weights)[0]
+        day, city, network, address = rnd.choice(rows)
+        date_button = f"date_{day.strftime('%Y-%m-%d')}"
+        if scenario == "start":
+            steps = [_command(user_id, "/start")]
+        elif scenario == "store":
+            steps = [_callback(user_id, "history_store"), _callback(user_id, date_button),
+                     _callback(user_id, f"city_{callback_index.id_for(city)}"),
+                     _callback(user_id, f"network_{callback_index.id_for(network)}"),
+                     _callback(user_id, f"address_{callback_index.id_for(address)}")]
+        elif scenario == "network":
+            steps = [_callback(user_id, "history_network"), _callback(user_id, date_button),
+                     _callback(user_id, f"network_{callback_index.id_for(network)}")]
+        else:
+            steps = [_callback(user_id, f"history_{scenario}"), _callback(user_id, date_button)]
+        yield steps
+
+
+def recorded_sessions(path: str, repeat: int = 1):
+    """
+    Сессии из JSONL с записанными обновлениями (тело POST /webhook, одно на строку):
+    обновления группируются по пользователю, порядок внутри пользователя сохраняется.
+    Кнопки city_/network_/address_ несут ID прошлого процесса — бот ответит «меню устарело»,
+    поэтому для этих шагов точнее синтетические сессии.
+    """
+    sessions = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            update = json.loads(line)
+            body = update.get("message") or update.get("callback_query") or {}
+            sessions.setdefault(body.get("from", {}).get("id"), []).append(update)
+    for _ in range(repeat):
+        yield from sessions.values()
+
+
+class UpdateReplay:
+    """
+    Прогоняет сессии через PTB Application: concurrency пользователей одновременно,
+    шаги пользователя — по очереди, общий темп — не больше rate обновлений в секунду.
+
+    target="ptb" — Application.process_update напрямую; target="webhook" — POST /webhook
+    приложения telegram_webhook в этом же процессе (ASGI без сети): замеряется и ответ
+    маршрута, и полная обработка — её конец отмечает обработчик в последней группе.
+    """
+
+    DONE_GROUP = 99
+
+    def __init__(self, application, target: str = "ptb", rate: float = 0.0, concurrency: int = 20,
+                 timeout: float = 30.0):
+        from telegram import Update
+        from telegram.ext import TypeHandler
+
+        self.application = application
+        self.target = target
+        self.rate = rate
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.latencies = {}  # вид -> [с]
+        self.acks = []  # ответ POST /webhook, с
+        self.errors = {"handler": 0, "http": 0, "timeout": 0}
+        self.sent = 0
+        self._update_ids = itertools.count(1)
+        self._pending = {}  # update_id -> Future конца обработки
+        application.add_handler(TypeHandler(Update, self._done), group=self.DONE_GROUP)
+        application.add_error_handler(self._error)
+
+    async def _done(self, update, context):
+        future = self._pending.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def _error(self, update, context):
+        self.errors["handler"] += 1
+        logging.getLogger(__name__).debug(f"Ошибка обработчика: {context.error!r}")
+
+    async def _dispatch(self, client, data: dict) -> None:
+        if self.target == "ptb":
+            from telegram import Update
+
+            await self.application.process_update(Update.de_json(data, self.application.bot))
+            return
+
+        future = self._pending[data["update_id"]] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        response = await client.post("/webhook", json=data)
+        self.acks.append(time.perf_counter() - started)
+        if response.status_code != 200 or response.json().get("status") != "ok":
+            self._pending.pop(data["update_id"], None)
+            self.errors["http"] += 1
+            return
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(data["update_id"], None)
+            self.errors["timeout"] += 1
+
+    async def run(self, sessions, duration: float) -> float:
+        """Прогон до исчерпания сессий или duration секунд; возвращает длительность."""
+        client = None
+        if self.target == "webhook":
+            import httpx
+            import telegram_webhook
+
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=telegram_webhook.app),
+                                       base_url="http://loadtest")
+
+        sessions = iter(sessions)
+        started = time.perf_counter()
+        deadline = started + duration
+        slots = itertools.count()
+
+        async def worker():
+            for steps in sessions:
+                for update in steps:
+                    if self.rate:
+                        delay = started + next(slots) / self.rate - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    if time.perf_counter() >= deadline:
+                        return
+                    data = {**update, "update_id": next(self._update_ids)}
+                    t0 = time.perf_counter()
+                    await self._dispatch(client, data)
+                    self.latencies.setdefault(update_kind(update), []).append(time.perf_counter() - t0)
+                    self.sent += 1
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            if client is not None:
+                await client.aclose()
+        return time.perf_counter() - started
+
+
+def _report_line(name, values):
+    return (f"{name:<18} {len(values):>6}   {_percentile(values, 50) * 1000:>7.0f} {_percentile(values, 95) * 1000:>7.0f} "
+            f"{_percentile(values, 99) * 1000:>7.0f} {max(values, default=0) * 1000:>7.0f}")
+
+
+async def _run_updates(args):
+    from config import Config
+
+    # Снимки и кэш экранов — в памяти процесса: файл SQLite от прошлых прогонов не подмешивается
+    Config.SHARED_STATE = args.state
+    _quiet_logs(args.log_level)
+
+    from google_sheets import GoogleSheetsService
+    from telegram_ptb_bot import TelegramPTBBot, create_application
+
+    backend = FakeSheetsBackend(
+        initial_rows=args.rows,
+        history_days=args.history_days,
+        latency=args.sheets_latency,
+        latency_jitter=args.sheets_jitter,
+        rate_limit_probability=args.rate_limit,
+        seed=args.seed,
+    )
+    ptb_bot = TelegramPTBBot()
+    ptb_bot.config.BOT_TOKEN = ptb_bot.config.BOT_TOKEN or "123456:FAKE"
+    ptb_bot.sheets_service = GoogleSheetsService(backend=backend)
+    ptb_bot.sheets_service.RATE_LIMIT_BACKOFF = 0.05
+    request = FakeTelegramRequest(latency=args.telegram_latency, failure_rate=args.telegram_failures, seed=args.seed)
+    application = create_application(webhook=args.target == "webhook", bot=ptb_bot, request=request)
+    replay = UpdateReplay(application, args.target, args.rate, args.concurrency, args.timeout)
+
+    await application.initialize()
+    await application.start()
+    if args.target == "webhook":
+        import telegram_webhook
+
+        telegram_webhook._application = application
+        _quiet_logs(args.log_level)  # telegram_webhook настраивает логи при импорте
+
+    try:
+        t0 = time.perf_counter()
+        morning = await asyncio.to_thread(
+            ptb_bot.sheets_service.get_snapshot, ptb_bot.config.MORNING_SHEET_ID, max_age=ptb_bot.config.SNAPSHOT_TTL
+        )
+        warmup = time.perf_counter() - t0
+        if args.updates:
+            sessions = recorded_sessions(args.updates, args.repeat)
+        else:
+            mix = {name: float(weight) for name, _, weight in (item.partition("=") for item in args.mix.split(","))}
+            unknown = set(mix) - set(SCENARIOS)
+            if unknown:
+                raise SystemExit(f"Неизвестные сценарии в --mix: {', '.join(sorted(unknown))}")
+            sessions = synthetic_sessions(morning, ptb_bot.config, mix, args.days, args.seed)
+            if args.sessions:
+                sessions = itertools.islice(sessions, args.sessions)
+        elapsed = await replay.run(sessions, args.duration)
+    finally:
+        await application.stop()
+        await application.shutdown()
+
+    errors = sum(replay.errors.values())
+    everything = [value for values in replay.latencies.values() for value in values]
+    api_calls = {}
+    for method, _, _ in request.calls:
+        api_calls[method] = api_calls.get(method, 0) + 1
+
+    print("=" * 60)
+    print(f"Цель: {args.target}, пользователей одновременно: {args.concurrency}, темп: {args.rate or 'без ограничения'} обн/с")
+    print(f"Прогрев (первое чтение листа): {warmup:.1f} с")
+    print(f"Длительность:        {elapsed:.1f} с, обновлений: {replay.sent} ({replay.sent / elapsed:.1f} обн/с)")
+    print(f"Ошибок:              {errors} ({errors / max(replay.sent, 1):.1%}) — обработчики: "
+          f"{replay.errors['handler']}, HTTP: {replay.errors['http']}, таймауты: {replay.errors['timeout']}")
+    print(f"{'Обработка, мс':<18} {'шт.':>6}   {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+    for kind in sorted(replay.latencies):
+        print(_report_line(kind, replay.latencies[kind]))
+    print(_report_line("всего", everything))
+    if replay.acks:
+        print(_report_line("ответ /webhook", replay.acks))
+    print(f"Bot API:             {', '.join(f'{m} {n}' for m, n in sorted(api_calls.items()))}")
+    print(f"Чтений листов:       {backend.stats['requests']} (429: {backend.stats['rate_limited']}, "
+          f"строк отдано: {backend.stats['rows_served']})")
+    print("=" * 60)
+
+
+def run_updates(args):
+    """Обновления Telegram (/start, history_*, date_/city_/network_/address_) через PTB Application или /webhook."""
+    asyncio.run(_run_updates(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон MD-BOT на заглушках")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    pipeline = sub.add_parser("pipeline", help="опрос листов → сопоставление → отправка")
+    pipeline.add_argument("--rows", type=int, default=2000, help="строк в истории на старте")
+    pipeline.add_argument("--rows-per-minute", type=float, default=60.0, help="рост листа, строк/мин")
+    pipeline.add_argument("--duration", type=float, default=30.0, help="длительность прогона, с")
+    pipeline.add_argument("--poll-interval", type=float, default=1.0, help="пауза между опросами, с")
+    pipeline.add_argument("--sheets-latency", type=float, default=0.0, help="задержка чтения листа, с")
+    pipeline.add_argument("--sheets-jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    pipeline.add_argument("--rate-limit", type=float, default=0.0, help="вероятность ответа 429")
+    pipeline.add_argument("--telegram-latency", type=float, default=0.0, help="задержка Bot API, с")
+    pipeline.add_argument("--chat-id", default="1")
+    pipeline.add_argument("--seed", type=int, default=42)
+    pipeline.add_argument("--log-level", default="WARNING")
+    pipeline.set_defaults(func=run_pipeline)
+
+    updates = sub.add_parser("updates", help="обновления Telegram через PTB Application или /webhook")
+    updates.add_argument("--target", choices=("ptb", "webhook"), default="ptb",
+                         help="ptb — Application.process_update, webhook — POST /webhook в этом процессе")
+    updates.add_argument("--updates", help="JSONL с записанными обновлениями; без него — синтетические сессии")
+    updates.add_argument("--repeat", type=int, default=1, help="сколько раз проиграть записанные обновления")
+    updates.add_argument("--mix", default="start=2,store=3,city=2,date=2,network=1",
+                         help=f"веса синтетических сценариев ({', '.join(SCENARIOS)})")
+    updates.add_argument("--days", type=int, default=7, help="по скольким последним датам ходят пользователи")
+    updates.add_argument("--sessions", type=int, default=0, help="сколько синтетических сессий (0 — до конца прогона)")
+    updates.add_argument("--rate", type=float, default=0.0, help="обновлений в секунду (0 — без ограничения)")
+    updates.add_argument("--concurrency", type=int, default=20, help="пользователей одновременно")
+    updates.add_argument("--duration", type=float, default=30.0, help="длительность прогона, с")
+    updates.add_argument("--timeout", type=float, default=30.0, help="ожидание обработки одного обновления, с")
+    updates.add_argument("--rows", type=int, default=2000, help="строк в истории листов")
+    updates.add_argument("--history-days", type=int, default=30, help="за сколько дней история листов")
+    updates.add_argument("--sheets-latency", type=float, default=0.0, help="задержка чтения листа, с")
+    updates.add_argument("--sheets-jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    updates.add_argument("--rate-limit", type=float, default=0.0, help="вероятность ответа 429 от листов")
+    updates.add_argument("--telegram-latency", type=float, default=0.0, help="задержка Bot API, с")
+    updates.add_argument("--telegram-failures", type=float, default=0.0, help="доля ответов 429 от Bot API")
+    updates.add_argument("--state", choices=("memory", "sqlite", "redis"), default="memory",
+                         help="общее хранилище (shared_state.py) для снимков и кэша экранов")
+    updates.add_argument("--seed", type=int, default=42)
+    updates.add_argument("--log-level", default="WARNING")
+    updates.set_defaults(func=run_updates)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# logging_setup.py — единая настройка логов: запись в файл и stdout в фоновом потоке
+
+import atexit
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from config import Config
+
+LOG_FORMAT = '%(asctime)s | %(name)-20s | %(levelname)-8s | %(message)s'
+
+_listener = None  # QueueListener процесса; повторный setup_logging() ничего не делает
+
+
+def setup_logging(level: str | int | None = None, log_file: str | None = None) -> None:
+    """
+    Настраивает логи процесса один раз, у корневого логгера.
+
+    Модули только берут logging.getLogger(__name__) и своих хендлеров не вешают.
+    Корневой логгер кладёт записи в очередь (QueueHandler), а файл LOG_FILE и stdout
+    пишет фоновый QueueListener — сопоставление и обработчики бота не ждут диска и консоли.
+    Вызывается точкой входа до создания сервисов, а не при импорте модуля.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or Config.LOG_LEVEL
+    log_file = log_file or Config.LOG_FILE
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    logging.info(f"Логирование запущено: уровень {logging.getLevelName(root.level)}, файл {log_file or '—'}")
+
+
+def stop_logging() -> None:
+    """Дописывает очередь и останавливает фоновый поток (вызывается при выходе)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class LogSampler:
+    """
+    Прореживание построчных логов в горячих циклах: пишутся первые first сообщений
+    пачки и дальше каждое every-е. Уровень проверяется один раз при создании, поэтому
+    при выключенном DEBUG вызов hit() — счётчик и одно сравнение, без форматирования.
+
+        sampler = LogSampler(logger)
+        for row in rows:
+            if sampler.hit():
+                logger.debug("... %s", row)
+    """
+
+    def __init__(self, logger: logging.Logger, level: int = logging.DEBUG, every: int | None = None, first: int = 3):
+        self.enabled = logger.isEnabledFor(level)
+        self.every = max(1, every or Config.LOG_SAMPLE_EVERY)
+        self.first = first
+        self.count = 0
+        self.logged = 0
+
+    def hit(self) -> bool:
+        self.count += 1
+        if not self.enabled:
+            return False
+        if self.count <= self.first or self.count % self.every == 0:
+            self.logged += 1
+            return True
+        return False
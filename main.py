@@ -1,152 +1,356 @@
 # main.py — ФИНАЛЬНЫЙ, 100% РАБОЧИЙ, С ЛОГАМИ С ПЕРВОЙ СЕКУНДЫ
 
+from __future__ import annotations
+
 import logging
-import sys
-import os
+import threading
 from datetime import datetime, timedelta
 import time
-import schedule
-import asyncio
-import pandas as pd
-
-# ═══════════════════════════════════════════════════════════════
-# ВАЖНО: НАСТРОЙКА ЛОГИРОВАНИЯ ДО ВСЕХ ИМПОРТОВ!
-# ═══════════════════════════════════════════════════════════════
-os.makedirs("logs", exist_ok=True)  # создаём папку для логов
-
-logging.basicConfig(
-    level=logging.INFO,  # меняй на DEBUG, если хочешь ВСЁ
-    format='%(asctime)s | %(name)-20s | %(levelname)-8s | %(message)s',
-    handlers=[
-        logging.FileHandler("logs/degustation_analyzer.log", encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)  # ← ГАРАНТИРОВАННО в консоль
-    ]
-)
-
-# Принудительно включаем логи для всех наших модулей
-for name in logging.root.manager.loggerDict.keys():
-    if name.startswith(('data_processor', 'telegram_bot', 'google_sheets', 'config')):
-        logging.getLogger(name).setLevel(logging.INFO)
-
-# Тест — ДОЛЖЕН появиться сразу при запуске!
-logging.info("=" * 70)
-logging.info("ЛОГИРОВАНИЕ УСПЕШНО ЗАПУЩЕНО — ЭТА СТРОКА ДОЛЖНА БЫТЬ ПЕРВОЙ!")
-logging.info("Если ты видишь это — значит логи работают на 100%")
-logging.info("=" * 70)
-
-# ═══════════════════════════════════════════════════════════════
-# ТЕПЕРЬ можно импортировать всё остальное
-# ═══════════════════════════════════════════════════════════════
+from typing import TYPE_CHECKING
+
+from aggregates import StatsCache
 from config import Config
-from google_sheets import GoogleSheetsService
-from data_processor import DataProcessor
-from telegram_bot import UltimateTelegramBot
+from daily_stats import DailyStats
+from latency import latency_tracker
+from logging_setup import setup_logging
+from run_lease import RunLease, run_exclusive
+from shared_state import get_shared_state
+from validation import ReportValidator, summary_message
+import report_events
+import response_cache  # noqa: F401 — подписывает сброс кэша экранов бота на report_events
+
+# Сервисы и тяжёлые библиотеки (pandas, scipy, gspread, python-telegram-bot)
+# подключаются при первом обращении, а не при импорте модуля
+if TYPE_CHECKING:
+    from google_sheets import GoogleSheetsService
+    from data_processor import DataProcessor
+    from online_matcher import OnlineMatcher
+    from telegram_bot import UltimateTelegramBot
 
 logger = logging.getLogger('DegustationAnalyzer')
 
 
 class DegustationAnalyzer:
-    def __init__(self):
+    def __init__(self, sheets_service: GoogleSheetsService = None, telegram_bot: UltimateTelegramBot = None,
+                 config: Config = None):
         logger.info("Инициализация DegustationAnalyzer...")
-        self.config = Config()
-        self.sheets_service = GoogleSheetsService()
-        self.data_processor = DataProcessor()
-        self.telegram_bot = UltimateTelegramBot()
+        # config — настройки проекта (ProjectConfig из projects.py) или общий Config
+        self.config = config or Config()
+        # Сервисы создаются при первом обращении; их можно подменить
+        # (например, заглушками из fake_backends для нагрузочных тестов)
+        self._sheets_service = sheets_service
+        self._data_processor = None
+        self._matcher = None
+        self._telegram_bot = telegram_bot
         self.last_check_time = datetime.now() - timedelta(days=1)
-        self.daily_reports = []  # сюда собираем отчёты за день
+        # Первый опрос забирает накопленное за сутки — в задержку доставки оно не идёт
+        self._backlog = True
+        # Опрос и /ingest идут из разных потоков — сопоставление и отправка по очереди
+        self._lock = threading.Lock()
+        # Счётчики по дням: ожидаемые магазины, отправленные отчёты и итоги для сводки
+        self.daily_stats = DailyStats(self.config)
+        # Ключи отправленных отчётов — общие для воркеров и перезапусков (shared_state.py)
+        self.shared_state = get_shared_state()
+        # Итоги для меню UltimateTelegramBot: считаются здесь, бот читает их из общего хранилища
+        self.stats = StatsCache(self.config, self.shared_state)
+        # Проверка данных — своя на проект; норма эффективности магазинов берётся из той же свёртки истории
+        self.validator = ReportValidator(
+            max_visitors=self.config.VALIDATION_MAX_VISITORS,
+            outlier_z=self.config.VALIDATION_OUTLIER_Z,
+            min_history=self.config.VALIDATION_MIN_HISTORY,
+        )
+        self.stats.feed.register(self.validator.history)
+        self._history_load = None  # поток свёртки истории после первого опроса
+        # Режим дашборда: вместо сообщения на каждый отчёт — одно закреплённое сообщение дня
+        self.dashboard = None
+        if self.config.LIVE_DASHBOARD:
+            from live_dashboard import LiveDashboard
+            self.dashboard = LiveDashboard(self.telegram_bot, interval=self.config.DASHBOARD_EDIT_INTERVAL)
+
+    @property
+    def sheets_service(self) -> GoogleSheetsService:
+        if self._sheets_service is None:
+            from google_sheets import GoogleSheetsService
+            self._sheets_service = GoogleSheetsService()
+        return self._sheets_service
+
+    @property
+    def data_processor(self) -> DataProcessor:
+        if self._data_processor is None:
+            from data_processor import DataProcessor
+            self._data_processor = DataProcessor(self.config)
+        return self._data_processor
+
+    @property
+    def matcher(self) -> OnlineMatcher:
+        if self._matcher is None:
+            from online_matcher import OnlineMatcher
+            self._matcher = OnlineMatcher(self.data_processor)
+        return self._matcher
+
+    @property
+    def telegram_bot(self) -> UltimateTelegramBot:
+        if self._telegram_bot is None:
+            from telegram_bot import UltimateTelegramBot
+            self._telegram_bot = UltimateTelegramBot()
+        return self._telegram_bot
+
+    # ===================== ЗАПУСК ПОД АРЕНДОЙ =====================
+    def _exclusive(self, task: str, func) -> dict:
+        """
+        func() под арендой run_lease на проект: планировщик, /trigger-check и перекрывающиеся
+        запуски GitHub Actions не опрашивают листы и не шлют отчёты одновременно.
+        """
+        lease = RunLease(f"{task}:{self.config.EVENING_SHEET_ID}", self.shared_state, ttl=self.config.RUN_LEASE_TTL)
+        return run_exclusive(lease, func)
+
+    def check_for_new_reports(self) -> dict:
+        """Опрос листов; если опрос уже идёт в другом процессе — сразу {'status': 'already_running', ...}."""
+        return self._exclusive("check", self._check_for_new_reports)
 
-    def check_for_new_reports(self):
+    def generate_daily_summary(self) -> dict:
+        return self._exclusive("summary", self._generate_daily_summary)
+
+    def _check_for_new_reports(self) -> int:
+        """Возвращает число новых отчётов."""
         try:
             logger.info("Запуск проверки новых отчётов...")
-            morning_df = self.sheets_service.get_new_records(
-                self.config.MORNING_SHEET_ID, self.last_check_time
+            # Водяной знак — начало чтения с точностью Timestamp формы (секунда): анкеты,
+            # записанные во время чтения или в ту же секунду, войдут в следующий опрос
+            fetch_started = datetime.now().replace(microsecond=0)
+            # Каждый лист читается и разбирается один раз за опрос
+            morning = self.sheets_service.get_snapshot(
+                self.config.MORNING_SHEET_ID, self.config.MORNING_SHEET_NAME, self.config.MORNING_COLUMNS
             )
-            evening_df = self.sheets_service.get_new_records(
-                self.config.EVENING_SHEET_ID, self.last_check_time
+            evening = self.sheets_service.get_snapshot(
+                self.config.EVENING_SHEET_ID, self.config.EVENING_SHEET_NAME, self.config.EVENING_COLUMNS
             )
+            morning_df = morning.since(self.last_check_time)
+            evening_df = evening.since(self.last_check_time)
 
             if morning_df.empty and evening_df.empty:
                 logger.info("Новых записей не найдено")
-                self.last_check_time = datetime.now()
-                return
+                accepted = []
+            else:
+                logger.info(f"Найдено новых: утро={len(morning_df)}, вечер={len(evening_df)}")
+                picked_at = time.monotonic()  # момент, когда опрос увидел новые анкеты
+
+                with self._lock:
+                    self.daily_stats.add_morning_rows(morning_df)
+                    # Новые вечерние анкеты — только против открытых утренних своей даты;
+                    # затем венгерский пересчёт дат, где были жадные решения
+                    new_reports = self.matcher.match(morning_df, evening_df, morning, evening)
+                    new_reports += self.matcher.reoptimize()
+                    accepted = self._deliver(new_reports, picked_at, backlog=self._backlog)
+            self._backlog = False
+            self.last_check_time = fetch_started
+            if self._history_load is None:
+                self._start_history_load(morning, evening)
+            return len(accepted)
+
+        except Exception as e:
+            logger.error(f"КРИТИЧЕСКАЯ ОШИБКА в check_for_new_reports: {e}", exc_info=True)
+            return 0
+
+    def _start_history_load(self, morning, evening) -> None:
+        """
+        Свёртка истории для StatsCache (итоги меню и норма проверки данных) — в фоновом потоке
+        после доставки первого опроса: отчёты не ждут прохода по истории, а аренда опроса
+        не удерживается на время свёртки. Отчёты, доставленные раньше, свёртка не задваивает
+        (report_key), итоги до её конца — только по ним.
+        """
+        self._history_load = threading.Thread(
+            target=self.stats.load,
+            args=(self.data_processor, morning, evening, self.config.MEMORY_LIMIT_MB),
+            name=f"history-{self.config.PROJECT_NAME}",
+            daemon=True,
+        )
+        self._history_load.start()
 
-            logger.info(f"Найдено новых: утро={len(morning_df)}, вечер={len(evening_df)}")
+    def ingest_row(self, form: str, values: dict) -> dict:
+        """
+        Принимает одну строку анкеты, присланную onFormSubmit (POST /ingest), без опроса листов:
+        строка добавляется в снимок листа в памяти, вечерняя сразу сопоставляется с утренними
+        анкетами той же даты и отправляется. Опрос остаётся сверкой и пропускает уже учтённое.
+        ValueError — неизвестная форма или строка не подходит к карте колонок.
+        """
+        from sheet_snapshot import form_row
 
-            # Берём ВСЁ утро (для сопоставления) + новые вечерние записи
-            full_morning_df = self.sheets_service.get_sheet_data(
-                self.config.MORNING_SHEET_ID,
-                self.config.MORNING_SHEET_NAME
+        if form not in ("morning", "evening"):
+            raise ValueError(f"неизвестная форма '{form}', ожидается morning или evening")
+        picked_at = time.monotonic()
+        if form == "morning":
+            sheet_id, sheet_name, columns = (
+                self.config.MORNING_SHEET_ID, self.config.MORNING_SHEET_NAME, self.config.MORNING_COLUMNS
             )
-            new_reports = self.data_processor.process_daily_reports(full_morning_df, evening_df)
+        else:
+            sheet_id, sheet_name, columns = (
+                self.config.EVENING_SHEET_ID, self.config.EVENING_SHEET_NAME, self.config.EVENING_COLUMNS
+            )
+        row = form_row(values, columns)
+
+        with self._lock:
+            added = self.sheets_service.append_rows(sheet_id, [row], sheet_name, columns)
+            if added.empty:
+                return {'form': form, 'added': False, 'reports': 0}
+
+            if form == "morning":
+                self.daily_stats.add_morning_rows(added)
+                # Вечерняя анкета могла прийти раньше утренней и ждёт пары
+                self.matcher.match(added, added.iloc[0:0], None)
+                accepted = self._deliver(self.matcher.reoptimize(), picked_at)
+                return {'form': form, 'added': True, 'reports': len(accepted)}
 
-            logger.info(f"Успешно сопоставлено новых пар: {len(new_reports)}")
+            # Снимки берём из памяти — они обновляются опросом и тем же /ingest
+            morning = self.sheets_service.get_snapshot(
+                self.config.MORNING_SHEET_ID, self.config.MORNING_SHEET_NAME, self.config.MORNING_COLUMNS,
+                max_age=float("inf"),
+            )
+            evening = self.sheets_service.get_snapshot(
+                self.config.EVENING_SHEET_ID, self.config.EVENING_SHEET_NAME, self.config.EVENING_COLUMNS,
+                max_age=float("inf"),
+            )
+            new_reports = self.matcher.match(added.iloc[0:0], added, morning, evening)
+            accepted = self._deliver(new_reports, picked_at)
+        return {'form': form, 'added': True, 'reports': len(accepted)}
 
-            for report in new_reports:
-                # Проверяем, не отправляли ли уже этот отчёт
-                report_key = f"{report['date']}_{report['city']}_{report['employee']}_{report['normalized_address']}"
-                if any(r.get('key') == report_key for r in self.daily_reports):
-                    continue
+    def _deliver(self, new_reports, picked_at: float, backlog: bool = False) -> list:
+        """
+        Отбирает ещё не учтённые отчёты, проверяет их пачкой (validation.py),
+        отправляет (или обновляет дашборд) и публикует. Отчёт, ключ которого в общем
+        хранилище уже занят другим воркером или прошлым запуском, учитывается в сводке,
+        но повторно не отправляется. backlog=True — накопленное до запуска: отправляется,
+        но в latency_tracker не пишется (его задержка — время простоя, а не работы бота).
+        """
+        accepted = []
+        fresh = []
+        sent = 0
+        for report in new_reports:
+            # Проверяем, не отправляли ли уже этот отчёт
+            report_key = report_events.report_key(report)
+            report_day = datetime.strptime(report['date'], '%d.%m.%Y').date()
+            if self.daily_stats.has_report(report_day, report_key):
+                continue
 
-                report['key'] = report_key
-                self.daily_reports.append(report)
+            report['key'] = report_key
+            self.daily_stats.add_reports([report])
+            accepted.append(report)
+            if not self.shared_state.add(
+                f"report:{self.config.CHAT_ID}:{report_key}", ttl=self.config.REPORT_DEDUP_TTL
+            ):
+                continue
+            fresh.append(report)
+            if not backlog:
+                latency_tracker.record_since("poll_lag", report.submitted_at)
 
-                msg = self.telegram_bot.format_detailed_report(report)
-                success = asyncio.run(self.telegram_bot.send_message(msg))
-                if success:
-                    logger.info(f"Отчёт отправлен: {report['city']} | {report['employee']} | {report['total_sales']} шт.")
-                else:
-                    logger.error(f"НЕ УДАЛОСЬ отправить отчёт: {report['city']} | {report['employee']}")
+        fresh_ids = {id(report) for report in fresh}
+        flagged = [report for report in self.validator.validate(accepted) if id(report) in fresh_ids]
+
+        for report in fresh:
+            if self.dashboard is not None:
+                continue  # отчёт попадёт в сводку дашборда ниже
+
+            msg = self.telegram_bot.format_detailed_report(report)
+            success = self.telegram_bot.send_message_sync(
+                msg, chat_id=self.config.CHAT_ID,
+                report=None if backlog else report, queued_at=None if backlog else picked_at,
+            )
+            if success:
+                sent += 1
+                logger.debug("Отчёт отправлен: %s | %s | %s шт.", report.city, report.employee, report.total_sales)
+            else:
+                logger.error(f"НЕ УДАЛОСЬ отправить отчёт: {report['city']} | {report['employee']}")
 
-            self.last_check_time = datetime.now()
+        # Пометки проверки — одним сообщением на пачку, а не по сообщению на отчёт
+        if flagged:
+            self.telegram_bot.send_message_sync(summary_message(flagged, len(fresh)), chat_id=self.config.CHAT_ID)
 
+        # Кэши и агрегаты бота обновляются по новым отчётам
+        report_events.publish(accepted)
+        self.stats.update(accepted, self.daily_stats)
+
+        if accepted:
+            delivered = "в дашборде" if self.dashboard is not None else f"отправлено {sent} из {len(fresh)} новых"
+            logger.info(f"Новых отчётов: {len(accepted)} из {len(new_reports)} пар, {delivered}")
+            latency_tracker.log_summary()
+            if self.dashboard is not None:
+                self.update_dashboard()
+        return accepted
+
+    def update_dashboard(self):
+        """Передаёт в дашборд актуальную сводку за сегодня; частоту правок ограничивает LiveDashboard."""
+        today = datetime.now().date()
+        counters = self.daily_stats.get(today)
+        title = f"СВОДКА ЗА {today.strftime('%d.%m.%Y')} (обновлено {datetime.now().strftime('%H:%M')})"
+        text = self.telegram_bot.format_summary_report(counters.summary(), title=title)
+        self.telegram_bot.run_sync(self.dashboard.update(self.config.CHAT_ID, today, text))
+
+    def flush_dashboard(self):
+        """Показывает отложенную правку дашборда, если с прошлой прошёл интервал."""
+        try:
+            self.telegram_bot.run_sync(self.dashboard.flush())
         except Exception as e:
-            logger.error(f"КРИТИЧЕСКАЯ ОШИБКА в check_for_new_reports: {e}", exc_info=True)
+            logger.error(f"ОШИБКА при обновлении дашборда: {e}", exc_info=True)
 
-    def generate_daily_summary(self):
+    def _generate_daily_summary(self):
         try:
             today = datetime.now().date()
             logger.info(f"Генерация сводного отчёта за {today}")
 
-            full_morning = self.sheets_service.get_sheet_data(
-                self.config.MORNING_SHEET_ID,
-                self.config.MORNING_SHEET_NAME
-            )
-            expected = len(full_morning[
-                pd.to_datetime(full_morning[self.config.MORNING_COLUMNS['date']]).dt.date == today
-            ])
-            actual = len(self.daily_reports)
+            # Всё уже посчитано при опросах — лист заново не загружаем
+            counters = self.daily_stats.get(today)
+            expected = counters.expected
+            actual = counters.matched
 
             if expected == 0:
                 logger.info("Ожидаемых отчётов нет — пропускаем сводку")
                 return
 
-            summary = self.data_processor.generate_summary_report(self.daily_reports, expected, actual)
-            if summary:
+            if actual:
+                summary = counters.summary()
                 msg = self.telegram_bot.format_summary_report(summary)
-                asyncio.run(self.telegram_bot.send_message(msg))
+                self.telegram_bot.send_message_sync(msg, chat_id=self.config.CHAT_ID)
                 logger.info(f"Сводный отчёт отправлен: {actual}/{expected} магазинов")
             else:
                 logger.warning("Сводка пустая — не отправляем")
 
-            # Очищаем на следующий день
-            self.daily_reports = []
+            # Счётчики прошлых дней больше не нужны; сегодняшние оставляем для опоздавших отчётов
+            self.daily_stats.prune(keep_from=today)
+            with self._lock:
+                self.matcher.prune(keep_from=today)
 
         except Exception as e:
             logger.error(f"ОШИБКА при генерации сводного отчёта: {e}", exc_info=True)
 
     def run_scheduler(self):
-        schedule.every(self.config.CHECK_INTERVAL).minutes.do(self.check_for_new_reports)
+        import schedule
+
+        # С push-приёмом (/ingest) опрос листов — только редкая сверка
+        check_interval = self.config.RECONCILE_INTERVAL if self.config.INGEST_TOKEN else self.config.CHECK_INTERVAL
+        schedule.every(check_interval).minutes.do(self.check_for_new_reports)
         schedule.every().day.at(self.config.END_OF_DAY_TIME).do(self.generate_daily_summary)
+        if self.dashboard is not None:
+            schedule.every(self.config.DASHBOARD_EDIT_INTERVAL).seconds.do(self.flush_dashboard)
 
         logger.info("СИСТЕМА ЗАПУЩЕНА!")
-        logger.info(f"Проверка новых отчётов: каждые {self.config.CHECK_INTERVAL} минут")
+        logger.info(f"Проверка новых отчётов: каждые {check_interval} минут")
         logger.info(f"Сводный отчёт: ежедневно в {self.config.END_OF_DAY_TIME}")
+        if self.dashboard is not None:
+            logger.info(f"Дашборд дня: правки не чаще раза в {self.config.DASHBOARD_EDIT_INTERVAL} с")
 
         while True:
             schedule.run_pending()
-            time.sleep(60)
+            # До ближайшей задачи, но не дольше минуты: дашборд правится чаще раза в минуту
+            time.sleep(min(60, max(1, schedule.idle_seconds() or 0)))
 
 
 if __name__ == "__main__":
-    analyzer = DegustationAnalyzer()
-    analyzer.run_scheduler()
\ No newline at end of file
+    setup_logging()
+    from projects import ProjectRunner, load_projects
+
+    projects = load_projects()
+    if len(projects) > 1:
+        ProjectRunner(projects).run_scheduler()
+    else:
+        analyzer = DegustationAnalyzer(config=projects[0])
+        analyzer.run_scheduler()
\ No newline at end of file
@@ -0,0 +1,181 @@
+# online_matcher.py — сопоставление вечерних анкет по мере поступления, без пересчёта всего листа
+
+import logging
+from datetime import date
+
+from data_processor import MATCH_THRESHOLD, score_matrix
+
+logger = logging.getLogger(__name__)
+
+
+def _keyed_rows(frame, ts_col: str):
+    """
+    Пары (ключ, строка) для строк снимка. Ключ — (Timestamp, ФИО, адрес), как у SheetSnapshot.append;
+    в строку добавляется колонка date (datetime.date), которую ждёт DataProcessor.build_report.
+    """
+    if frame.empty:
+        return []
+    frame = frame.assign(date=frame['day'].dt.date)
+    keys = zip(frame[ts_col].tolist(), frame['fio'].tolist(), frame['addr'].tolist())
+    return list(zip(keys, (row for _, row in frame.iterrows())))
+
+
+class DayState:
+    """Анкеты одной даты: все утренние, открытые (ещё без пары) и вечерние с их парами."""
+
+    __slots__ = ('morning', 'open_keys', 'open_fio', 'open_addr', 'evening', 'pairs', 'reported', 'dirty')
+
+    def __init__(self):
+        self.morning = {}  # ключ -> строка
+        self.open_keys, self.open_fio, self.open_addr = [], [], []
+        self.evening = {}  # ключ -> строка
+        self.pairs = {}  # ключ вечерней -> ключ утренней
+        self.reported = set()  # вечерние, по которым отчёт уже выдан
+        self.dirty = False  # были жадные решения с прошлой переоптимизации
+
+    def add_morning(self, key, row) -> None:
+        if key in self.morning:
+            return
+        self.morning[key] = row
+        self.open_keys.append(key)
+        self.open_fio.append(row['fio'])
+        self.open_addr.append(row['addr'])
+        self.dirty = True
+
+    def close(self, key) -> None:
+        i = self.open_keys.index(key)
+        del self.open_keys[i], self.open_fio[i], self.open_addr[i]
+
+    def reopen_all(self, paired: set) -> None:
+        """Открытые = все утренние, кроме paired."""
+        self.open_keys = [k for k in self.morning if k not in paired]
+        self.open_fio = [self.morning[k]['fio'] for k in self.open_keys]
+        self.open_addr = [self.morning[k]['addr'] for k in self.open_keys]
+
+
+class OnlineMatcher:
+    """
+    Онлайн-сопоставление для опроса и /ingest.
+
+    Для каждой даты держится индекс «открытых» утренних анкет (без пары) с готовыми
+    fio/addr. Новая вечерняя анкета сравнивается только с открытыми анкетами своей даты
+    (score_matrix из data_processor — та же формула, что у пакетного сопоставления)
+    и сразу получает лучшую пару выше MATCH_THRESHOLD, так что цена отчёта не зависит
+    от размера листа. Жадный выбор может ошибиться, когда анкеты приходят не по порядку,
+    поэтому reoptimize() пересчитывает венгерским алгоритмом даты, где были новые решения:
+    вечерние анкеты, получившие пару только теперь, дают отчёты. Пары, по которым отчёт
+    уже выдан, закреплены: их анкеты в пересчёт не входят и чужую пару не получат.
+
+    Дата загружается из снимков листов при первой вечерней анкете за неё: прежние
+    вечерние анкеты этой даты сопоставляются сразу и считаются уже обработанными.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.config = processor.config
+        self.days = {}  # дата -> DayState
+
+    def __len__(self):
+        return len(self.days)
+
+    def _load_day(self, day: date, morning, evening, skip_keys: set) -> DayState:
+        state = self.days[day] = DayState()
+        for key, row in _keyed_rows(morning.on_date(day), self.config.MORNING_COLUMNS['timestamp']):
+            state.add_morning(key, row)
+        if evening is not None:
+            for key, row in _keyed_rows(evening.on_date(day), self.config.EVENING_COLUMNS['timestamp']):
+                if key not in skip_keys:
+                    state.evening[key] = row
+                    state.reported.add(key)  # анкеты до запуска матчера — уже обработаны опросом
+        self._assign(state, emit=False)
+        return state
+
+    def match(self, new_morning, new_evening, morning, evening=None) -> list:
+        """
+        Учитывает новые строки снимков (утро и вечер) и возвращает отчёты по вечерним анкетам,
+        получившим пару. morning/evening — снимки листов (SheetSnapshot) для загрузки дат.
+        """
+        for key, row in _keyed_rows(new_morning, self.config.MORNING_COLUMNS['timestamp']):
+            state = self.days.get(row['date'])
+            if state is not None:  # не загруженные даты подтянутся целиком из снимка
+                state.add_morning(key, row)
+
+        reports = []
+        evening_rows = _keyed_rows(new_evening, self.config.EVENING_COLUMNS['timestamp'])
+        skip = {key for key, _ in evening_rows}
+        for key, row in evening_rows:
+            day = row['date']
+            if day != day:  # NaT
+                continue
+            state = self.days.get(day) or self._load_day(day, morning, evening, skip)
+            if key in state.evening:
+                continue
+            state.evening[key] = row
+            state.dirty = True
+            if not state.open_keys:
+                continue
+            scores = score_matrix(state.open_fio, state.open_addr, [row['fio']], [row['addr']])[:, 0]
+            best = int(scores.argmax())
+            if scores[best] < MATCH_THRESHOLD:
+                continue  # ждёт утреннюю анкету или переоптимизации
+            morning_key = state.open_keys[best]
+            state.close(morning_key)
+            state.pairs[key] = morning_key
+            report = self._report(state, key)
+            if report is not None:
+                reports.append(report)
+        return reports
+
+    def _report(self, state: DayState, evening_key):
+        state.reported.add(evening_key)
+        return self.processor.build_report(state.morning[state.pairs[evening_key]], state.evening[evening_key])
+
+    def _assign(self, state: DayState, emit: bool = True) -> list:
+        """
+        Оптимальные пары за дату (венгерский алгоритм) среди анкет, ещё не давших отчёт;
+        пары выданных отчётов сохраняются. Отчёты — по вечерним, получившим пару впервые.
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        state.dirty = False
+        pairs = {e: m for e, m in state.pairs.items() if e in state.reported}
+        used = set(pairs.values())
+        m_keys = [k for k in state.morning if k not in used]
+        e_keys = [k for k in state.evening if k not in pairs]
+        if m_keys and e_keys:
+            scores = score_matrix(
+                [state.morning[k]['fio'] for k in m_keys], [state.morning[k]['addr'] for k in m_keys],
+                [state.evening[k]['fio'] for k in e_keys], [state.evening[k]['addr'] for k in e_keys],
+            )
+            row_ind, col_ind = linear_sum_assignment(1.0 - scores)
+            for i, j in zip(row_ind, col_ind):
+                if scores[i, j] >= MATCH_THRESHOLD:
+                    pairs[e_keys[j]] = m_keys[i]
+        state.pairs = pairs
+        state.reopen_all(set(pairs.values()))
+
+        reports = []
+        for evening_key in pairs:
+            if evening_key in state.reported:
+                continue
+            if not emit:
+                state.reported.add(evening_key)
+                continue
+            report = self._report(state, evening_key)
+            if report is not None:
+                reports.append(report)
+        return reports
+
+    def reoptimize(self) -> list:
+        """Пересчитывает даты с новыми жадными решениями; возвращает отчёты по новым парам."""
+        reports = []
+        for day, state in sorted(self.days.items()):
+            if state.dirty:
+                reports.extend(self._assign(state))
+        if reports:
+            logger.info(f"Переоптимизация: {len(reports)} новых пар")
+        return reports
+
+    def prune(self, keep_from: date) -> None:
+        for day in [d for d in self.days if d < keep_from]:
+            del self.days[day]
@@ -0,0 +1,176 @@
+# projects.py — несколько проектов (брендов/регионов) в одном процессе
+#
+# Каждый проект — своя пара утренней/вечерней таблицы, карта колонок, список сыров и чат.
+# Все проекты опрашиваются общим пулом потоков и используют один GoogleSheetsService
+# (одна авторизация Google) и один UltimateTelegramBot (одно соединение с Bot API).
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Настройки, которые проект может переопределить; остальные берутся из Config
+PROJECT_KEYS = (
+    "MORNING_SHEET_ID", "EVENING_SHEET_ID", "MORNING_SHEET_NAME", "EVENING_SHEET_NAME",
+    "MORNING_COLUMNS", "EVENING_COLUMNS", "CHEESE_TYPES", "CHAT_ID", "TARGET_CONVERSION",
+)
+
+
+class ProjectConfig(Config):
+    """Config одного проекта: значения из описания проекта поверх общих настроек."""
+
+    def __init__(self, name: str, **overrides):
+        unknown = [key for key in overrides if key not in PROJECT_KEYS]
+        if unknown:
+            raise ValueError(f"Проект '{name}': неизвестные настройки {unknown}")
+        self.PROJECT_NAME = name
+        for key, value in overrides.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return f"ProjectConfig({self.PROJECT_NAME!r})"
+
+
+def load_projects(path: str | None = None) -> list[ProjectConfig]:
+    """
+    Читает реестр проектов из JSON-файла (PROJECTS_FILE): список объектов
+    {"name": ..., "MORNING_SHEET_ID": ..., ...}. Без файла — один проект из Config.
+    """
+    path = path or Config.PROJECTS_FILE
+    if not path:
+        return [ProjectConfig(Config.PROJECT_NAME)]
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    projects = []
+    for entry in entries:
+        entry = dict(entry)
+        name = entry.pop("name", None)
+        if not name:
+            raise ValueError(f"{path}: у проекта не указано поле 'name'")
+        projects.append(ProjectConfig(name, **entry))
+
+    names = [p.PROJECT_NAME for p in projects]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: имена проектов повторяются: {names}")
+    logger.info(f"Загружено проектов: {len(projects)} ({', '.join(names)})")
+    return projects
+
+
+class ProjectRunner:
+    """
+    Опрашивает все проекты пулом из max_workers потоков. У каждого проекта свой
+    DegustationAnalyzer (счётчики дня и processed_pairs), сервисы — общие.
+    """
+
+    def __init__(self, projects: list[ProjectConfig], max_workers: int | None = None,
+                 sheets_service=None, telegram_bot=None):
+        from main import DegustationAnalyzer
+
+        self.projects = projects
+        self.max_workers = max_workers or Config.PROJECT_WORKERS
+        self.sheets_service = sheets_service or self._create_sheets_service(projects)
+        if telegram_bot is None:
+            from telegram_bot import UltimateTelegramBot
+            telegram_bot = UltimateTelegramBot()
+        self.telegram_bot = telegram_bot
+        # Меню статистики бота читает итоги тех же проектов, что опрашивают анализаторы
+        self.telegram_bot.projects = projects
+        self.analyzers = {
+            project.PROJECT_NAME: DegustationAnalyzer(
+                config=project, sheets_service=self.sheets_service, telegram_bot=self.telegram_bot
+            )
+            for project in projects
+        }
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="project")
+
+    @staticmethod
+    def _create_sheets_service(projects):
+        from google_sheets import GoogleSheetsService
+        from sheets_backend import create_backend
+
+        if Config.SHEETS_BACKEND == "fake":
+            # У каждого проекта своя пара таблиц — нужен генератор на каждую
+            from fake_backends import FakeProjectsBackend
+            return GoogleSheetsService(FakeProjectsBackend.from_env(projects))
+        return GoogleSheetsService(create_backend(Config.SHEETS_BACKEND, Config()))
+
+    def _run_all(self, method: str) -> dict:
+        """Вызывает метод анализатора для каждого проекта в пуле, ждёт завершения всех и возвращает {проект: итог}."""
+        started = time.perf_counter()
+        futures = {
+            name: self._executor.submit(getattr(analyzer, method))
+            for name, analyzer in self.analyzers.items()
+        }
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Проект '{name}': ошибка в {method}: {e}", exc_info=True)
+                results[name] = None
+        logger.info(
+            f"{method}: {len(futures)} проектов за {time.perf_counter() - started:.1f} с "
+            f"(потоков: {self.max_workers})"
+        )
+        return results
+
+    def check_all(self) -> dict:
+        return self._run_all("check_for_new_reports")
+
+    def summary_all(self) -> dict:
+        return self._run_all("generate_daily_summary")
+
+    def analyzer_for(self, project: str | None = None, sheet_id: str | None = None):
+        """
+        Анализатор проекта по имени или по ID его утренней/вечерней таблицы; при одном
+        проекте — он. ValueError, если проект не найден или проектов несколько, а не указано ни то ни другое.
+        """
+        if project:
+            if project not in self.analyzers:
+                raise ValueError(f"неизвестный проект '{project}' (есть: {', '.join(self.analyzers)})")
+            return self.analyzers[project]
+        if sheet_id:
+            for analyzer in self.analyzers.values():
+                if sheet_id in (analyzer.config.MORNING_SHEET_ID, analyzer.config.EVENING_SHEET_ID):
+                    return analyzer
+            raise ValueError(f"таблица {sheet_id} не относится ни к одному проекту")
+        if len(self.analyzers) == 1:
+            return next(iter(self.analyzers.values()))
+        raise ValueError(f"проектов несколько ({', '.join(self.analyzers)}) — укажите project или sheet_id")
+
+    def flush_dashboards(self) -> None:
+        for analyzer in self.analyzers.values():
+            if analyzer.dashboard is not None:
+                analyzer.flush_dashboard()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def run_scheduler(self):
+        import schedule
+
+        # С push-приёмом (/ingest) опрос листов — только редкая сверка, как у DegustationAnalyzer
+        check_interval = Config.RECONCILE_INTERVAL if Config.INGEST_TOKEN else Config.CHECK_INTERVAL
+        schedule.every(check_interval).minutes.do(self.check_all)
+        schedule.every().day.at(Config.END_OF_DAY_TIME).do(self.summary_all)
+        if Config.LIVE_DASHBOARD:
+            schedule.every(Config.DASHBOARD_EDIT_INTERVAL).seconds.do(self.flush_dashboards)
+
+        logger.info(f"СИСТЕМА ЗАПУЩЕНА! Проектов: {len(self.projects)}, потоков опроса: {self.max_workers}")
+        logger.info(f"Проверка новых отчётов: каждые {check_interval} минут")
+        logger.info(f"Сводный отчёт: ежедневно в {Config.END_OF_DAY_TIME}")
+
+        try:
+            while True:
+                schedule.run_pending()
+                # До ближайшей задачи, но не дольше минуты: дашборд правится чаще раза в минуту
+                time.sleep(min(60, max(1, schedule.idle_seconds() or 0)))
+        finally:
+            self.shutdown()
@@ -0,0 +1,98 @@
+# report_events.py — оповещение о новых сопоставленных отчётах внутри процесса
+#
+# DegustationAnalyzer публикует сюда каждую порцию новых отчётов, а кэши и агрегаты
+# бота подписываются и обновляются без пересчёта с нуля.
+
+import logging
+import threading
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+_subscribers = []
+
+
+def report_key(report) -> str:
+    """Ключ отчёта для защиты от повторов: дата, город, сотрудник и адрес."""
+    return report.get('key') or (
+        f"{report['date']}_{report['city']}_{report['employee']}_{report['normalized_address']}"
+    )
+
+
+def report_month(report) -> tuple[int, int]:
+    """(год, месяц) даты отчёта 'ДД.ММ.ГГГГ'."""
+    _, month, year = report['date'].split('.')
+    return int(year), int(month)
+
+
+def subscribe(callback):
+    """Регистрирует callback(reports: list[dict]); повторная регистрация игнорируется."""
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+    return callback
+
+
+def publish(reports):
+    """Передаёт новые отчёты всем подписчикам. Ошибка подписчика не мешает остальным."""
+    if not reports:
+        return
+    for callback in list(_subscribers):
+        try:
+            callback(reports)
+        except Exception as e:
+            logger.error(f"Ошибка подписчика {callback!r} при обработке новых отчётов: {e}", exc_info=True)
+
+
+class ReportAggregate:
+    """
+    База для агрегатов бота, которые пополняются через report_events и свёрткой истории
+    (aggregates.HistoryFeed). Повторный учёт отчёта отсекается по report_key, но ключи
+    хранятся только для открытых месяцев: месяц, целиком свёрнутый из истории и закончившийся
+    больше GRACE_DAYS дней назад, закрывается — остаётся водяной знак sealed (год, месяц),
+    ключи месяца отбрасываются, а отчёты закрытых месяцев больше не принимаются. Поэтому
+    память на защиту от повторов не растёт с историей. Наследник реализует _add(report).
+    """
+
+    # Сколько дней после конца месяца ещё могут прийти его отчёты (поздние анкеты, пересчёт дат)
+    GRACE_DAYS = 2
+
+    def __init__(self):
+        self.sealed = None  # (год, месяц) последнего закрытого месяца
+        self._keys = {}  # (год, месяц) -> ключи учтённых отчётов открытого месяца
+        self._lock = threading.Lock()
+
+    def _add(self, report) -> None:
+        raise NotImplementedError
+
+    def add_reports(self, reports) -> int:
+        """Учитывает отчёты, которых ещё не было; возвращает число новых."""
+        added = 0
+        with self._lock:
+            for report in reports:
+                month = report_month(report)
+                if self.sealed is not None and month <= self.sealed:
+                    continue
+                keys = self._keys.setdefault(month, set())
+                key = report_key(report)
+                if key in keys:
+                    continue
+                keys.add(key)
+                self._add(report)
+                added += 1
+        return added
+
+    def seal_month(self, month: tuple[int, int]) -> bool:
+        """
+        Закрывает месяц, свёрнутый из истории целиком (и все до него), если он кончился
+        больше GRACE_DAYS дней назад; возвращает, закрыт ли он.
+        """
+        year, number = month
+        next_month = date(year + number // 12, number % 12 + 1, 1)
+        if date.today() < next_month + timedelta(days=self.GRACE_DAYS):
+            return False
+        with self._lock:
+            if self.sealed is None or month > self.sealed:
+                self.sealed = month
+            for open_month in [m for m in self._keys if m <= self.sealed]:
+                del self._keys[open_month]
+        return True
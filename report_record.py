@@ -0,0 +1,122 @@
+# report_record.py — компактная запись детального отчёта вместо вложенных словарей
+
+from array import array
+from collections.abc import Mapping
+
+# Поля отчёта, доступные как report['поле'] (cheese_data собирается из массива остатков)
+FIELDS = (
+    'date', 'city', 'network', 'employee', 'visitors',
+    'total_sales', 'efficiency', 'normalized_address', 'key',
+)
+_FIELD_SET = frozenset(FIELDS)
+
+
+class CheeseData(Mapping):
+    """Представление остатков отчёта в старом виде: {сыр: {'start', 'end', 'sold'}}."""
+
+    __slots__ = ('_report',)
+
+    def __init__(self, report):
+        self._report = report
+
+    def __getitem__(self, cheese):
+        report = self._report
+        try:
+            i = report.cheese_types.index(cheese)
+        except ValueError:
+            raise KeyError(cheese) from None
+        n = len(report.cheese_types)
+        stock = report.stock
+        return {'start': stock[i], 'end': stock[n + i], 'sold': stock[2 * n + i]}
+
+    def __iter__(self):
+        return iter(self._report.cheese_types)
+
+    def __len__(self):
+        return len(self._report.cheese_types)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class DetailedReport(Mapping):
+    """
+    Детальный отчёт по одной дегустации.
+
+    Скалярные поля лежат в __slots__, остатки по сырам — в одном array('i')
+    [начало..., конец..., продано...] в порядке cheese_types (общий кортеж для всех
+    отчётов проекта). Чтение report['поле'], report.get(), report['cheese_data'].items()
+    работает как у прежнего словаря, поэтому форматтеры не меняются; циклы агрегации
+    читают атрибуты и sold_items() напрямую.
+    """
+
+    __slots__ = FIELDS + ('cheese_types', 'stock', 'submitted_at', 'flags')
+
+    def __init__(self, date, city, network, employee, visitors, total_sales, efficiency,
+                 normalized_address, cheese_types, start, end, sold, key=None, submitted_at=None, flags=()):
+        self.date = date
+        self.city = city
+        self.network = network
+        self.employee = employee
+        self.visitors = visitors
+        self.total_sales = total_sales
+        self.efficiency = efficiency
+        self.normalized_address = normalized_address
+        self.key = key
+        self.submitted_at = submitted_at  # Timestamp вечерней анкеты (datetime) — для latency.py
+        self.flags = flags  # коды пометок проверки данных (validation.FLAGS)
+        self.cheese_types = cheese_types
+        self.stock = array('i', start)
+        self.stock.extend(end)
+        self.stock.extend(sold)
+
+    @classmethod
+    def from_dict(cls, data: dict, cheese_types: tuple | None = None) -> "DetailedReport":
+        """Отчёт из словаря прежнего формата (например, из JSON backfill)."""
+        cheese_data = data['cheese_data']
+        cheese_types = cheese_types or tuple(cheese_data)
+        return cls(
+            date=data['date'], city=data['city'], network=data['network'], employee=data['employee'],
+            visitors=data['visitors'], total_sales=data['total_sales'], efficiency=data['efficiency'],
+            normalized_address=data['normalized_address'], cheese_types=cheese_types,
+            start=[cheese_data[c]['start'] for c in cheese_types],
+            end=[cheese_data[c]['end'] for c in cheese_types],
+            sold=[cheese_data[c]['sold'] for c in cheese_types],
+            key=data.get('key'),
+        )
+
+    # ===================== ДОСТУП КАК К СЛОВАРЮ =====================
+    def __getitem__(self, name):
+        if name == 'cheese_data':
+            return CheeseData(self)
+        if name not in _FIELD_SET or (name == 'key' and self.key is None):
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        if name not in _FIELD_SET:
+            raise KeyError(f"У отчёта нет поля '{name}'")
+        setattr(self, name, value)
+
+    def __iter__(self):
+        for name in FIELDS:
+            if name != 'key' or self.key is not None:
+                yield name
+        yield 'cheese_data'
+
+    def __len__(self):
+        return len(FIELDS) + (0 if self.key is None else 1)
+
+    def __repr__(self):
+        return f"DetailedReport({self.date} | {self.city} | {self.employee} | {self.total_sales} шт.)"
+
+    # ===================== БЫСТРЫЙ ДОСТУП =====================
+    def sold_items(self):
+        """Пары (сыр, продано) без промежуточных словарей."""
+        n = len(self.cheese_types)
+        return zip(self.cheese_types, self.stock[2 * n:])
+
+    def to_dict(self) -> dict:
+        data = {name: self[name] for name in self if name != 'cheese_data'}
+        data['cheese_data'] = dict(self['cheese_data'].items())
+        return data
@@ -0,0 +1,106 @@
+# response_cache.py — кэш готового текста экранов статистики бота
+
+import threading
+import time
+from collections import OrderedDict
+
+import report_events
+from config import Config
+from shared_state import SharedState
+
+
+class RenderCache:
+    """
+    LRU-кэш готовых HTML-сообщений с ключом (экран, параметры, версия данных).
+
+    Версия увеличивается при каждой порции новых сопоставленных отчётов — все старые
+    записи сразу становятся недействительными. TTL страхует случай, когда бот работает
+    без DegustationAnalyzer в том же процессе и некому сообщить о новых данных.
+
+    С общим хранилищем (state) версия и готовые тексты общие для воркеров: экран,
+    посчитанный одним воркером, другой берёт из хранилища, а новые отчёты в любом
+    воркере сбрасывают кэш у всех.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 600.0, state: SharedState | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.state = state
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (created_at, text)
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self.state.get_int("render:version") if self.state is not None else self._version
+
+    @staticmethod
+    def _shared_key(key) -> str:
+        return f"render:{key[2]}:{key[0]}:{key[1]!r}"
+
+    def get(self, screen: str, params: tuple, version: int) -> str | None:
+        key = (screen, params, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        text = self.state.get_obj(self._shared_key(key)) if self.state is not None else None
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries[key] = (time.monotonic(), text)
+            self.hits += 1
+            return text
+
+    def put(self, screen: str, params: tuple, version: int, text: str) -> None:
+        with self._lock:
+            if version != self.version:
+                return  # данные обновились, пока экран считался
+            key = (screen, params, version)
+            self._entries[key] = (time.monotonic(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        if self.state is not None:
+            self.state.set_obj(self._shared_key(key), text, ttl=self.ttl)
+
+    def invalidate(self, reports=None) -> None:
+        """Сбрасывает кэш; подписан на report_events, поэтому принимает порцию отчётов."""
+        with self._lock:
+            if self.state is not None:
+                self.state.incr("render:version")
+            else:
+                self._version += 1
+            self._entries.clear()
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """Кэш процесса; создаётся при первом обращении, а не при импорте (хранилище — файл SQLite или Redis)."""
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                from shared_state import get_shared_state
+
+                _render_cache = RenderCache(
+                    maxsize=Config.RENDER_CACHE_SIZE, ttl=Config.RENDER_CACHE_TTL, state=get_shared_state()
+                )
+    return _render_cache
+
+
+def _invalidate(reports=None) -> None:
+    get_render_cache().invalidate(reports)
+
+
+report_events.subscribe(_invalidate)
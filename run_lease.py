@@ -0,0 +1,86 @@
+# run_lease.py — аренда «один исполнитель»: опрос и сводку одновременно выполняет только один процесс
+
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+from datetime import datetime
+
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+
+class RunLease:
+    """
+    Аренда задачи на строке общего хранилища (shared_state.py): ключ lease:<имя> занимается
+    атомарным add с TTL, поэтому из планировщика, /trigger-check и перекрывающихся запусков
+    GitHub Actions работу делает только первый. Упавший исполнитель держит аренду не дольше ttl.
+    Итог последнего запуска хранится рядом — его получают те, кому аренда не досталась.
+    """
+
+    def __init__(self, name: str, state: SharedState, ttl: float = 600.0):
+        self.name = name
+        self.state = state
+        self.ttl = ttl
+        self._key = f"lease:{name}"
+        self._token = None
+
+    @staticmethod
+    def _owner() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+    def acquire(self) -> bool:
+        holder = {'owner': self._owner(), 'started_at': datetime.now().isoformat(timespec='seconds')}
+        token = pickle.dumps(holder)
+        if not self.state.add(self._key, token, ttl=self.ttl):
+            return False
+        self._token = token
+        return True
+
+    def release(self, result: dict) -> None:
+        """Снимает аренду (если она ещё наша) и запоминает итог запуска."""
+        self.state.set_obj(f"{self._key}:last", result)
+        if self._token is not None and self.state.get(self._key) == self._token:
+            self.state.delete(self._key)
+        self._token = None
+
+    def holder(self) -> dict | None:
+        """Кто и с какого времени держит аренду."""
+        data = self.state.get(self._key)
+        return pickle.loads(data) if data is not None else None
+
+    def last_result(self) -> dict | None:
+        return self.state.get_obj(f"{self._key}:last")
+
+
+def run_exclusive(lease: RunLease, func) -> dict:
+    """
+    Выполняет func() под арендой. Если аренду держит другой исполнитель — сразу возвращает
+    {'status': 'already_running', 'running': кто держит, 'last': итог прошлого запуска}.
+    Иначе — {'status': 'ok' | 'error', 'finished_at', 'elapsed', 'result': что вернула func}.
+    """
+    if not lease.acquire():
+        running = lease.holder()
+        last = lease.last_result()
+        logger.info(
+            f"{lease.name}: уже выполняется ({running['owner'] if running else '—'}), "
+            f"последний итог: {last['finished_at'] if last else '—'}"
+        )
+        return {'status': 'already_running', 'running': running, 'last': last}
+
+    started = time.perf_counter()
+    record = {'status': 'error', 'result': None}
+    try:
+        record['result'] = func()
+        record['status'] = 'ok'
+    finally:
+        elapsed = time.perf_counter() - started
+        record['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        record['elapsed'] = round(elapsed, 1)
+        if elapsed > lease.ttl:
+            logger.warning(f"{lease.name}: запуск шёл {elapsed:.0f} с — дольше аренды ({lease.ttl:.0f} с)")
+        lease.release(record)
+    return record
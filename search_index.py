@@ -0,0 +1,123 @@
+# search_index.py — поиск магазинов и промоутеров по триграммам для inline-режима бота
+
+import re
+from collections import Counter
+from datetime import datetime
+
+import report_events
+from aggregates import history_feed
+
+# Что ищем: вид -> поле отчёта
+KINDS = {
+    "store": "normalized_address",
+    "employee": "employee",
+}
+
+
+def normalize(text) -> str:
+    """Строка для индекса и запроса: нижний регистр, ё→е, только буквы и цифры через пробел."""
+    text = str(text).lower().replace("ё", "е")
+    return " ".join(re.findall(r"[\w]+", text))
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Триграммы слов с отступом в начале: «  а», « ар», «арб»... Отступ делает
+    короткие запросы поиском по началу слова: «ар» находит «Арбат», но не «Варшавское».
+    """
+    result = set()
+    for word in text.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """
+    Индекс строк по триграммам: триграмма -> множество id документов.
+    Поиск считает общие триграммы только у документов из списков триграмм запроса
+    и ранжирует по коэффициенту Дайса; полное совпадение начала строки — выше.
+    """
+
+    def __init__(self):
+        self._postings = {}  # триграмма -> set(id)
+        self._texts = []  # id -> нормализованный текст
+        self._sizes = []  # id -> число триграмм
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, text: str) -> int:
+        """Добавляет строку и возвращает её id (порядковый номер)."""
+        doc_id = len(self._texts)
+        norm = normalize(text)
+        grams = trigrams(norm)
+        self._texts.append(norm)
+        self._sizes.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(doc_id)
+        return doc_id
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[int, float]]:
+        """[(id, оценка 0..1)] по убыванию оценки; пустой запрос — пустой список."""
+        norm = normalize(query)
+        grams = trigrams(norm)
+        if not grams:
+            return []
+        common = Counter()
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings:
+                common.update(postings)
+        if not common:
+            return []
+
+        # Совпадение меньше трети триграмм запроса — шум, а не опечатка
+        min_common = max(1, len(grams) // 3)
+        scored = []
+        for doc_id, shared in common.items():
+            if shared < min_common:
+                continue
+            score = 2 * shared / (len(grams) + self._sizes[doc_id])
+            if self._texts[doc_id].startswith(norm) or f" {norm}" in self._texts[doc_id]:
+                score += 0.5
+            scored.append((doc_id, min(1.0, score)))
+        scored.sort(key=lambda item: (-item[1], self._texts[item[0]]))
+        return scored[:limit]
+
+
+class SearchIndex(report_events.ReportAggregate):
+    """
+    Магазины (адреса) и промоутеры из сопоставленных отчётов с последним отчётом каждого.
+    Пополняется через report_events; история — из общего прохода aggregates.history_feed,
+    как у trends.py и leaderboard.py.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.index = TrigramIndex()
+        self._entries = []  # id -> [вид, имя, дата последнего отчёта, отчёт]
+        self._ids = {}  # (вид, имя) -> id
+
+    def _add(self, report) -> None:
+        day = datetime.strptime(report.date, '%d.%m.%Y').date()
+        for kind, field in KINDS.items():
+            name = str(getattr(report, field))
+            doc_id = self._ids.get((kind, name))
+            if doc_id is None:
+                doc_id = self._ids[(kind, name)] = self.index.add(name)
+                self._entries.append([kind, name, day, report])
+                continue
+            entry = self._entries[doc_id]
+            if day >= entry[2]:
+                entry[2], entry[3] = day, report
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, str, object]]:
+        """[(вид, имя, последний отчёт)] по убыванию релевантности."""
+        with self._lock:
+            return [tuple(self._entries[doc_id][i] for i in (0, 1, 3)) for doc_id, _ in self.index.search(query, limit)]
+
+
+search_index = SearchIndex()
+history_feed.register(search_index)
+report_events.subscribe(search_index.add_reports)
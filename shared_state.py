@@ -0,0 +1,260 @@
+# shared_state.py — общее состояние процессов на одной машине: снимки листов, ключи отчётов, кэш экранов
+
+import logging
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
+# redis подключается только при SHARED_STATE=redis
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState:
+    """
+    Интерфейс хранилища «ключ -> байты» с временем жизни, общего для воркеров webhook
+    и анализатора. Реализация даёт get/set/add/incr/delete; add — атомарное «записать,
+    если ключа нет», на нём держатся защита от повторных отчётов и блокировки.
+    """
+
+    name = "base"
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: bytes = b"1", ttl: float | None = None) -> bool:
+        """Записывает значение, только если ключа нет (или он истёк); True — записали мы."""
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    # ===================== ОБЪЕКТЫ И БЛОКИРОВКИ =====================
+    def get_obj(self, key: str):
+        data = self.get(key)
+        return None if data is None else pickle.loads(data)
+
+    def set_obj(self, key: str, obj, ttl: float | None = None) -> None:
+        self.set(key, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+
+    def get_int(self, key: str) -> int:
+        data = self.get(key)
+        return int(data) if data is not None else 0
+
+    @contextmanager
+    def lock(self, key: str, ttl: float = 60.0, timeout: float = 30.0):
+        """
+        Блокировка между процессами на add(): ждёт до timeout секунд, потом работает без неё
+        (лучше лишнее чтение листа, чем зависший экран). ttl снимает блокировку упавшего воркера.
+        """
+        token = os.urandom(8)
+        deadline = time.monotonic() + timeout
+        acquired = self.add(f"lock:{key}", token, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.05)
+            acquired = self.add(f"lock:{key}", token, ttl)
+        if not acquired:
+            logger.warning(f"Блокировка {key} не получена за {timeout:.0f} с — продолжаем без неё")
+        try:
+            yield acquired
+        finally:
+            if acquired and self.get(f"lock:{key}") == token:
+                self.delete(f"lock:{key}")
+
+
+class MemoryState(SharedState):
+    """Словарь в памяти процесса: один воркер и тесты. Объекты хранятся как есть, без pickle."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data = {}  # ключ -> (значение, истекает в monotonic или None)
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _expires(self, ttl):
+        return time.monotonic() + ttl if ttl else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, self._expires(ttl))
+
+    def add(self, key, value=b"1", ttl=None):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._data[key] = (value, self._expires(ttl))
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry is not None else 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def get_obj(self, key):
+        return self.get(key)
+
+    def set_obj(self, key, obj, ttl=None):
+        self.set(key, obj, ttl)
+
+
+class SQLiteState(SharedState):
+    """
+    Файл SQLite в режиме WAL: читатели не ждут писателя, воркеры на одной машине видят
+    одни и те же данные без отдельного сервера. Соединение — своё у каждого потока.
+    """
+
+    name = "sqlite"
+
+    # Раз в столько записей удаляются истёкшие ключи
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+        logger.info(f"Общее состояние: SQLite {path} (WAL)")
+
+    def _connect(self):
+        import sqlite3
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)", (key, time.time())
+        ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def set(self, key, value, ttl=None):
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, self._expires(ttl)))
+
+    def add(self, key, value=b"1", ttl=None):
+        with self._write() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at < ?", (key, time.time()))
+            cursor = conn.execute("INSERT OR IGNORE INTO kv VALUES (?, ?, ?)", (key, value, self._expires(ttl)))
+            return cursor.rowcount == 1
+
+    def incr(self, key):
+        with self._write() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row is not None else 1
+            conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, NULL)", (key, str(value).encode()))
+        return value
+
+    def delete(self, key):
+        with self._write() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+
+class RedisState(SharedState):
+    """Redis — когда воркеры на разных машинах или уже есть Redis (нужен пакет redis)."""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        logger.info(f"Общее состояние: Redis {url.rsplit('@', 1)[-1]}")
+
+    @staticmethod
+    def _px(ttl):
+        return int(ttl * 1000) if ttl else None
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, px=self._px(ttl))
+
+    def add(self, key, value=b"1", ttl=None):
+        return bool(self.client.set(key, value, px=self._px(ttl), nx=True))
+
+    def incr(self, key):
+        return int(self.client.incr(key))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+def create_state(name: str, config) -> SharedState:
+    """Создаёт хранилище по имени из Config.SHARED_STATE."""
+    if name == "memory":
+        return MemoryState()
+    if name == "sqlite":
+        return SQLiteState(config.SHARED_STATE_PATH)
+    if name == "redis":
+        return RedisState(config.REDIS_URL)
+    raise ValueError(f"Неизвестный SHARED_STATE: {name}")
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """Хранилище процесса; создаётся при первом обращении, а не при импорте."""
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                from config import Config
+
+                _state = create_state(Config.SHARED_STATE, Config)
+    return _state
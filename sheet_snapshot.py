@@ -0,0 +1,193 @@
+# sheet_snapshot.py — типизированный снимок листа: всё, что потребители раньше разбирали сами, считается один раз
+
+from __future__ import annotations
+
+import logging
+import time
+from datetime import date, datetime
+from typing import TYPE_CHECKING
+
+from data_processor import form_columns, is_unparsed_stock, norm_address, norm_fio, parse_stock
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Форматы, в которых Google Forms пишет Timestamp и поле даты
+FORM_TIMESTAMP_FORMAT = "%m/%d/%Y %H:%M:%S"
+FORM_DATE_FORMAT = "%m/%d/%Y"
+
+# Колонки с повторяющимися значениями — храним как category
+CATEGORY_KEYS = ("city", "network_name", "employee_name")
+
+
+def parse_form_dates(values, fmt: str = FORM_DATE_FORMAT) -> "pd.Series":
+    """Векторный разбор дат в фиксированном формате; нераспознанное пробуем без формата."""
+    import pandas as pd
+
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+    missing = parsed.isna() & values.notna() & (values.astype(str).str.strip() != "")
+    if missing.any():
+        # Ручной ввод вроде 31.10.2025 14:00 — редкость, разбираем только эти строки
+        parsed[missing] = pd.to_datetime(values[missing], dayfirst=True, errors='coerce', format='mixed')
+    return parsed
+
+
+def form_row(values: dict, columns: dict) -> dict:
+    """
+    Одна строка анкеты из JSON (например, e.namedValues из onFormSubmit): значения-списки
+    сворачиваются в первый элемент, лишние поля отбрасываются. ValueError — если не хватает колонок.
+    """
+    row = {}
+    missing = []
+    for col in form_columns(columns):
+        value = values.get(col)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is None or (isinstance(value, str) and not value.strip()):
+            missing.append(col)
+        row[col] = value.strip() if isinstance(value, str) else value
+    if missing:
+        raise ValueError(f"не заполнены колонки: {', '.join(missing)}")
+
+    import pandas as pd
+
+    if parse_form_dates(pd.Series([row[columns["date"]]])).isna().iloc[0]:
+        raise ValueError(f"не распознана дата '{row[columns['date']]}' в колонке '{columns['date']}'")
+    return row
+
+
+def _map_unique(series, func):
+    """Применяет func к каждому уникальному значению один раз (в листах много повторов)."""
+    uniques = series.drop_duplicates()
+    return series.map(dict(zip(uniques, (func(v) for v in uniques))))
+
+
+class SheetSnapshot:
+    """
+    Снимок листа утренних или вечерних анкет после разбора:
+
+    - колонка Timestamp — datetime64, колонка даты формы сохранена, рядом `day` (datetime64, полночь);
+    - остатки сыров и число посетителей — int32 (parse_stock, по одному разу на уникальное значение);
+    - `stock_unparsed` — в строке есть остаток текстом, который parse_stock не понял (стал нулём);
+    - город, сеть, ФИО — category;
+    - `fio` и `addr` — нормализованные ФИО и адрес для сопоставления.
+
+    Снимок общий для всех потребителей и только для чтения: фильтры возвращают новые фреймы,
+    а DataProcessor копирует вход перед изменением.
+    """
+
+    def __init__(self, frame: "pd.DataFrame", columns: dict, fetched_at: float | None = None):
+        self.frame = frame
+        self.columns = columns
+        self.fetched_at = fetched_at if fetched_at is not None else time.monotonic()
+        self._by_day = None  # день -> позиции строк
+
+    @classmethod
+    def from_frame(cls, df: "pd.DataFrame", columns: dict) -> "SheetSnapshot":
+        """Разбирает сырой DataFrame из get_sheet_data по карте колонок MORNING_/EVENING_COLUMNS."""
+        import numpy as np
+
+        started = time.perf_counter()
+        frame = df.copy()
+        if frame.empty:
+            return cls(frame, columns)
+
+        ts_col = columns.get("timestamp")
+        if ts_col in frame:
+            frame[ts_col] = parse_form_dates(frame[ts_col], FORM_TIMESTAMP_FORMAT)
+        frame["day"] = parse_form_dates(frame[columns["date"]]).dt.normalize()
+
+        numeric = list(columns.get("cheese_start", {}).values()) + list(columns.get("cheese_end", {}).values())
+        if "visitors" in columns:
+            numeric.append(columns["visitors"])
+        unparsed = np.zeros(len(frame), dtype=bool)
+        for col in numeric:
+            if col in frame:
+                unparsed |= _map_unique(frame[col], is_unparsed_stock).to_numpy(dtype=bool, na_value=False)
+                frame[col] = _map_unique(frame[col], parse_stock).astype(np.int32)
+        frame["stock_unparsed"] = unparsed
+
+        frame["fio"] = _map_unique(frame[columns["employee_name"]], norm_fio)
+        frame["addr"] = _map_unique(frame[columns["address"]], norm_address)
+
+        for key in CATEGORY_KEYS:
+            col = columns.get(key)
+            if col in frame:
+                frame[col] = frame[col].astype("category")
+
+        logger.info(f"Снимок листа: {len(frame)} строк разобрано за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return cls(frame, columns)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def empty(self) -> bool:
+        return self.frame.empty
+
+    def _day_index(self) -> dict:
+        if self._by_day is None:
+            self._by_day = {}
+            if not self.frame.empty:
+                groups = self.frame.groupby("day", sort=True).indices  # NaT отбрасывается
+                self._by_day = {day.date(): positions for day, positions in sorted(groups.items())}
+        return self._by_day
+
+    def dates(self) -> list[date]:
+        """Даты, за которые есть анкеты, по возрастанию."""
+        return list(self._day_index())
+
+    def on_date(self, day: date) -> "pd.DataFrame":
+        positions = self._day_index().get(day)
+        if positions is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[positions]
+
+    def on_dates(self, days) -> "pd.DataFrame":
+        """Строки за несколько дат одним срезом (чанк истории для aggregates.iter_all_reports)."""
+        import numpy as np
+
+        index = self._day_index()
+        positions = [index[day] for day in days if day in index]
+        if not positions:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[np.concatenate(positions)]
+
+    def append(self, rows: "pd.DataFrame") -> tuple["SheetSnapshot", "pd.DataFrame"]:
+        """
+        Новый снимок с добавленными строками (push из /ingest) без перечитывания листа.
+        Строки, которые уже есть в снимке (тот же Timestamp, ФИО и адрес), пропускаются.
+        Возвращает (снимок, разобранные добавленные строки).
+        """
+        import pandas as pd
+        from pandas.api.types import union_categoricals
+
+        added = SheetSnapshot.from_frame(rows, self.columns).frame
+        if self.frame.empty:
+            return SheetSnapshot(added, self.columns, self.fetched_at), added
+
+        ts_col = self.columns.get("timestamp")
+        keys = [c for c in (ts_col, "fio", "addr") if c in self.frame and c in added]
+        known = pd.MultiIndex.from_frame(self.frame[keys])
+        added = added[~pd.MultiIndex.from_frame(added[keys]).isin(known)]
+        if added.empty:
+            return self, added
+
+        frame = pd.concat([self.frame, added], ignore_index=True)
+        for key in CATEGORY_KEYS:
+            col = self.columns.get(key)
+            if col in frame and isinstance(self.frame[col].dtype, pd.CategoricalDtype):
+                frame[col] = union_categoricals([self.frame[col], added[col]], ignore_order=True)
+        return SheetSnapshot(frame, self.columns, self.fetched_at), added
+
+    def since(self, moment: datetime) -> "pd.DataFrame":
+        """
+        Строки с Timestamp не раньше moment (новые анкеты с прошлого опроса). Граница
+        включительно: строки той же секунды приходят повторно, их отсеивают ключи анкет.
+        """
+        ts_col = self.columns.get("timestamp")
+        if self.frame.empty or ts_col not in self.frame:
+            return self.frame
+        return self.frame[self.frame[ts_col] >= moment]
@@ -0,0 +1,137 @@
+import logging
+import threading
+from datetime import datetime
+
+# gspread и google-auth подключаются только при первом обращении к GspreadBackend
+
+logger = logging.getLogger(__name__)
+
+
+class SheetsRateLimitError(Exception):
+    """Источник данных ответил 429 (превышена квота запросов)."""
+
+    def __init__(self, message: str = "Rate limit exceeded", retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SheetsBackend:
+    """
+    Интерфейс источника данных для GoogleSheetsService.
+    Реализация возвращает строки листа в том же виде, что и gspread.get_all_records():
+    список словарей «заголовок колонки -> значение».
+    """
+
+    name = "base"
+
+    def get_records(self, sheet_id: str, sheet_name: str) -> list[dict]:
+        raise NotImplementedError
+
+
+class GspreadBackend(SheetsBackend):
+    """Боевой источник — Google Sheets API через gspread с кэшированием клиента."""
+
+    name = "gspread"
+
+    def __init__(self, credentials: dict):
+        self.scope = [
+            'https://spreadsheets.google.com/feeds',
+            'https://www.googleapis.com/auth/drive'
+        ]
+        self.credentials = credentials
+        self._client_cache = None
+        self._client_timestamp = None
+        self._client_lock = threading.Lock()  # клиент общий для потоков ProjectRunner
+        self.CLIENT_CACHE_TTL = 300  # 5 минут (меньше срока жизни access_token ~1h)
+
+    def _get_fresh_client(self) -> "gspread.Client":
+        """Создаёт новый клиент, используя credentials из Config (локально и на Render)."""
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from google.auth.transport.requests import Request
+
+        try:
+            creds_dict = self.credentials
+
+            required_keys = ["type", "project_id", "private_key", "client_email", "client_id"]
+            missing = [k for k in required_keys if k not in creds_dict]
+            if missing:
+                raise ValueError(f"Missing required keys in credentials JSON: {missing}")
+
+            pk_preview = creds_dict.get("private_key", "")[:40].replace("\n", "\\n")
+            logger.info(f"Credentials loaded from Config. private_key preview: {pk_preview}...")
+
+            creds = Credentials.from_service_account_info(creds_dict, scopes=self.scope)
+
+            try:
+                creds.refresh(Request())
+                logger.info("Access token refreshed successfully")
+            except Exception as refresh_err:
+                logger.error(f"Token refresh failed with exception: {refresh_err}", exc_info=True)
+
+            client = gspread.authorize(creds)
+            logger.info("New Google Sheets client created successfully")
+            return client
+
+        except Exception as e:
+            logger.error(f"❌ Auth failed during client creation: {e}", exc_info=True)
+            raise
+
+    def _get_client(self) -> "gspread.Client":
+        """Возвращает кэшированный клиент или создаёт новый при истечении TTL."""
+        with self._client_lock:
+            now = datetime.now()
+            cache_expired = (
+                self._client_cache is None or
+                self._client_timestamp is None or
+                (now - self._client_timestamp).total_seconds() > self.CLIENT_CACHE_TTL
+            )
+
+            if cache_expired:
+                logger.info("Creating new Google Sheets client (cache expired or first call)")
+                self._client_cache = self._get_fresh_client()
+                self._client_timestamp = now
+
+            return self._client_cache
+
+    def get_records(self, sheet_id: str, sheet_name: str) -> list[dict]:
+        import gspread
+        from gspread.exceptions import WorksheetNotFound
+
+        client = self._get_client()
+        try:
+            sheet = client.open_by_key(sheet_id).worksheet(sheet_name)
+            return sheet.get_all_records()
+        except WorksheetNotFound:
+            available_sheets = [ws.title for ws in client.open_by_key(sheet_id).worksheets()]
+            error_msg = (
+                f"Лист '{sheet_name}' не найден в таблице с ключом {sheet_id}. "
+                f"Доступные листы: {available_sheets}"
+            )
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        except gspread.exceptions.APIError as api_error:
+            status = api_error.response.status_code
+            if status == 404:
+                logger.error(
+                    f"Ошибка 404: таблица с ключом {sheet_id} не найдена или отсутствуют права доступа."
+                )
+                raise ValueError(
+                    f"Ошибка 404: таблица с ключом {sheet_id} не найдена или отсутствуют права доступа."
+                )
+            if status == 429:
+                retry_after = api_error.response.headers.get("Retry-After")
+                raise SheetsRateLimitError(
+                    str(api_error), float(retry_after) if retry_after else None
+                ) from api_error
+            raise
+
+
+def create_backend(name: str, config) -> SheetsBackend:
+    """Создаёт источник данных по имени из Config.SHEETS_BACKEND."""
+    if name == "gspread":
+        return GspreadBackend(config.GOOGLE_CREDENTIALS)
+    if name == "fake":
+        from fake_backends import FakeSheetsBackend
+        return FakeSheetsBackend.from_env(config)
+    raise ValueError(f"Неизвестный SHEETS_BACKEND: {name}")
@@ -1,58 +1,118 @@
 # telegram_bot.py — ФИНАЛЬНЫЙ, НЕПАДАЮЩИЙ, С ЛОГАМИ С ПЕРВОЙ СЕКУНДЫ (2025)
 
+from __future__ import annotations
+
 import logging
 import asyncio
-from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-from telegram.error import TelegramError
+import threading
+import time
+from datetime import date, datetime
+from typing import TYPE_CHECKING
 from config import Config
-from google_sheets import GoogleSheetsService
-from data_processor import DataProcessor
-
-# ═══════════════════════════════════════════════════════════════
-# ВАЖНО: ПРИНУДИТЕЛЬНО ВКЛЮЧАЕМ ЛОГИРОВАНИЕ В ЭТОМ МОДУЛЕ
-# ═══════════════════════════════════════════════════════════════
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+from latency import latency_tracker
+from validation import flag_labels
 
-# Если main.py ещё не успел настроить хендлеры — делаем это сами
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s | %(name)-20s | %(levelname)-8s | %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+# python-telegram-bot, Sheets и DataProcessor подключаются при первом обращении,
+# чтобы импорт модуля не замедлял холодный старт сервиса
+if TYPE_CHECKING:
+    from telegram import Update, Bot
+    from telegram.ext import ContextTypes
+    from google_sheets import GoogleSheetsService
+    from data_processor import DataProcessor
+    from aggregates import StatsCache
 
-# ← ЭТА СТРОКА ДОЛЖНА ПОЯВИТЬСЯ СРАЗУ ПРИ ЗАПУСКЕ!
-logger.info("telegram_bot.py ЗАГРУЖЕН — ЛОГИ РАБОТАЮТ НА 100%!")
-# ═══════════════════════════════════════════════════════════════
+# Хендлеры и уровень настраивает logging_setup.setup_logging() в точке входа
+logger = logging.getLogger(__name__)
 
 
 class UltimateTelegramBot:
     def __init__(self):
         logger.info("Инициализация UltimateTelegramBot...")
         self.config = Config()
-        self.sheets = GoogleSheetsService()
-        self.processor = DataProcessor()
-        # Для фонового сервиса (main.py) сразу создаём Bot,
-        # чтобы можно было отправлять сообщения без Application/PTB.
-        if self.config.BOT_TOKEN:
-            self.bot: Bot = Bot(self.config.BOT_TOKEN)
-            logger.info("Bot-инстанс создан напрямую из BOT_TOKEN (для фонового сервиса)")
-        else:
-            self.bot: Bot = None
+        self._sheets = None
+        self._processor = None
+        self._stats = {}  # проект -> StatsCache
+        self.projects = None  # конфигурации проектов; ProjectRunner передаёт свои, иначе load_projects()
+        self._bot = None
+        self._loop = None  # фоновый event loop для отправки из синхронного кода
+        self._loop_lock = threading.Lock()
+        if not self.config.BOT_TOKEN:
             logger.error("BOT_TOKEN не задан — отправка сообщений в Telegram невозможна")
         logger.info("UltimateTelegramBot успешно инициализирован")
 
+    @property
+    def bot(self) -> Bot | None:
+        # Для фонового сервиса (main.py) Bot создаётся напрямую из BOT_TOKEN,
+        # чтобы можно было отправлять сообщения без Application/PTB — но только при первой отправке.
+        if self._bot is None and self.config.BOT_TOKEN:
+            from telegram import Bot
+            self._bot = Bot(self.config.BOT_TOKEN)
+            logger.info("Bot-инстанс создан напрямую из BOT_TOKEN (для фонового сервиса)")
+        return self._bot
+
+    @property
+    def sheets(self) -> GoogleSheetsService:
+        if self._sheets is None:
+            from google_sheets import GoogleSheetsService
+            self._sheets = GoogleSheetsService()
+        return self._sheets
+
+    @property
+    def processor(self) -> DataProcessor:
+        if self._processor is None:
+            from data_processor import DataProcessor
+            self._processor = DataProcessor()
+        return self._processor
+
+    def stats_for(self, chat_id) -> StatsCache:
+        """
+        Итоги, которые считает DegustationAnalyzer при опросе (aggregates.StatsCache); бот их только читает.
+        Читатель строится из конфигурации того же проекта, что и у анализатора: проект выбирается
+        по CHAT_ID чата, в котором нажата кнопка, иначе берётся первый проект реестра.
+        """
+        if self.projects is None:
+            from projects import load_projects
+            self.projects = load_projects()
+        project = next((p for p in self.projects if str(p.CHAT_ID) == str(chat_id)), self.projects[0])
+        cache = self._stats.get(project.PROJECT_NAME)
+        if cache is None:
+            from aggregates import StatsCache
+            from shared_state import get_shared_state
+            cache = self._stats[project.PROJECT_NAME] = StatsCache(project, get_shared_state())
+        return cache
+
     def set_bot(self, bot: Bot):
-        self.bot = bot
+        self._bot = bot
         logger.info("Бот-инстанс установлен (set_bot)")
 
-    async def send_message(self, text: str, chat_id: str = None) -> bool:
+    def run_sync(self, coro):
+        """
+        Выполняет корутину бота из синхронного кода (потоки DegustationAnalyzer/ProjectRunner).
+        Все потоки пользуются одним фоновым event loop, поэтому Bot и его пул соединений
+        общие, а не создаются заново на каждый asyncio.run().
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="telegram-sender", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def send_message_sync(self, text: str, chat_id: str = None, report=None, queued_at: float = None) -> bool:
+        return self.run_sync(self.send_message(text, chat_id=chat_id, report=report, queued_at=queued_at))
+
+    async def send_message(self, text: str, chat_id: str = None, report=None, queued_at: float = None) -> bool:
+        """
+        Отправляет сообщение в чат. Для отчёта (report — DetailedReport) пишет в latency_tracker
+        ожидание с момента опроса (queued_at, time.monotonic()) и полную задержку от анкеты.
+        """
+        from telegram.error import TelegramError
+
         if not self.bot:
             logger.error("Попытка отправки сообщения, но self.bot = None!")
             return False
 
+        if queued_at is not None:
+            latency_tracker.record("queue_wait", time.monotonic() - queued_at)
         try:
             await self.bot.send_message(
                 chat_id=chat_id or self.config.CHAT_ID,
@@ -60,7 +120,9 @@ class UltimateTelegramBot:
                 parse_mode="HTML",
                 disable_web_page_preview=True
             )
-            logger.info(f"Сообщение успешно отправлено в чат {chat_id or self.config.CHAT_ID}")
+            logger.debug("Сообщение отправлено в чат %s", chat_id or self.config.CHAT_ID)
+            if report is not None:
+                latency_tracker.record_since("delivery", report.submitted_at, f"{report.city} | {report.employee}")
             return True
         except TelegramError as e:
             logger.error(f"TelegramError при отправке: {e}", exc_info=True)
@@ -69,6 +131,54 @@ class UltimateTelegramBot:
             logger.error(f"Неизвестная ошибка при отправке сообщения: {e}", exc_info=True)
             return False
 
+    async def send_and_pin(self, text: str, chat_id: str = None) -> int | None:
+        """Отправляет сообщение и закрепляет его без уведомления. Возвращает message_id."""
+        from telegram.error import TelegramError
+
+        if not self.bot:
+            logger.error("Попытка отправки сообщения, но self.bot = None!")
+            return None
+
+        target = chat_id or self.config.CHAT_ID
+        try:
+            message = await self.bot.send_message(
+                chat_id=target, text=text, parse_mode="HTML", disable_web_page_preview=True
+            )
+        except TelegramError as e:
+            logger.error(f"TelegramError при отправке: {e}", exc_info=True)
+            return None
+        try:
+            await self.bot.pin_chat_message(
+                chat_id=target, message_id=message.message_id, disable_notification=True
+            )
+        except TelegramError as e:
+            # Без прав на закрепление сообщение всё равно обновляется на месте
+            logger.warning(f"Не удалось закрепить сообщение {message.message_id} в чате {target}: {e}")
+        return message.message_id
+
+    async def edit_message(self, message_id: int, text: str, chat_id: str = None) -> bool:
+        """Заменяет текст ранее отправленного сообщения."""
+        from telegram.error import BadRequest, TelegramError
+
+        if not self.bot:
+            logger.error("Попытка отправки сообщения, но self.bot = None!")
+            return False
+
+        try:
+            await self.bot.edit_message_text(
+                chat_id=chat_id or self.config.CHAT_ID, message_id=message_id, text=text,
+                parse_mode="HTML", disable_web_page_preview=True
+            )
+            return True
+        except BadRequest as e:
+            if "message is not modified" in str(e).lower():
+                return True
+            logger.error(f"Ошибка при редактировании сообщения {message_id}: {e}")
+            return False
+        except TelegramError as e:
+            logger.error(f"TelegramError при редактировании сообщения {message_id}: {e}", exc_info=True)
+            return False
+
     def format_detailed_report(self, report: dict) -> str:
         try:
             cheese_data = report.get('cheese_data', {})
@@ -90,22 +200,26 @@ class UltimateTelegramBot:
                 "",
                 "По сортам:",
             ]
-            for cheese in self.config.CHEESE_TYPES:
-                data = cheese_data.get(cheese, {'sold': 0})
+            # Сорта берём из отчёта: у разных проектов свой CHEESE_TYPES
+            for cheese, data in cheese_data.items():
                 lines.append(f"   • {cheese}: <b>{data['sold']} шт.</b> (начало: {data.get('start', 0)} → конец: {data.get('end', 0)})")
 
+            labels = flag_labels(report)
+            if labels:
+                lines += ["", f"Проверить: <b>{'; '.join(labels)}</b>"]
+
             result = "\n".join(lines)
-            logger.info(f"Сформирован детальный отчёт: {report['employee']} | {total} шт.")
+            logger.debug("Сформирован детальный отчёт: %s | %s шт.", report['employee'], total)
             return result
 
         except Exception as e:
             logger.error(f"ОШИБКА форматирования детального отчёта: {e}", exc_info=True)
             return "Ошибка при формировании детального отчёта."
 
-    def format_summary_report(self, summary: dict) -> str:
+    def format_summary_report(self, summary: dict, title: str = "СВОДНЫЙ ОТЧЁТ ЗА ДЕНЬ") -> str:
         try:
             lines = [
-                "СВОДНЫЙ ОТЧЁТ ЗА ДЕНЬ",
+                title,
                 "",
                 f"Магазинов отчиталось: <b>{summary.get('total_stores', 0)}</b>",
                 f"Ожидалось: <b>{summary.get('expected_stores', 0)}</b>",
@@ -131,6 +245,52 @@ class UltimateTelegramBot:
             logger.error(f"ОШИБКА форматирования сводного отчёта: {e}", exc_info=True)
             return "Ошибка при формировании сводного отчёта."
 
+    def format_all_time_report(self, totals: dict, top: int = 5) -> str:
+        lines = [
+            "СТАТИСТИКА ЗА ВСЁ ВРЕМЯ",
+            "",
+            f"Дегустаций: <b>{totals['stores']}</b>",
+            f"Продано всего: <b>{totals['total_sales']} шт.</b>",
+            f"Посетителей: <b>{totals['total_visitors']}</b>",
+            f"Средняя эффективность: <b>{totals['average_efficiency']}%</b>",
+        ]
+        for title, rows in (("Города", totals['cities']), ("Сети", totals['networks'])):
+            lines += ["", f"{title} (топ-{top} по продажам):"]
+            for name, stores, sales, avg_eff in rows[:top]:
+                lines.append(f"   • {name}: <b>{sales} шт.</b> ({stores} дегустаций, эфф. {avg_eff:.1f}%)")
+        lines += ["", "По сортам:"]
+        for cheese, sold in totals['cheese_sales'].items():
+            lines.append(f"   • {cheese}: <b>{sold} шт.</b>")
+        lines += ["", f"<i>Обновлено {totals['updated_at']}</i>"]
+        return "\n".join(lines)
+
+    def _stats_text(self, data: str, chat_id=None):
+        """Текст и клавиатура для кнопки меню — из готовых итогов проекта этого чата, без чтения листов."""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+        stats = self.stats_for(chat_id)
+
+        not_ready = "Статистика ещё не посчитана — она появится после ближайшей проверки отчётов."
+        if data == "stats_all_time":
+            totals = stats.totals()
+            return (self.format_all_time_report(totals) if totals else not_ready), None
+        if data == "stats_by_date":
+            dates = stats.recent_dates()
+            if not dates:
+                return not_ready, None
+            keyboard = [
+                [InlineKeyboardButton(day.strftime('%d.%m.%Y'), callback_data=f"stats_date:{day.isoformat()}")]
+                for day in dates
+            ]
+            return "Выберите дату:", InlineKeyboardMarkup(keyboard)
+
+        day = datetime.now().date() if data == "stats_today" else date.fromisoformat(data.split(":", 1)[1])
+        summary = stats.day(day)
+        if summary is None:
+            return f"За {day.strftime('%d.%m.%Y')} отчётов нет.", None
+        title = f"СВОДКА ЗА {day.strftime('%d.%m.%Y')} (обновлено {summary['updated_at']})"
+        return self.format_summary_report(summary, title=title), None
+
     # ===================== КОМАНДЫ =====================
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Команда /start от пользователя {update.effective_user.id}")
@@ -143,6 +303,8 @@ class UltimateTelegramBot:
         )
 
     async def menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
         logger.info(f"Команда /menu от пользователя {update.effective_user.id}")
         keyboard = [
             [InlineKeyboardButton("По дате", callback_data="stats_by_date")],
@@ -159,22 +321,21 @@ class UltimateTelegramBot:
 
         logger.info(f"Нажата кнопка: {data} (от {update.effective_user.id})")
 
-        if data == "stats_today":
-            text = "Статистика за сегодня — в разработке..."
-        elif data == "stats_by_date":
-            text = "Выбор даты — в разработке..."
-        elif data == "stats_all_time":
-            text = "Общая статистика — в разработке..."
+        reply_markup = None
+        if data in ("stats_today", "stats_by_date", "stats_all_time") or data.startswith("stats_date:"):
+            text, reply_markup = await asyncio.to_thread(self._stats_text, data, update.effective_chat.id)
         else:
             text = f"Неизвестная кнопка: {data}"
 
         try:
-            await query.edit_message_text(text=text)
+            await query.edit_message_text(text=text, parse_mode="HTML", reply_markup=reply_markup)
         except Exception as e:
             logger.error(f"Ошибка при редактировании сообщения: {e}")
 
     # ===================== ЗАПУСК ДЛЯ ТЕСТА =====================
     def run_polling(self):
+        from telegram.ext import Application, CommandHandler, CallbackQueryHandler
+
         logger.info("Запуск бота в polling-режиме...")
         app = Application.builder().token(self.config.BOT_TOKEN).build()
 
@@ -196,4 +357,7 @@ class UltimateTelegramBot:
 
 # Для быстрого теста: python telegram_bot.py
 if __name__ == "__main__":
+    from logging_setup import setup_logging
+
+    setup_logging()
     UltimateTelegramBot().run_polling()
\ No newline at end of file
@@ -2,29 +2,37 @@
 
 import logging
 import asyncio
+import os
 from datetime import datetime, date, timedelta
-import pandas as pd
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent,
+)
+from telegram.ext import (
+    Application, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler,
+    TypeHandler,
+)
 from config import Config
 from google_sheets import GoogleSheetsService
 from data_processor import DataProcessor
-
-# ═══════════════════════════════════════════════════════════════
-# ПРИНУДИТЕЛЬНО ВКЛЮЧАЕМ ЛОГИ С САМОЙ ПЕРВОЙ СТРОКИ!
-# ═══════════════════════════════════════════════════════════════
+from response_cache import get_render_cache
+from keyboards import build_page, get_callback_index
+from trends import trend_engine
+from leaderboard import leaderboards
+from export import ExportRequest, export_reports
+from search_index import search_index
+from aggregates import MemoryLimitError, all_time_stats, history_feed, iter_all_reports
+from shared_state import get_shared_state
+
+# Хендлеры и уровень настраивает logging_setup.setup_logging() в точке входа
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-# Если main.py ещё не успел — включаем сами
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s | %(name)-25s | %(levelname)-8s | %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
 
-logger.info("telegram_ptb_bot.py ЗАГРУЖЕН — ЛОГИ РАБОТАЮТ НА 100%!")
-# ═══════════════════════════════════════════════════════════════
+# Постраничные меню трендов: вид меню в callback_data -> измерение TrendEngine
+TREND_MENUS = {"trstore": "store", "tremp": "employee"}
+
+
+# Измерения рейтингов в меню «Рейтинги»
+LEADERBOARD_TITLES = {"city": "Города", "network": "Сети", "employee": "Промоутеры", "cheese": "Сыры"}
 
 
 class TelegramPTBBot:
@@ -44,6 +52,39 @@ class TelegramPTBBot:
         """
         return
 
+    # ===================== БЛОКИРУЮЩИЕ ВЫЗОВЫ =====================
+    # Чтение листов и сопоставление синхронные; выполняем их в отдельном потоке,
+    # чтобы нажатия других пользователей обрабатывались параллельно.
+    async def _get_sheet(self, sheet_id):
+        """Разобранный снимок листа (SheetSnapshot); в пределах SNAPSHOT_TTL — без повторной загрузки."""
+        return await asyncio.to_thread(
+            self.sheets_service.get_snapshot, sheet_id, max_age=self.config.SNAPSHOT_TTL
+        )
+
+    async def _match(self, morning_df, evening_df):
+        # Экраны только читают данные: пары не помечаем обработанными, иначе повторный
+        # показ той же даты не нашёл бы уже сопоставленных отчётов
+        return await asyncio.to_thread(
+            self.data_processor.process_daily_reports, morning_df, evening_df, track_processed=False
+        )
+
+    # ===================== КЭШ ГОТОВЫХ ЭКРАНОВ =====================
+    async def _render_cached(self, screen, params, render):
+        """
+        Текст экрана статистики из кэша (response_cache.py) или, при промахе, результат render().
+        Версия данных берётся до расчёта: если за это время пришли новые отчёты,
+        результат сохранится под старой версией и не будет выдан.
+        """
+        cache = get_render_cache()
+        version = cache.version
+        text = cache.get(screen, params, version)
+        if text is not None:
+            logger.info(f"Экран {screen} {params} выдан из кэша")
+            return text
+        text = await render()
+        cache.put(screen, params, version, text)
+        return text
+
     # ===================== ОТПРАВКА СООБЩЕНИЙ =====================
     async def send_result_message(self, chat_id: int, text: str, context: ContextTypes.DEFAULT_TYPE,
                                 reply_markup=None):
@@ -76,14 +117,105 @@ class TelegramPTBBot:
             [InlineKeyboardButton("История по дате", callback_data="history_date")],
             [InlineKeyboardButton("История по сети", callback_data="history_network")],
             [InlineKeyboardButton("Статистика за всё время", callback_data="all_time_menu")],
+            [InlineKeyboardButton("Тренды за 7/30 дней", callback_data="trends_menu")],
+            [InlineKeyboardButton("Рейтинги (топ-10)", callback_data="lb_menu")],
         ]
 
         text = (
             "<b>Бот для анализа дегустаций сыра</b>\n\n"
-            "Выберите нужный тип отчёта:"
+            "Выберите нужный тип отчёта:\n"
+            "<i>Выгрузка в Excel: /export 01.10.2025 31.10.2025</i>\n"
+            "<i>Поиск в любом чате: @имя_бота адрес или ФИО</i>"
         )
         await self.send_ui_message(chat_id, text, context, reply_markup=InlineKeyboardMarkup(keyboard))
 
+    # ===================== /export =====================
+    EXPORT_USAGE = (
+        "<b>Выгрузка отчётов</b>\n"
+        "/export — вся история\n"
+        "/export 05.11.2025 — один день\n"
+        "/export 01.10.2025 31.10.2025 csv город=Москва сеть=Магнит\n\n"
+        "Формат по умолчанию — xlsx."
+    )
+    EXPORT_FAILED = "Не удалось подготовить выгрузку — попробуйте позже."
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat_id = update.effective_chat.id
+        args = " ".join(context.args or [])
+        logger.info(f"Команда /export {args} от {update.effective_user.id}")
+        try:
+            request = ExportRequest.parse(args)
+        except ValueError as e:
+            await self.send_result_message(chat_id, f"{e}\n\n{self.EXPORT_USAGE}", context)
+            return
+
+        try:
+            morning = await self._get_sheet(self.config.MORNING_SHEET_ID)
+            try:
+                request.check_filters(morning, self.config.MORNING_COLUMNS)
+            except ValueError as e:
+                await self.send_result_message(chat_id, f"{e}\n\n{self.EXPORT_USAGE}", context)
+                return
+
+            await context.bot.send_message(chat_id=chat_id, text=f"Готовлю выгрузку: {request.describe()}…")
+            evening = await self._get_sheet(self.config.EVENING_SHEET_ID)
+            path, count = await asyncio.to_thread(export_reports, self.data_processor, morning, evening, request)
+        except Exception as e:
+            # Ошибка Sheets, памяти или диска — пользователь не должен остаться без ответа
+            logger.error(f"Ошибка выгрузки ({request.describe()}): {e}", exc_info=True)
+            await self.send_result_message(chat_id, self.EXPORT_FAILED, context)
+            return
+        try:
+            if not count:
+                await self.send_result_message(chat_id, f"Нет отчётов: {request.describe()}", context)
+                return
+            period = "all"
+            if request.date_from:
+                period = f"{request.date_from:%Y%m%d}-{request.date_to:%Y%m%d}"
+            with open(path, "rb") as f:
+                await context.bot.send_document(
+                    chat_id=chat_id, document=f, filename=f"degustation_{period}.{request.fmt}",
+                    caption=f"Отчётов: {count} ({request.describe()})",
+                )
+        finally:
+            os.remove(path)
+
+    # ===================== INLINE-ПОИСК =====================
+    INLINE_LIMIT = 10
+    INLINE_CACHE_TIME = 60  # секунд кэша ответа на стороне Telegram
+    INLINE_KINDS = {"store": "Магазин", "employee": "Промоутер"}
+
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        «@бот арбат» в любом чате: подсказки магазинов и промоутеров из search_index,
+        выбранная подсказка отправляет детальный отчёт по последней дегустации.
+        """
+        query = update.inline_query
+        text = query.query.strip()
+        if len(text) < 2:
+            await query.answer([], cache_time=self.INLINE_CACHE_TIME)
+            return
+
+        try:
+            await history_feed.ensure_loaded(self._load_all_reports)
+        except MemoryLimitError as e:
+            logger.error(f"Inline-поиск без истории: {e}")
+            await query.answer([], cache_time=0)
+            return
+        results = []
+        for i, (kind, name, report) in enumerate(search_index.search(text, self.INLINE_LIMIT)):
+            results.append(InlineQueryResultArticle(
+                id=f"{kind[0]}{i}",
+                title=name,
+                description=(
+                    f"{self.INLINE_KINDS[kind]} · последний отчёт {report.date}, "
+                    f"{report.network}, продано {report.total_sales} шт."
+                ),
+                input_message_content=InputTextMessageContent(self.format_detailed_report(report), parse_mode="HTML"),
+            ))
+        logger.debug(f"Inline-поиск '{text}' от {update.effective_user.id}: {len(results)} подсказок")
+        await query.answer(results, cache_time=self.INLINE_CACHE_TIME)
+
     # ===================== CALLBACK =====================
     async def callback_query_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -121,14 +253,60 @@ class TelegramPTBBot:
             await self.show_all_time_network_stats(chat_id, context)
         elif data == "all_time_overall":
             await self.show_all_time_overall_stats(chat_id, context)
+        elif data == "trends_menu":
+            await self.start_trends_menu(chat_id, context, query)
+        elif data in ("trends_store", "trends_employee"):
+            await self.show_trend_selection(chat_id, data[7:], context, query)
+        elif data == "lb_menu":
+            await self.start_leaderboard_menu(chat_id, context, query)
+        elif data.startswith("lb_"):
+            _, dim, period = data.split("_")
+            await self.show_leaderboard(chat_id, dim, period, context)
         elif data.startswith("date_"):
             await self.handle_date_selection(chat_id, data[5:], context, query)
-        elif data.startswith("city_"):
-            await self.handle_city_selection(chat_id, data[5:], context, query)
-        elif data.startswith("network_"):
-            await self.handle_network_selection(chat_id, data[8:], context, query)
-        elif data.startswith("address_"):
-            await self.handle_address_selection(chat_id, data[8:], context)
+        elif data.startswith("page_"):
+            kind, _, page = data[5:].rpartition("_")
+            await self.send_menu_page(chat_id, context, kind, int(page), query)
+        elif data == "noop":
+            return
+        elif data.startswith(("city_", "network_", "address_", "trstore_", "tremp_")):
+            kind, _, short_id = data.partition("_")
+            value = get_callback_index().resolve(short_id)
+            if value is None:
+                return await self.send_result_message(chat_id, "Меню устарело — начните заново с /start", context)
+            if kind == "city":
+                await self.handle_city_selection(chat_id, value, context, query)
+            elif kind == "network":
+                await self.handle_network_selection(chat_id, value, context, query)
+            elif kind in TREND_MENUS:
+                await self.show_trend(chat_id, TREND_MENUS[kind], value, context)
+            else:
+                await self.handle_address_selection(chat_id, value, context)
+
+    # ===================== ПОСТРАНИЧНЫЕ МЕНЮ =====================
+    async def show_paginated_menu(self, chat_id, context, kind, items, text, query=None, label_width=None):
+        """
+        Запоминает отсортированный список элементов меню и показывает первую страницу.
+        Следующие страницы строятся по кнопкам page_{kind}_{N} из того же списка.
+        """
+        context.user_data[f"menu_{kind}"] = {"items": list(items), "text": text, "label_width": label_width}
+        await self.send_menu_page(chat_id, context, kind, 0, query)
+
+    async def send_menu_page(self, chat_id, context, kind, page, query=None):
+        menu = context.user_data.get(f"menu_{kind}")
+        if not menu:
+            return await self.send_result_message(chat_id, "Меню устарело — начните заново с /start", context)
+
+        reply_markup = build_page(menu["items"], kind, page, label_width=menu["label_width"])
+        if query:
+            await query.edit_message_text(
+                text=menu["text"],
+                reply_markup=reply_markup,
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+            )
+        else:
+            await self.send_ui_message(chat_id, menu["text"], context, reply_markup=reply_markup)
 
     # ===================== ПОТОКИ =====================
     async def start_store_flow(self, chat_id, context, query=None):
@@ -248,29 +426,20 @@ class TelegramPTBBot:
         if not cities:
             return await self.send_result_message(chat_id, f"Нет данных за {date_obj.strftime('%d.%m.%Y')}", context)
 
-        keyboard = [[InlineKeyboardButton(city, callback_data=f"city_{city}")] for city in sorted(cities)]
         text = f"Выберите город за {date_obj.strftime('%d.%m.%Y')}:"
-        if query:
-            await query.edit_message_text(
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="HTML",
-                disable_web_page_preview=True,
-            )
-        else:
-            await self.send_ui_message(chat_id, text, context,
-                                       reply_markup=InlineKeyboardMarkup(keyboard))
+        await self.show_paginated_menu(chat_id, context, "city", sorted(cities), text, query)
 
     async def show_city_stats(self, chat_id, date_obj, context):
-        morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-        evening_df = self.sheets_service.get_sheet_data(self.config.EVENING_SHEET_ID)
+        text = await self._render_cached("city_stats", (date_obj,), lambda: self._render_city_stats(date_obj))
+        await self.send_result_message(chat_id, text, context)
 
-        morning_f = morning_df[pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj]
-        evening_f = evening_df[pd.to_datetime(evening_df[self.config.EVENING_COLUMNS['date']]).dt.date == date_obj]
+    async def _render_city_stats(self, date_obj):
+        morning_f = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
+        evening_f = (await self._get_sheet(self.config.EVENING_SHEET_ID)).on_date(date_obj)
 
-        reports = self.data_processor.process_daily_reports(morning_f, evening_f)
+        reports = await self._match(morning_f, evening_f)
         if not reports:
-            return await self.send_result_message(chat_id, f"Нет завершённых отчётов за {date_obj.strftime('%d.%m.%Y')}", context)
+            return f"Нет завершённых отчётов за {date_obj.strftime('%d.%m.%Y')}"
 
         city_stats = {}
         for r in reports:
@@ -286,16 +455,19 @@ class TelegramPTBBot:
             text += f"<b>{city}</b>\n"
             text += f"Магазинов: {s['stores']} | Продано: {s['sales']} шт. | Эфф.: {avg_eff:.1f}%\n\n"
 
-        await self.send_result_message(chat_id, text, context)
+        return text
 
     async def show_general_date_stats(self, chat_id, date_obj, context):
-        morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-        evening_df = self.sheets_service.get_sheet_data(self.config.EVENING_SHEET_ID)
+        text = await self._render_cached(
+            "date_stats", (date_obj,), lambda: self._render_general_date_stats(date_obj)
+        )
+        await self.send_result_message(chat_id, text, context)
 
-        morning_f = morning_df[pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj]
-        evening_f = evening_df[pd.to_datetime(evening_df[self.config.EVENING_COLUMNS['date']]).dt.date == date_obj]
+    async def _render_general_date_stats(self, date_obj):
+        morning_f = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
+        evening_f = (await self._get_sheet(self.config.EVENING_SHEET_ID)).on_date(date_obj)
 
-        reports = self.data_processor.process_daily_reports(morning_f, evening_f)
+        reports = await self._match(morning_f, evening_f)
 
         if not reports:
             expected = len(morning_f)
@@ -313,25 +485,15 @@ class TelegramPTBBot:
             text += f"Посетителей: {total_visitors}\n"
             text += f"Средняя эффективность: {avg_eff:.1f}%\n"
 
-        await self.send_result_message(chat_id, text, context)
+        return text
 
     async def show_network_selection(self, chat_id, date_obj, context, query=None):
         networks = await self.get_available_networks(date_obj)
         if not networks:
             return await self.send_result_message(chat_id, "Нет данных за эту дату", context)
 
-        keyboard = [[InlineKeyboardButton(net, callback_data=f"network_{net}")] for net in sorted(networks)]
         text = f"Выберите сеть за {date_obj.strftime('%d.%m.%Y')}:"
-        if query:
-            await query.edit_message_text(
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="HTML",
-                disable_web_page_preview=True,
-            )
-        else:
-            await self.send_ui_message(chat_id, text, context,
-                                       reply_markup=InlineKeyboardMarkup(keyboard))
+        await self.show_paginated_menu(chat_id, context, "network", sorted(networks), text, query)
 
     async def handle_city_selection(self, chat_id, city, context, query=None):
         date_obj = context.user_data.get("selected_date")
@@ -344,18 +506,8 @@ class TelegramPTBBot:
         if not networks:
             return await self.send_result_message(chat_id, f"Нет данных по городу {city}", context)
 
-        keyboard = [[InlineKeyboardButton(net, callback_data=f"network_{net}")] for net in sorted(networks)]
         text = f"Выберите сеть в {city}:"
-        if query:
-            await query.edit_message_text(
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="HTML",
-                disable_web_page_preview=True,
-            )
-        else:
-            await self.send_ui_message(chat_id, text, context,
-                                       reply_markup=InlineKeyboardMarkup(keyboard))
+        await self.show_paginated_menu(chat_id, context, "network", sorted(networks), text, query)
 
     async def handle_network_selection(self, chat_id, network, context, query=None):
         date_obj = context.user_data.get("selected_date")
@@ -366,32 +518,20 @@ class TelegramPTBBot:
             if not addresses:
                 return await self.send_result_message(chat_id, "Нет адресов", context)
 
-            keyboard = [[InlineKeyboardButton(a[:40] + ("..." if len(a)>40 else ""), 
-                                            callback_data=f"address_{a}")] for a in addresses]
             text = f"Выберите магазин ({network}):"
-            if query:
-                await query.edit_message_text(
-                    text=text,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode="HTML",
-                    disable_web_page_preview=True,
-                )
-            else:
-                await self.send_ui_message(chat_id, text, context,
-                                           reply_markup=InlineKeyboardMarkup(keyboard))
+            await self.show_paginated_menu(
+                chat_id, context, "address", sorted(addresses), text, query, label_width=40
+            )
         else:  # По сети в целом
             await self.show_network_stats(chat_id, date_obj, network, context)
 
     async def handle_address_selection(self, chat_id, address, context):
         date_obj = context.user_data.get("selected_date")
-        morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-        evening_df = self.sheets_service.get_sheet_data(self.config.EVENING_SHEET_ID)
-
-        morning_f = morning_df[pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj]
-        evening_f = evening_df[pd.to_datetime(evening_df[self.config.EVENING_COLUMNS['date']]).dt.date == date_obj]
+        morning_f = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
+        evening_f = (await self._get_sheet(self.config.EVENING_SHEET_ID)).on_date(date_obj)
 
         report = None
-        for r in self.data_processor.process_daily_reports(morning_f, evening_f):
+        for r in await self._match(morning_f, evening_f):
             if self.data_processor.normalizer.normalize(address) in self.data_processor.normalizer.normalize(r.get('normalized_address', '')):
                 report = r
                 break
@@ -403,15 +543,18 @@ class TelegramPTBBot:
         await self.send_result_message(chat_id, text, context)
 
     async def show_network_stats(self, chat_id, date_obj, network, context):
-        morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-        evening_df = self.sheets_service.get_sheet_data(self.config.EVENING_SHEET_ID)
+        text = await self._render_cached(
+            "network_stats", (date_obj, network), lambda: self._render_network_stats(date_obj, network)
+        )
+        await self.send_result_message(chat_id, text, context)
 
-        morning_f = morning_df[pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj]
-        evening_f = evening_df[pd.to_datetime(evening_df[self.config.EVENING_COLUMNS['date']]).dt.date == date_obj]
+    async def _render_network_stats(self, date_obj, network):
+        morning_f = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
+        evening_f = (await self._get_sheet(self.config.EVENING_SHEET_ID)).on_date(date_obj)
 
-        reports = [r for r in self.data_processor.process_daily_reports(morning_f, evening_f) if r['network'] == network]
+        reports = [r for r in await self._match(morning_f, evening_f) if r['network'] == network]
         if not reports:
-            return await self.send_result_message(chat_id, f"Нет данных по сети {network}", context)
+            return f"Нет данных по сети {network}"
 
         total_sales = sum(r['total_sales'] for r in reports)
         avg_eff = sum(r['efficiency'] for r in reports) / len(reports)
@@ -419,8 +562,8 @@ class TelegramPTBBot:
 
         cheese_totals = {}
         for r in reports:
-            for ch, data in r['cheese_data'].items():
-                cheese_totals[ch] = cheese_totals.get(ch, 0) + data['sold']
+            for ch, sold in r.sold_items():
+                cheese_totals[ch] = cheese_totals.get(ch, 0) + sold
 
         text = f"<b>Сеть «{network}» за {date_obj.strftime('%d.%m.%Y')}</b>\n\n"
         text += f"Магазинов: {len(reports)}\n"
@@ -431,105 +574,196 @@ class TelegramPTBBot:
         for ch, sold in cheese_totals.items():
             text += f"• {ch}: {sold} шт.\n"
 
-        await self.send_result_message(chat_id, text, context)
+        return text
 
     # ===================== СТАТИСТИКА ЗА ВСЁ ВРЕМЯ =====================
-    async def _load_all_reports(self):
-        """Загружает все пары утро+вечер за всё время одним вызовом."""
-        morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-        evening_df = self.sheets_service.get_sheet_data(self.config.EVENING_SHEET_ID)
-        reports = self.data_processor.process_daily_reports(morning_df, evening_df)
-        logger.info(f"Всего сопоставленных отчётов за всё время: {len(reports)}")
-        return reports
+    async def _load_all_reports(self, since=None):
+        """
+        Все пары утро+вечер за всё время (или с даты since) — генератором по месяцам
+        (aggregates.iter_all_reports): history_feed раздаёт их всем агрегатам чанк за чанком,
+        полный список в памяти не собирается.
+        """
+        morning = await self._get_sheet(self.config.MORNING_SHEET_ID)
+        evening = await self._get_sheet(self.config.EVENING_SHEET_ID)
+        return iter_all_reports(self.data_processor, morning, evening, self.config.MEMORY_LIMIT_MB, since)
+
+    HISTORY_TOO_LARGE = "История не помещается в лимит памяти сервера. Попробуйте позже или выгрузите её через /export."
+
+    async def _ensure_history(self, chat_id, context) -> bool:
+        """Загружает историю во все агрегаты; при MemoryLimitError отвечает пользователю и возвращает False."""
+        try:
+            await history_feed.ensure_loaded(self._load_all_reports)
+            return True
+        except MemoryLimitError as e:
+            logger.error(f"История для агрегатов не загружена: {e}")
+            await self.send_result_message(chat_id, self.HISTORY_TOO_LARGE, context)
+            return False
+
+    async def _show_all_time(self, chat_id, context, screen, render):
+        if not await self._ensure_history(chat_id, context):
+            return
+        text = await self._render_cached(screen, (), render)
+        await self.send_result_message(chat_id, text, context)
 
     async def show_all_time_city_stats(self, chat_id, context):
-        reports = await self._load_all_reports()
-        if not reports:
-            return await self.send_result_message(chat_id, "Нет завершённых отчётов за всё время", context)
+        await self._show_all_time(chat_id, context, "all_time_city", self._render_all_time_city_stats)
 
-        city_stats = {}
-        for r in reports:
-            city = r['city']
-            city_stats.setdefault(city, {'stores': 0, 'sales': 0, 'eff': []})
-            city_stats[city]['stores'] += 1
-            city_stats[city]['sales'] += r['total_sales']
-            city_stats[city]['eff'].append(r['efficiency'])
+    async def _render_all_time_city_stats(self):
+        if not all_time_stats.stores:
+            return "Нет завершённых отчётов за всё время"
 
         text = "<b>Статистика по городам за всё время</b>\n\n"
-        for city, s in sorted(city_stats.items(), key=lambda x: x[1]['sales'], reverse=True):
-            avg_eff = sum(s['eff']) / len(s['eff']) if s['eff'] else 0
+        for city, stores, sales, avg_eff in all_time_stats.ranking("city"):
             text += f"<b>{city}</b>\n"
-            text += f"Магазинов: {s['stores']} | Продано: {s['sales']} шт. | Эфф.: {avg_eff:.1f}%\n\n"
+            text += f"Магазинов: {stores} | Продано: {sales} шт. | Эфф.: {avg_eff:.1f}%\n\n"
 
-        await self.send_result_message(chat_id, text, context)
+        return text
 
     async def show_all_time_network_stats(self, chat_id, context):
-        reports = await self._load_all_reports()
-        if not reports:
-            return await self.send_result_message(chat_id, "Нет завершённых отчётов за всё время", context)
+        await self._show_all_time(chat_id, context, "all_time_network", self._render_all_time_network_stats)
 
-        net_stats = {}
-        cheese_totals = {}
-        total_vis = 0
-        for r in reports:
-            net = r['network']
-            net_stats.setdefault(net, {'stores': 0, 'sales': 0, 'eff': []})
-            net_stats[net]['stores'] += 1
-            net_stats[net]['sales'] += r['total_sales']
-            net_stats[net]['eff'].append(r['efficiency'])
-            total_vis += r['visitors']
-
-            for ch, data in r['cheese_data'].items():
-                cheese_totals[ch] = cheese_totals.get(ch, 0) + data['sold']
+    async def _render_all_time_network_stats(self):
+        if not all_time_stats.stores:
+            return "Нет завершённых отчётов за всё время"
 
         text = "<b>Статистика по сетям за всё время</b>\n\n"
-        for net, s in sorted(net_stats.items(), key=lambda x: x[1]['sales'], reverse=True):
-            avg_eff = sum(s['eff']) / len(s['eff']) if s['eff'] else 0
+        for net, stores, sales, avg_eff in all_time_stats.ranking("network"):
             text += f"<b>{net}</b>\n"
-            text += f"Магазинов: {s['stores']} | Продано: {s['sales']} шт. | Эфф.: {avg_eff:.1f}%\n\n"
+            text += f"Магазинов: {stores} | Продано: {sales} шт. | Эфф.: {avg_eff:.1f}%\n\n"
 
         text += "<b>По сырам за всё время:</b>\n"
-        for ch, sold in cheese_totals.items():
+        for ch, sold in all_time_stats.cheese_sales.items():
             text += f"• {ch}: {sold} шт.\n"
 
-        text += f"\nВсего посетителей по всем дегустациям: {total_vis}\n"
+        text += f"\nВсего посетителей по всем дегустациям: {all_time_stats.total_visitors}\n"
 
-        await self.send_result_message(chat_id, text, context)
+        return text
 
     async def show_all_time_overall_stats(self, chat_id, context):
-        reports = await self._load_all_reports()
-        if not reports:
-            return await self.send_result_message(chat_id, "Нет завершённых отчётов за всё время", context)
+        await self._show_all_time(chat_id, context, "all_time_overall", self._render_all_time_overall_stats)
 
-        total_stores = len(reports)
-        total_sales = sum(r['total_sales'] for r in reports)
-        total_visitors = sum(r['visitors'] for r in reports)
-        avg_eff = sum(r['efficiency'] for r in reports) / len(reports)
+    async def _render_all_time_overall_stats(self):
+        if not all_time_stats.stores:
+            return "Нет завершённых отчётов за всё время"
 
         text = "<b>Общая статистика за всё время</b>\n\n"
-        text += f"Магазинов (дней-дегустаций): {total_stores}\n"
-        text += f"Продано всего: {total_sales} шт.\n"
-        text += f"Посетителей всего: {total_visitors}\n"
-        text += f"Средняя эффективность: {avg_eff:.1f}%\n"
+        text += f"Магазинов (дней-дегустаций): {all_time_stats.stores}\n"
+        text += f"Продано всего: {all_time_stats.total_sales} шт.\n"
+        text += f"Посетителей всего: {all_time_stats.total_visitors}\n"
+        text += f"Средняя эффективность: {all_time_stats.average_efficiency:.1f}%\n"
+
+        return text
 
+    # ===================== ТРЕНДЫ =====================
+    async def start_trends_menu(self, chat_id, context, query=None):
+        keyboard = [
+            [InlineKeyboardButton("По магазину", callback_data="trends_store")],
+            [InlineKeyboardButton("По промоутеру", callback_data="trends_employee")],
+        ]
+        text = "Тренды за последние 7 и 30 дней:"
+        if query:
+            await query.edit_message_text(
+                text=text,
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+            )
+        else:
+            await self.send_ui_message(chat_id, text, context, reply_markup=InlineKeyboardMarkup(keyboard))
+
+    async def show_trend_selection(self, chat_id, kind, context, query=None):
+        if not await self._ensure_history(chat_id, context):
+            return
+        names = trend_engine.names(kind)
+        if not names:
+            return await self.send_result_message(chat_id, "Нет завершённых отчётов", context)
+
+        menu_kind = next(k for k, v in TREND_MENUS.items() if v == kind)
+        what = "магазин" if kind == "store" else "промоутера"
+        text = f"Выберите {what} (по убыванию продаж за 30 дней):"
+        await self.show_paginated_menu(chat_id, context, menu_kind, names, text, query, label_width=40)
+
+    async def show_trend(self, chat_id, kind, name, context):
+        if not await self._ensure_history(chat_id, context):
+            return
+        text = self._render_trend(kind, name)
         await self.send_result_message(chat_id, text, context)
 
+    def _render_trend(self, kind, name):
+        today = date.today()
+        week = trend_engine.summary(kind, name, 7, today)
+        month = trend_engine.summary(kind, name, 30, today)
+        if week is None or month is None:
+            return "Нет данных"
+
+        title = "Магазин" if kind == "store" else "Промоутер"
+        text = f"<b>{title}: {name}</b>\n\n"
+        for label, s in (("7 дней", week), ("30 дней", month)):
+            change = f"{s['sales_change']:+.1f}%" if s['sales_change'] is not None else "—"
+            text += f"<b>За {label}</b>\n"
+            text += f"Дегустаций: {s['tastings']} | Продано: {s['sales']} шт. ({change} к прошлым {label})\n"
+            text += f"Посетителей: {s['visitors']} | Эфф.: {s['efficiency']:.1f}%\n\n"
+        text += "Продажи за 7 дней, последние 30 дней:\n"
+        text += f"<code>{trend_engine.sparkline(kind, name, 7, 30, today)}</code>"
+        return text
+
+    # ===================== РЕЙТИНГИ =====================
+    async def start_leaderboard_menu(self, chat_id, context, query=None):
+        keyboard = [
+            [
+                InlineKeyboardButton(f"{title}: всё время", callback_data=f"lb_{dim}_all"),
+                InlineKeyboardButton("сегодня", callback_data=f"lb_{dim}_today"),
+            ]
+            for dim, title in LEADERBOARD_TITLES.items()
+        ]
+        text = "Рейтинги по продажам и эффективности:"
+        if query:
+            await query.edit_message_text(
+                text=text,
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+            )
+        else:
+            await self.send_ui_message(chat_id, text, context, reply_markup=InlineKeyboardMarkup(keyboard))
+
+    async def show_leaderboard(self, chat_id, dim, period, context):
+        if not await self._ensure_history(chat_id, context):
+            return
+        text = self._render_leaderboard(dim, date.today() if period == "today" else None)
+        await self.send_result_message(chat_id, text, context)
+
+    def _render_leaderboard(self, dim, day=None, k=10):
+        period = f"за {day.strftime('%d.%m.%Y')}" if day else "за всё время"
+        top_sales = leaderboards.top(dim, "sales", k, day)
+        if not top_sales:
+            return f"Нет завершённых отчётов {period}"
+
+        text = f"<b>{LEADERBOARD_TITLES[dim]} {period}</b>\n\n<b>Топ-{k} по продажам</b>\n"
+        for place, (key, sales) in enumerate(top_sales, 1):
+            text += f"{place}. {key} — {sales} шт.\n"
+
+        if dim != "cheese":
+            text += f"\n<b>Топ-{k} по эффективности</b>\n"
+            for place, (key, eff) in enumerate(leaderboards.top(dim, "efficiency", k, day), 1):
+                text += f"{place}. {key} — {eff:.1f}%\n"
+            text += "\n<b>Ниже всех по эффективности</b>\n"
+            for key, eff in leaderboards.bottom(dim, "efficiency", 3, day):
+                text += f"• {key} — {eff:.1f}%\n"
+        return text
+
     # ===================== ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ =====================
     async def get_available_dates(self):
         try:
-            morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-            dates = set()
-            if not morning_df.empty:
-                dates.update(pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date.unique())
-            return sorted(dates, reverse=True)
+            morning = await self._get_sheet(self.config.MORNING_SHEET_ID)
+            return sorted(morning.dates(), reverse=True)
         except Exception as e:
             logger.error(f"Ошибка получения дат: {e}", exc_info=True)
             return []
 
     async def get_available_cities(self, date_obj):
         try:
-            morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-            filtered = morning_df[pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj]
+            filtered = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
             return sorted(filtered[self.config.MORNING_COLUMNS['city']].dropna().unique())
         except Exception as e:
             logger.error(f"Ошибка получения городов: {e}")
@@ -537,8 +771,7 @@ class TelegramPTBBot:
 
     async def get_available_networks(self, date_obj):
         try:
-            morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-            filtered = morning_df[pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj]
+            filtered = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
             return sorted(filtered[self.config.MORNING_COLUMNS['network_name']].dropna().unique())
         except Exception as e:
             logger.error(f"Ошибка получения сетей: {e}")
@@ -546,11 +779,8 @@ class TelegramPTBBot:
 
     async def get_available_networks_in_city(self, date_obj, city):
         try:
-            morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-            filtered = morning_df[
-                (pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj) &
-                (morning_df[self.config.MORNING_COLUMNS['city']] == city)
-            ]
+            day_df = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
+            filtered = day_df[day_df[self.config.MORNING_COLUMNS['city']] == city]
             return sorted(filtered[self.config.MORNING_COLUMNS['network_name']].dropna().unique())
         except Exception as e:
             logger.error(f"Ошибка получения сетей в городе: {e}")
@@ -558,11 +788,10 @@ class TelegramPTBBot:
 
     async def get_available_addresses(self, date_obj, city, network):
         try:
-            morning_df = self.sheets_service.get_sheet_data(self.config.MORNING_SHEET_ID)
-            filtered = morning_df[
-                (pd.to_datetime(morning_df[self.config.MORNING_COLUMNS['date']]).dt.date == date_obj) &
-                (morning_df[self.config.MORNING_COLUMNS['city']] == city) &
-                (morning_df[self.config.MORNING_COLUMNS['network_name']] == network)
+            day_df = (await self._get_sheet(self.config.MORNING_SHEET_ID)).on_date(date_obj)
+            filtered = day_df[
+                (day_df[self.config.MORNING_COLUMNS['city']] == city) &
+                (day_df[self.config.MORNING_COLUMNS['network_name']] == network)
             ]
             return list(filtered[self.config.MORNING_COLUMNS['address']].dropna().unique())
         except Exception as e:
@@ -590,16 +819,113 @@ class TelegramPTBBot:
         return "\n".join(lines)
 
 
+# ===================== СЕССИИ ПОЛЬЗОВАТЕЛЕЙ =====================
+class SharedSessions(BaseUpdateProcessor):
+    """
+    user_data пользователей в общем хранилище (shared_state.py). Перед обработчиками
+    (группа LOAD_GROUP) context.user_data заполняется из ключа session:<user_id>, после них
+    (SAVE_GROUP) записывается обратно — дату, выбранную на одном воркере webhook, видит
+    воркер, которому досталось следующее нажатие. Сессия живёт ttl секунд без нажатий.
+
+    Заодно это обработчик очереди обновлений Application (concurrent_updates): нажатия
+    разных пользователей идут параллельно, а одного — по очереди, под asyncio.Lock в процессе
+    и state.lock("session:<user_id>") между воркерами. Загрузка, обработчик и запись сессии
+    не перемежаются с соседним нажатием, и его load не затирает user_data посреди обработки.
+    """
+
+    LOAD_GROUP = -100
+    SAVE_GROUP = 90
+    # Сколько держится блокировка сессии упавшего воркера (обработка /export бывает долгой)
+    LOCK_TTL = 120.0
+
+    def __init__(self, state, ttl: float = 86400.0, max_concurrent_updates: int = 256):
+        super().__init__(max_concurrent_updates)
+        self.state = state
+        self.ttl = ttl
+        self._locks = {}  # user_id -> [asyncio.Lock, сколько обновлений ждут или держат]
+
+    async def do_process_update(self, update, coroutine) -> None:
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            await coroutine
+            return
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                shared = self.state.lock(f"session:{user.id}", ttl=self.LOCK_TTL)
+                await asyncio.to_thread(shared.__enter__)
+                try:
+                    await coroutine
+                finally:
+                    await asyncio.to_thread(shared.__exit__, None, None, None)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def load(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user is None:
+            return
+        data = await asyncio.to_thread(self.state.get_obj, f"session:{update.effective_user.id}")
+        context.user_data.clear()
+        context.user_data.update(data or {})
+
+    async def save(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user is None:
+            return
+        await asyncio.to_thread(
+            self.state.set_obj, f"session:{update.effective_user.id}", dict(context.user_data), self.ttl
+        )
+
+    def register(self, app: Application) -> None:
+        app.add_handler(TypeHandler(Update, self.load), group=self.LOAD_GROUP)
+        app.add_handler(TypeHandler(Update, self.save), group=self.SAVE_GROUP)
+
+
 # ===================== ЗАПУСК =====================
-def create_application():
-    bot = TelegramPTBBot()
-    app = Application.builder().token(bot.config.BOT_TOKEN).build()
+def create_application(webhook: bool = False, bot: TelegramPTBBot | None = None, request=None):
+    """
+    Собирает Application с обработчиками TelegramPTBBot.
+    webhook=True — без Updater: обновления кладёт в update_queue telegram_webhook.
+    bot и request подменяют бота и транспорт Bot API (loadtest.py: заглушки из fake_backends).
+    """
+    bot = bot or TelegramPTBBot()
+    state = get_shared_state()
+    # При SHARED_STATE=memory процесс один, user_data и так общий
+    sessions = SharedSessions(state) if state.name != "memory" else None
+    builder = (
+        Application.builder()
+        .token(bot.config.BOT_TOKEN)
+        # нажатия разных пользователей обрабатываются параллельно (одного — по очереди, SharedSessions)
+        .concurrent_updates(sessions or True)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    else:
+        builder = builder.connection_pool_size(bot.config.TELEGRAM_POOL_SIZE)
+    if webhook:
+        builder = builder.updater(None)
+    app = builder.build()
     app.add_handler(CommandHandler("start", bot.start_command))
+    app.add_handler(CommandHandler("export", bot.export_command))
     app.add_handler(CallbackQueryHandler(bot.callback_query_handler))
+    app.add_handler(InlineQueryHandler(bot.inline_query))
+    if sessions is not None:
+        sessions.register(app)
     return app
 
 
 if __name__ == "__main__":
+    from logging_setup import setup_logging
+
+    setup_logging()
     app = create_application()
     logger.info("Запуск TelegramPTBBot в polling-режиме...")
     app.run_polling(drop_pending_updates=True)
\ No newline at end of file
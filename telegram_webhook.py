@@ -1,110 +1,280 @@
-import requests
-from flask import Flask, request, jsonify
-from telegram_bot import TelegramBot
-from google_sheets import GoogleSheetsService
-from data_processor import DataProcessor
-from main import DegustationAnalyzer
+import asyncio
+import hmac
 import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
-app = Flask(__name__)
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from logging_setup import setup_logging
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Инициализация сервисов
-telegram_bot = TelegramBot()
-google_sheets_service = GoogleSheetsService()
-data_processor = DataProcessor()
+# Сервисы создаются при первом запросе, которому они нужны: импорт pandas/scipy/gspread
+# и авторизация в Google не задерживают старт, /health отвечает сразу после запуска.
+_services = {}
+_application = None
+_application_lock = asyncio.Lock()
+
+
+def get_service(name):
+    """Возвращает сервис по имени, создавая его при первом обращении."""
+    if name not in _services:
+        if name == 'projects':
+            # Анализаторы всех проектов реестра (PROJECTS_FILE) с общими Sheets и Telegram;
+            # без реестра — один проект из Config
+            from projects import ProjectRunner, load_projects
+            _services[name] = ProjectRunner(load_projects())
+        logger.info(f"Сервис '{name}' инициализирован")
+    return _services[name]
+
+
+async def get_application():
+    """
+    PTB Application из telegram_ptb_bot.create_application(), запущенный без Updater:
+    обновления кладём в его update_queue сами, обработчики выполняются параллельно
+    и ходят в Bot API через общий пул HTTP-соединений.
+    """
+    global _application
+    if _application is None:
+        async with _application_lock:
+            if _application is None:
+                from telegram_ptb_bot import create_application
+                application = create_application(webhook=True)
+                await application.initialize()
+                await application.start()
+                _application = application
+                logger.info("PTB Application запущен в webhook-режиме")
+    return _application
+
+
+class UpdateDeduplicator:
+    """
+    Помнит последние update_id: Telegram повторяет доставку, если не дождался ответа 200,
+    и одно нажатие не должно обрабатываться дважды. С общим хранилищем (shared_state.py,
+    SQLite или Redis) id общие для воркеров — повтор, попавший на другой воркер, тоже
+    отсеивается; при SHARED_STATE=memory — последние maxlen id в памяти процесса.
+    """
+
+    def __init__(self, maxlen: int = 10000, ttl: float = 86400.0):
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()  # seen/forget вызываются из рабочих потоков (asyncio.to_thread)
+
+    @staticmethod
+    def _shared():
+        from shared_state import get_shared_state
+
+        state = get_shared_state()
+        return None if state.name == "memory" else state
 
-@app.route('/', methods=['GET'])
-def root():
+    def seen(self, update_id: int) -> bool:
+        """True, если update_id уже встречался; иначе запоминает его."""
+        state = self._shared()
+        if state is not None:
+            return not state.add(f"update:{update_id}", ttl=self.ttl)
+        with self._lock:
+            if update_id in self._seen:
+                self._seen.move_to_end(update_id)
+                return True
+            self._seen[update_id] = None
+            if len(self._seen) > self.maxlen:
+                self._seen.popitem(last=False)
+            return False
+
+    def forget(self, update_id: int) -> None:
+        """Забывает update_id, который не удалось поставить в очередь: повтор от Telegram будет обработан."""
+        state = self._shared()
+        if state is not None:
+            state.delete(f"update:{update_id}")
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+
+_deduplicator = UpdateDeduplicator()
+
+
+async def root(request: Request):
     """Корневой маршрут для избежания 404"""
-    return jsonify({'status': 'ok', 'service': 'MD-BOT'})
+    return JSONResponse({'status': 'ok', 'service': 'MD-BOT'})
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Обрабатывает входящие обновления от Telegram"""
+
+async def webhook(request: Request):
+    """Принимает обновление от Telegram, ставит его в очередь Application и сразу отвечает 200."""
     try:
-        update = request.get_json()
+        update_data = await request.json()
+    except ValueError:
+        update_data = None
 
-        if not update:
-            return jsonify({'status': 'error', 'message': 'No update data'}), 400
+    if not update_data or not isinstance(update_data, dict):
+        return JSONResponse({'status': 'error', 'message': 'No update data'}, status_code=400)
 
-        logger.info(f"Received update: {update}")
+    update_id = update_data.get('update_id')
+    # Общее хранилище — SQLite или Redis: запись уходит в рабочий поток, не блокируя event loop
+    if update_id is not None and await asyncio.to_thread(_deduplicator.seen, update_id):
+        logger.info(f"Повторная доставка update_id={update_id} — пропускаем")
+        return JSONResponse({'status': 'duplicate'})
 
-        # Обрабатываем callback query (нажатия инлайн кнопок)
-        if 'callback_query' in update:
-            callback_query = update['callback_query']
-            user_id = callback_query['from']['id']
-            callback_data = callback_query['data']
-            # --- НОВОЕ: получаем message_id и chat_id ---
-            message_id = callback_query['message']['message_id']
-            chat_id = callback_query['message']['chat']['id']
+    try:
+        from telegram import Update
 
-            logger.info(f"Callback from user {user_id} in chat {chat_id}, message {message_id}: {callback_data}")
+        application = await get_application()
+        update = Update.de_json(update_data, application.bot)
+        await application.update_queue.put(update)
+        logger.info(f"Update {update_id} поставлен в очередь")
+        return JSONResponse({'status': 'ok'})
 
-            # Отвечаем на callback query
-            requests.post(
-                f"https://api.telegram.org/bot{telegram_bot.bot_token}/answerCallbackQuery",
-                json={'callback_query_id': callback_query['id']}
-            )
+    except Exception as e:
+        if update_id is not None:
+            await asyncio.to_thread(_deduplicator.forget, update_id)
+        logger.error(f"Error processing webhook: {e}", exc_info=True)
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=500)
 
-            # --- ИЗМЕНЕНО: передаём message_id и chat_id ---
-            telegram_bot.handle_callback(callback_data, user_id, google_sheets_service, data_processor, message_id, chat_id)
 
-        # Обрабатываем текстовые сообщения
-        elif 'message' in update:
-            message = update['message']
-            user_id = message['from']['id']
-            text = message.get('text', '')
-            # --- НОВОЕ: получаем chat_id ---
-            chat_id = message['chat']['id']
+async def health_check(request: Request):
+    """Проверка здоровья сервиса"""
+    services = {
+        name: ('initialized' if name in _services else 'lazy')
+        for name in ('projects',)
+    }
+    services['telegram_application'] = 'running' if _application is not None else 'lazy'
+    return JSONResponse({'status': 'healthy', 'services': services})
+
 
-            logger.info(f"Message from user {user_id} in chat {chat_id}: {text}")
+def _ingest_authorized(request: Request, token: str) -> bool:
+    """Токен из заголовка X-Ingest-Token или Authorization: Bearer; сравнение за постоянное время."""
+    supplied = request.headers.get('x-ingest-token', '')
+    auth = request.headers.get('authorization', '')
+    if not supplied and auth.lower().startswith('bearer '):
+        supplied = auth[7:].strip()
+    return hmac.compare_digest(supplied.encode(), token.encode())
 
-            # Обрабатываем команду /start
-            if text == '/start':
-                # --- ИЗМЕНЕНО: передаём chat_id ---
-                telegram_bot.send_start_menu(chat_id=chat_id)
 
-        return jsonify({'status': 'ok'}), 200
+async def ingest(request: Request):
+    """
+    Принимает одну строку анкеты от onFormSubmit: {"form": "morning"|"evening", "values": {колонка: значение}}.
+    Вечерняя анкета сопоставляется и отправляется сразу, без чтения листов. При нескольких
+    проектах строку относит к проекту поле "project" (имя из PROJECTS_FILE) или "sheet_id" таблицы формы.
+    """
+    from config import Config
 
+    if not Config.INGEST_TOKEN:
+        return JSONResponse({'status': 'error', 'message': 'ingest disabled'}, status_code=404)
+    if not _ingest_authorized(request, Config.INGEST_TOKEN):
+        logger.warning("Запрос /ingest с неверным токеном")
+        return JSONResponse({'status': 'error', 'message': 'unauthorized'}, status_code=401)
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict) or not isinstance(payload.get('values'), dict):
+        return JSONResponse({'status': 'error', 'message': 'expected {"form", "values"}'}, status_code=400)
+
+    try:
+        analyzer = get_service('projects').analyzer_for(payload.get('project'), payload.get('sheet_id'))
+        result = await asyncio.to_thread(analyzer.ingest_row, payload.get('form'), payload['values'])
+    except ValueError as e:
+        logger.warning(f"Строка /ingest отклонена: {e}")
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=422)
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
-        logger.error(traceback.format_exc())  # <-- Добавим трейсбек, если Render не показывает
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        logger.error(f"Error in ingest: {e}", exc_info=True)
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=500)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Проверка здоровья сервиса"""
-    return jsonify({
-        'status': 'healthy',
-        'services': {
-            'telegram_bot': 'initialized',
-            'google_sheets': 'initialized',
-            'data_processor': 'initialized'
-        }
+    logger.info(
+        f"/ingest: проект {analyzer.config.PROJECT_NAME}, форма {result['form']}, "
+        f"новая строка: {result['added']}, отчётов: {result['reports']}"
+    )
+    return JSONResponse({'status': 'ok', 'project': analyzer.config.PROJECT_NAME, **result})
+
+
+async def metrics(request: Request):
+    """Перцентили задержки отчётов за скользящее окно и память процесса (текущий и пиковый RSS)"""
+    from aggregates import MemoryGuard
+    from config import Config
+    from latency import latency_tracker
+
+    return JSONResponse({
+        'latency': latency_tracker.snapshot(),
+        'memory': MemoryGuard(Config.MEMORY_LIMIT_MB).snapshot(),
     })
 
-@app.route('/trigger-check', methods=['POST'])
-def trigger_check():
-    """Ручной запуск проверки отчетов"""
+
+def _check_response(result: dict | None) -> dict:
+    """Ответ /trigger-check по итогу DegustationAnalyzer.check_for_new_reports одного проекта."""
+    if result is None:
+        return {'triggered': False, 'status': 'error'}
+    if result['status'] == 'already_running':
+        # Опрос уже идёт (планировщик или прошлый вызов) — не ждём его и не дублируем
+        running, last = result['running'], result['last']
+        return {
+            'triggered': False,
+            'status': 'already_running',
+            'running_since': running['started_at'] if running else None,
+            'last_finished_at': last['finished_at'] if last else None,
+            'last_reports': last['result'] if last else None,
+        }
+    return {'triggered': True, 'reports': result['result'], 'elapsed': result['elapsed']}
+
+
+async def trigger_check(request: Request):
+    """Ручной запуск проверки отчетов: ?project=<имя> — одного проекта, без него — всех проектов реестра"""
     try:
         logger.info("Manual trigger check initiated")
 
-        # Создаем экземпляр анализатора
-        analyzer = DegustationAnalyzer()
-
-        # Запускаем проверку
-        analyzer.check_for_new_reports()
+        # Анализаторы создаются один раз и переиспользуются между вызовами;
+        # проверка синхронная, поэтому выполняется в отдельном потоке
+        runner = get_service('projects')
+        project = request.query_params.get('project')
+        if project or len(runner.analyzers) == 1:
+            try:
+                analyzer = runner.analyzer_for(project)
+            except ValueError as e:
+                return JSONResponse({'status': 'error', 'message': str(e)}, status_code=404)
+            response = _check_response(await asyncio.to_thread(analyzer.check_for_new_reports))
+        else:
+            results = await asyncio.to_thread(runner.check_all)
+            projects = {name: _check_response(result) for name, result in results.items()}
+            response = {'triggered': any(p['triggered'] for p in projects.values()), 'projects': projects}
 
         logger.info("Manual trigger check completed successfully")
-        return jsonify({'triggered': True}), 200
+        return JSONResponse(response)
 
     except Exception as e:
-        logger.error(f"Error in manual trigger check: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        logger.error(f"Error in manual trigger check: {e}", exc_info=True)
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    yield
+    if _application is not None:
+        await _application.stop()
+        await _application.shutdown()
+        logger.info("PTB Application остановлен")
+
+
+app = Starlette(
+    routes=[
+        Route('/', root, methods=['GET']),
+        Route('/webhook', webhook, methods=['POST']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/trigger-check', trigger_check, methods=['POST']),
+        Route('/ingest', ingest, methods=['POST']),
+    ],
+    lifespan=lifespan,
+)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
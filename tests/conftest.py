@@ -0,0 +1,77 @@
+# conftest.py — общие заготовки тестов: строки анкет в формате Google Forms и отчёты
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SHEETS_BACKEND", "fake")
+os.environ.setdefault("LOG_FILE", "")
+
+from config import Config  # noqa: E402
+from report_record import DetailedReport  # noqa: E402
+from sheet_snapshot import FORM_DATE_FORMAT, FORM_TIMESTAMP_FORMAT, SheetSnapshot  # noqa: E402
+
+
+def morning_row(employee: str, address: str, at: datetime, stock: int = 30,
+                city: str = "Москва", network: str = "Магнит") -> dict:
+    """Утренняя анкета, как её отдаёт лист: Timestamp и дата строками, остатки числами."""
+    columns = Config.MORNING_COLUMNS
+    row = {
+        columns["timestamp"]: at.strftime(FORM_TIMESTAMP_FORMAT),
+        columns["employee_name"]: employee,
+        columns["city"]: city,
+        columns["network_name"]: network,
+        columns["date"]: at.strftime(FORM_DATE_FORMAT),
+        columns["address"]: address,
+    }
+    for column in columns["cheese_start"].values():
+        row[column] = stock
+    return row
+
+
+def evening_row(employee: str, address: str, at: datetime, stock: int = 20, visitors: int = 50,
+                city: str = "Москва", network: str = "Магнит") -> dict:
+    """Вечерняя анкета той же дегустации."""
+    columns = Config.EVENING_COLUMNS
+    row = {
+        columns["timestamp"]: at.strftime(FORM_TIMESTAMP_FORMAT),
+        columns["employee_name"]: employee,
+        columns["date"]: at.strftime(FORM_DATE_FORMAT),
+        columns["city"]: city,
+        columns["network_name"]: network,
+        columns["address"]: address,
+        columns["visitors"]: visitors,
+    }
+    for column in columns["cheese_end"].values():
+        row[column] = stock
+    return row
+
+
+def snapshot(rows: list[dict], columns: dict) -> SheetSnapshot:
+    import pandas as pd
+
+    return SheetSnapshot.from_frame(pd.DataFrame(rows), columns)
+
+
+def report(employee: str = "Иванова Анна", store: str = "ленина 12", day: str = "01.09.2026",
+           visitors: int = 50, start: int = 30, end: int = 20, efficiency: float = 50.0,
+           flags: tuple = ()) -> DetailedReport:
+    """Отчёт с одинаковыми остатками по всем сырам."""
+    cheese_types = tuple(Config.CHEESE_TYPES)
+    n = len(cheese_types)
+    return DetailedReport(
+        date=day, city="Москва", network="Магнит", employee=employee, visitors=visitors,
+        total_sales=max(0, start - end) * n, efficiency=efficiency, normalized_address=store,
+        cheese_types=cheese_types, start=[start] * n, end=[end] * n, sold=[max(0, start - end)] * n,
+        flags=flags,
+    )
+
+
+@pytest.fixture
+def processor():
+    from data_processor import DataProcessor
+
+    return DataProcessor(Config())
@@ -0,0 +1,46 @@
+from keyboards import CallbackIndex
+
+
+def test_same_value_keeps_its_id():
+    index = CallbackIndex(maxsize=10)
+    short_id = index.id_for("Москва")
+    assert index.id_for("Москва") == short_id
+    assert index.resolve(short_id) == "Москва"
+    assert len(index) == 1
+
+
+def test_least_recently_used_value_is_evicted():
+    index = CallbackIndex(maxsize=2)
+    moscow = index.id_for("Москва")
+    kazan = index.id_for("Казань")
+    index.id_for("Омск")
+
+    assert index.resolve(moscow) is None
+    assert index.resolve(kazan) == "Казань"
+    assert len(index) == 2
+
+
+def test_resolve_and_repeat_show_refresh_the_entry():
+    index = CallbackIndex(maxsize=2)
+    moscow = index.id_for("Москва")
+    kazan = index.id_for("Казань")
+    assert index.resolve(moscow) == "Москва"  # нажатие — Москва снова свежая
+    index.id_for("Омск")
+
+    assert index.resolve(kazan) is None
+    assert index.resolve(moscow) == "Москва"
+
+    index.id_for("Москва")  # повторный показ тоже освежает
+    index.id_for("Тверь")
+    assert index.resolve(moscow) == "Москва"
+
+
+def test_evicted_value_gets_a_new_id():
+    index = CallbackIndex(maxsize=1)
+    old = index.id_for("Москва")
+    index.id_for("Казань")
+    new = index.id_for("Москва")
+
+    assert new != old
+    assert index.resolve(old) is None
+    assert index.resolve(new) == "Москва"
@@ -0,0 +1,117 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from config import Config
+from conftest import evening_row, morning_row, snapshot
+from online_matcher import OnlineMatcher
+
+DAY = datetime(2026, 9, 1)
+IVANOVA_12 = ("Иванова Анна", "г. Москва, ул. Ленина, д. 12")
+IVANOVA_34 = ("Иванова Анна", "г. Москва, ул. Ленина, д. 34")
+PETROVA = ("Петрова Мария", "г. Москва, ул. Мира, д. 56")
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return DAY.replace(hour=hour, minute=minute)
+
+
+def morning_snapshot(rows):
+    return snapshot(rows, Config.MORNING_COLUMNS)
+
+
+def evening_snapshot(rows):
+    return snapshot(rows, Config.EVENING_COLUMNS)
+
+
+def no_rows(snap):
+    return snap.frame.iloc[0:0]
+
+
+@pytest.fixture
+def matcher(processor):
+    return OnlineMatcher(processor)
+
+
+def test_evening_pairs_with_open_morning_once(matcher):
+    morning = morning_snapshot([morning_row(*IVANOVA_12, at(9)), morning_row(*PETROVA, at(9, 5))])
+    evening = evening_snapshot([evening_row(*PETROVA, at(18))])
+
+    reports = matcher.match(no_rows(morning), evening.frame, morning, evening)
+    assert [r.employee for r in reports] == ["Петрова Мария"]
+
+    # Та же анкета ещё раз (повтор /ingest или опроса) отчёта не даёт
+    assert matcher.match(no_rows(morning), evening.frame, morning, evening) == []
+    assert matcher.reoptimize() == []
+
+
+def test_evening_before_morning_is_paired_by_reoptimize(matcher):
+    morning = morning_snapshot([morning_row(*IVANOVA_12, at(9))])
+    evening = evening_snapshot([evening_row(*IVANOVA_12, at(18)), evening_row(*PETROVA, at(18, 5))])
+
+    reports = matcher.match(no_rows(morning), evening.frame, morning, evening)
+    assert [r.employee for r in reports] == ["Иванова Анна"]
+
+    late = pd.DataFrame([morning_row(*PETROVA, at(19))])
+    morning, added = morning.append(late)
+    assert matcher.match(added, no_rows(evening), morning, evening) == []
+
+    reports = matcher.reoptimize()
+    assert [r.employee for r in reports] == ["Петрова Мария"]
+    assert matcher.reoptimize() == []
+
+
+def test_reported_pair_stays_pinned(matcher):
+    # Утренняя анкета Ленина, 34 пока одна — вечерняя Ленина, 12 жадно получает её и отчёт
+    morning = morning_snapshot([morning_row(*IVANOVA_34, at(9))])
+    evening = evening_snapshot([evening_row(*IVANOVA_12, at(18))])
+    first = matcher.match(no_rows(morning), evening.frame, morning, evening)
+    assert len(first) == 1
+    state = matcher.days[DAY.date()]
+    pinned = dict(state.pairs)
+
+    # Вечерняя Ленина, 34 — её лучшая пара уже закреплена, ждёт
+    evening, added = evening.append(pd.DataFrame([evening_row(*IVANOVA_34, at(18, 30))]))
+    assert matcher.match(no_rows(morning), added, morning, evening) == []
+    assert matcher.reoptimize() == []
+    assert state.pairs == pinned
+
+    # Пришла утренняя Ленина, 12: венгерский пересчёт не трогает выданную пару
+    morning, added = morning.append(pd.DataFrame([morning_row(*IVANOVA_12, at(9, 30))]))
+    matcher.match(added, no_rows(evening), morning, evening)
+    reports = matcher.reoptimize()
+    assert [r.normalized_address for r in reports] == [IVANOVA_34[1]]
+    assert all(state.pairs[e] == m for e, m in pinned.items())
+    assert len(state.pairs) == 2
+
+
+def test_reopened_day_does_not_repeat_old_reports(matcher):
+    morning = morning_snapshot([morning_row(*IVANOVA_12, at(9)), morning_row(*PETROVA, at(9, 5))])
+    evening = evening_snapshot([evening_row(*IVANOVA_12, at(18))])
+    assert len(matcher.match(no_rows(morning), evening.frame, morning, evening)) == 1
+
+    matcher.prune(keep_from=date(2026, 9, 2))
+    assert len(matcher) == 0
+
+    # Поздняя вечерняя анкета заново загружает дату из снимков: прежние вечерние уже обработаны
+    evening, added = evening.append(pd.DataFrame([evening_row(*PETROVA, at(20))]))
+    reports = matcher.match(no_rows(morning), added, morning, evening)
+    assert [r.employee for r in reports] == ["Петрова Мария"]
+    assert matcher.reoptimize() == []
+
+
+def test_inclusive_watermark_does_not_duplicate_reports(matcher):
+    morning = morning_snapshot([morning_row(*IVANOVA_12, at(9))])
+    evening = evening_snapshot([evening_row(*IVANOVA_12, at(18))])
+    watermark = at(18)
+
+    # Строка той же секунды, что и водяной знак, попадает в оба опроса
+    first_poll = evening.since(watermark)
+    assert len(first_poll) == 1
+    assert len(matcher.match(no_rows(morning), first_poll, morning, evening)) == 1
+
+    second_poll = evening.since(watermark)
+    assert len(second_poll) == 1
+    assert matcher.match(no_rows(morning), second_poll, morning, evening) == []
+    assert matcher.reoptimize() == []
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pandas as pd
+
+from config import Config
+from conftest import evening_row, snapshot
+
+COLUMNS = Config.EVENING_COLUMNS
+AT = datetime(2026, 9, 1, 18, 0, 0)
+
+
+def test_append_adds_only_new_rows():
+    first = evening_row("Иванова Анна", "г. Москва, ул. Ленина, д. 12", AT)
+    second = evening_row("Петрова Мария", "г. Москва, ул. Мира, д. 34", AT)
+    snap = snapshot([first], COLUMNS)
+
+    updated, added = snap.append(pd.DataFrame([first, second]))
+
+    assert len(added) == 1
+    assert added.iloc[0][COLUMNS["employee_name"]] == "Петрова Мария"
+    assert len(updated) == 2
+    assert len(snap) == 1  # исходный снимок не меняется
+
+
+def test_append_of_known_rows_returns_same_snapshot():
+    row = evening_row("Иванова Анна", "г. Москва, ул. Ленина, д. 12", AT)
+    snap = snapshot([row], COLUMNS)
+
+    updated, added = snap.append(pd.DataFrame([row]))
+
+    assert updated is snap
+    assert added.empty
+
+
+def test_append_dedup_uses_normalized_name_and_address():
+    row = evening_row("Иванова Анна", "г. Москва, ул. Ленина, д. 12", AT)
+    snap = snapshot([row], COLUMNS)
+    same = dict(row)
+    same[COLUMNS["employee_name"]] = "  анна иванова "
+    same[COLUMNS["address"]] = "Москва, улица Ленина, дом 12"
+
+    _, added = snap.append(pd.DataFrame([same]))
+
+    assert added.empty
+
+
+def test_append_keeps_rows_of_another_second():
+    row = evening_row("Иванова Анна", "г. Москва, ул. Ленина, д. 12", AT)
+    later = evening_row("Иванова Анна", "г. Москва, ул. Ленина, д. 12", AT.replace(second=1))
+    snap = snapshot([row], COLUMNS)
+
+    updated, added = snap.append(pd.DataFrame([later]))
+
+    assert len(added) == 1
+    assert len(updated) == 2
+
+
+def test_append_extends_categories():
+    snap = snapshot([evening_row("Иванова Анна", "г. Москва, ул. Ленина, д. 12", AT)], COLUMNS)
+    kazan = evening_row("Петрова Мария", "г. Казань, ул. Мира, д. 34", AT, city="Казань")
+
+    updated, _ = snap.append(pd.DataFrame([kazan]))
+
+    city = updated.frame[COLUMNS["city"]]
+    assert isinstance(city.dtype, pd.CategoricalDtype)
+    assert set(city) == {"Москва", "Казань"}
+    assert updated.dates() == [AT.date()]
@@ -0,0 +1,103 @@
+import pytest
+
+from conftest import report
+from validation import ReportValidator, StoreHistory, flag_labels, summary_message
+
+
+@pytest.fixture
+def validator():
+    return ReportValidator(max_visitors=500, outlier_z=3.0, min_history=5)
+
+
+def flags(r) -> set:
+    return set(r.flags)
+
+
+def test_clean_report_is_not_flagged(validator):
+    clean = report()
+    assert validator.validate([clean]) == []
+    assert clean.flags == ()
+
+
+def test_stock_and_visitor_checks(validator):
+    grew = report(employee="Петрова Мария", start=10, end=15)
+    empty = report(employee="Смирнова Елена", visitors=0)
+    crowd = report(employee="Попова Ольга", visitors=501)
+
+    flagged = validator.validate([grew, empty, crowd])
+
+    assert flagged == [grew, empty, crowd]
+    assert flags(grew) == {"end_gt_start"}
+    assert flags(empty) == {"no_visitors"}
+    assert flags(crowd) == {"too_many_visitors"}
+    assert flag_labels(empty) == ["0 посетителей"]
+
+
+def test_duplicate_in_batch_and_across_batches(validator):
+    first, again = report(), report()
+    assert validator.validate([first, again]) == [again]
+    assert flags(again) == {"duplicate"}
+    assert first.flags == ()
+
+    later = report()
+    assert validator.validate([later]) == [later]
+    assert flags(later) == {"duplicate"}
+
+
+def test_same_promoter_in_two_stores_is_not_duplicate(validator):
+    morning_store = report(store="ленина 12")
+    evening_store = report(store="мира 34")
+    assert validator.validate([morning_store, evening_store]) == []
+    assert validator.validate([report(store="садовая 56")]) == []
+
+
+def test_efficiency_outlier_needs_history(validator):
+    history = [report(day=f"0{d}.09.2026", efficiency=50.0 + d) for d in range(1, 5)]
+    assert validator.validate(history) == []
+    # Четыре прошлых отчёта — меньше min_history, выброс ещё не считается
+    assert validator.validate([report(day="05.09.2026", efficiency=51.0)]) == []
+
+    outlier = report(day="06.09.2026", efficiency=200.0)
+    assert validator.validate([outlier]) == [outlier]
+    assert flags(outlier) == {"efficiency_outlier"}
+
+    # Выброс не сдвигает норму магазина
+    assert validator.validate([report(day="07.09.2026", efficiency=53.0)]) == []
+
+
+def test_parse_flag_is_kept_and_reported(validator):
+    text = report(flags=("stock_text",))
+    assert validator.validate([text]) == [text]
+    assert flags(text) == {"stock_text"}
+    message = summary_message([text], 1)
+    assert "остатки текстом" in message
+
+
+def test_history_seeds_store_norms(validator):
+    seeded = [report(day=f"{d:02d}.08.2026", efficiency=50.0 + d % 3) for d in range(1, 11)]
+    validator.history.add_reports(seeded)
+
+    outlier = report(day="01.09.2026", efficiency=150.0)
+    assert validator.validate([outlier]) == [outlier]
+    assert flags(outlier) == {"efficiency_outlier"}
+
+
+def test_history_skips_reports_already_counted():
+    history = StoreHistory()
+    live = report(efficiency=50.0)
+    assert history.add_reports([live]) == 1
+    # Тот же отчёт из свёртки истории второй раз в норму не идёт
+    assert history.add_reports([report(efficiency=50.0)]) == 0
+    # Отчёты с пометками разбора и без посетителей норму не сдвигают
+    history.add_reports([
+        report(day="02.09.2026", flags=("stock_text",), efficiency=500.0),
+        report(day="03.09.2026", visitors=0, efficiency=0.0),
+    ])
+    assert history.stats(["ленина 12", "мира 34"]) == [(1, 50.0, 0.0), (0, 0.0, 0.0)]
+
+
+def test_validators_do_not_share_state():
+    first, second = ReportValidator(), ReportValidator()
+    first.validate([report()])
+    assert second.validate([report()]) == []
+    assert second.history.stats(["ленина 12"]) == [(1, 50.0, 0.0)]
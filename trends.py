@@ -0,0 +1,177 @@
+# trends.py — скользящие показатели магазинов и промоутеров за 7/30 дней без повторного сопоставления
+
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import report_events
+from aggregates import history_feed
+
+logger = logging.getLogger(__name__)
+
+# Метрики в порядке первой оси массивов
+METRICS = ("sales", "visitors", "efficiency_sum", "tastings")
+SALES, VISITORS, EFFICIENCY_SUM, TASTINGS = range(len(METRICS))
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+class TrendSeries:
+    """
+    Дневные ряды по одному измерению (магазины или промоутеры): массив
+    [метрика, сущность, день] с днями от origin. Ёмкость растёт удвоением,
+    поэтому добавление отчёта — запись в одну ячейку, а окна — срезы и cumsum.
+    """
+
+    def __init__(self, origin: date, days: int = 64, rows: int = 16):
+        self.origin = origin
+        self.index = {}  # имя -> строка
+        self.names = []
+        self.days = 0  # число использованных дней от origin
+        self.data = np.zeros((len(METRICS), rows, days), dtype=np.float64)
+
+    def _row(self, name: str) -> int:
+        row = self.index.get(name)
+        if row is None:
+            row = self.index[name] = len(self.names)
+            self.names.append(name)
+            if row >= self.data.shape[1]:
+                self._grow(rows=self.data.shape[1] * 2)
+        return row
+
+    def _grow(self, rows: int | None = None, days: int | None = None, shift: int = 0):
+        _, old_rows, old_days = self.data.shape
+        data = np.zeros((len(METRICS), rows or old_rows, days or old_days), dtype=np.float64)
+        data[:, :old_rows, shift:shift + old_days] = self.data
+        self.data = data
+
+    def _column(self, day: date) -> int:
+        col = (day - self.origin).days
+        if col < 0:
+            # Отчёт раньше начала ряда — сдвигаем всё вправо
+            shift = -col
+            self._grow(days=(self.data.shape[2] + shift) * 2, shift=shift)
+            self.origin = day
+            self.days += shift
+            col = 0
+        if col >= self.data.shape[2]:
+            self._grow(days=max(col + 1, self.data.shape[2] * 2))
+        self.days = max(self.days, col + 1)
+        return col
+
+    def add(self, name: str, day: date, sales: int, visitors: int, efficiency: float) -> None:
+        row = self._row(name)
+        col = self._column(day)
+        self.data[:, row, col] += (sales, visitors, efficiency, 1)
+
+    def window(self, name: str, days: int, end: date) -> np.ndarray | None:
+        """Суммы метрик за days дней, заканчивая end включительно (вектор по METRICS)."""
+        row = self.index.get(name)
+        if row is None:
+            return None
+        stop = (end - self.origin).days + 1
+        start = max(0, stop - days)
+        stop = max(0, min(stop, self.data.shape[2]))
+        return self.data[:, row, start:stop].sum(axis=1)
+
+    def rolling(self, name: str, days: int, span: int, end: date) -> np.ndarray:
+        """Скользящая сумма продаж за days дней для каждого из последних span дней до end."""
+        row = self.index[name]
+        stop = (end - self.origin).days + 1
+        start = stop - span - days + 1
+        # Дни вне ряда считаем нулевыми
+        series = np.zeros(span + days - 1)
+        lo, hi = max(start, 0), max(0, min(stop, self.data.shape[2]))
+        if hi > lo:
+            series[lo - start:hi - start] = self.data[SALES, row, lo:hi]
+        cumsum = np.concatenate(([0.0], np.cumsum(series)))
+        return cumsum[days:] - cumsum[:-days]
+
+    def ranking(self, days: int, end: date) -> list[str]:
+        """Имена по убыванию продаж за последние days дней (для меню выбора)."""
+        if not self.names:
+            return []
+        stop = max(0, min((end - self.origin).days + 1, self.data.shape[2]))
+        start = max(0, stop - days)
+        sales = self.data[SALES, :len(self.names), start:stop].sum(axis=1)
+        order = np.lexsort((np.array(self.names), -sales))
+        return [self.names[i] for i in order]
+
+
+class TrendEngine(report_events.ReportAggregate):
+    """
+    Тренды по магазинам (адрес) и промоутерам. Пополняется новыми отчётами через
+    report_events; историю получает из общего прохода aggregates.history_feed.
+    """
+
+    KINDS = {
+        "store": "normalized_address",
+        "employee": "employee",
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.series = {}
+
+    def _add(self, report) -> None:
+        day = datetime.strptime(report.date, '%d.%m.%Y').date()
+        for kind, field in self.KINDS.items():
+            series = self.series.get(kind)
+            if series is None:
+                series = self.series[kind] = TrendSeries(origin=day)
+            series.add(str(getattr(report, field)), day, report.total_sales, report.visitors, report.efficiency)
+
+    def names(self, kind: str, days: int = 30, end: date | None = None) -> list[str]:
+        series = self.series.get(kind)
+        if series is None:
+            return []
+        with self._lock:
+            return series.ranking(days, end or date.today())
+
+    def summary(self, kind: str, name: str, days: int, end: date | None = None) -> dict | None:
+        """
+        Показатели за последние days дней и изменение к предыдущим days дням:
+        продажи, посетители, дегустации, средняя эффективность.
+        """
+        series = self.series.get(kind)
+        if series is None:
+            return None
+        end = end or date.today()
+        with self._lock:
+            current = series.window(name, days, end)
+            if current is None:
+                return None
+            previous = series.window(name, days, end - timedelta(days=days))
+
+        def pack(sums):
+            tastings = int(sums[TASTINGS])
+            return {
+                'sales': int(sums[SALES]),
+                'visitors': int(sums[VISITORS]),
+                'tastings': tastings,
+                'efficiency': round(float(sums[EFFICIENCY_SUM]) / tastings, 1) if tastings else 0.0,
+            }
+
+        result = pack(current)
+        prev = pack(previous)
+        result['prev_sales'] = prev['sales']
+        result['sales_change'] = (
+            round((result['sales'] - prev['sales']) / prev['sales'] * 100, 1) if prev['sales'] else None
+        )
+        return result
+
+    def sparkline(self, kind: str, name: str, days: int = 7, span: int = 30, end: date | None = None) -> str:
+        """Строка из блоков: скользящая сумма продаж за days дней на каждом из последних span дней."""
+        with self._lock:
+            values = self.series[kind].rolling(name, days, span, end or date.today())
+        top = values.max()
+        if top <= 0:
+            return SPARK_CHARS[0] * len(values)
+        levels = np.minimum((values / top * (len(SPARK_CHARS) - 1)).round().astype(int), len(SPARK_CHARS) - 1)
+        return "".join(SPARK_CHARS[i] for i in levels)
+
+
+trend_engine = TrendEngine()
+history_feed.register(trend_engine)
+report_events.subscribe(trend_engine.add_reports)
@@ -0,0 +1,181 @@
+# validation.py — проверка пачки новых отчётов массивами numpy/pandas и пометки аномалий
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+import report_events
+
+logger = logging.getLogger(__name__)
+
+# Код пометки -> как её показать в сообщении
+FLAGS = {
+    "end_gt_start": "остаток вечером больше утреннего",
+    "no_visitors": "0 посетителей",
+    "too_many_visitors": "неправдоподобно много посетителей",
+    "stock_text": "остатки текстом, не разобраны",
+    "duplicate": "повторная анкета промоутера за дату",
+    "efficiency_outlier": "эффективность выбивается из истории магазина",
+}
+
+# Нижняя граница разброса эффективности магазина (п.п.): у ровной истории любое отклонение — не выброс
+_MIN_STD = 5.0
+# Сколько примеров каждой пометки показывать в сводке
+_EXAMPLES = 3
+
+
+class ReportValidator:
+    """
+    Проверка новых отчётов пачкой: остатки, посетители, эффективность и ключи пачки
+    собираются в массивы, и все условия считаются векторно — на отчёт остаётся
+    только сборка массивов и запись кортежа пометок у помеченных.
+
+    История между пачками: промоутеры, уже приславшие анкету в магазин за дату (keep_days
+    последних дат), и среднее/разброс эффективности по магазину (StoreHistory).
+    Выбросом считается |z| > outlier_z при не менее min_history прошлых отчётах магазина.
+    Пометка stock_text ставится раньше, при разборе листа (DataProcessor.build_report).
+    Валидатор у каждого проекта свой (DegustationAnalyzer.validator): магазины и промоутеры
+    разных таблиц не смешиваются.
+    """
+
+    def __init__(self, max_visitors: int = 500, outlier_z: float = 3.0, min_history: int = 5, keep_days: int = 3):
+        self.max_visitors = max_visitors
+        self.outlier_z = outlier_z
+        self.min_history = min_history
+        self.keep_days = keep_days
+        self.history = StoreHistory()
+        self._seen = {}  # дата отчёта -> set((сотрудник, магазин))
+        self._lock = threading.Lock()
+
+    def validate(self, reports) -> list:
+        """Ставит report.flags у отчётов пачки и возвращает помеченные."""
+        if not reports:
+            return []
+        import numpy as np
+        import pandas as pd
+
+        started = time.perf_counter()
+        n = len(reports[0].cheese_types)
+        stock = np.frombuffer(b"".join(r.stock.tobytes() for r in reports), dtype=np.int32).reshape(len(reports), 3 * n)
+        visitors = np.fromiter((r.visitors for r in reports), dtype=np.int64, count=len(reports))
+        efficiency = np.fromiter((r.efficiency for r in reports), dtype=np.float64, count=len(reports))
+        keys = pd.DataFrame({
+            "date": [r.date for r in reports],
+            "employee": [r.employee for r in reports],
+            "store": [r.normalized_address for r in reports],
+        })
+
+        with self._lock:
+            checks = {
+                "end_gt_start": (stock[:, n:2 * n] > stock[:, :n]).any(axis=1),
+                "no_visitors": visitors <= 0,
+                "too_many_visitors": visitors > self.max_visitors,
+                "duplicate": self._duplicates(keys),
+                "efficiency_outlier": self._outliers(keys["store"], efficiency),
+            }
+            clean = ~np.logical_or.reduce(list(checks.values()))
+            self._remember(reports, keys, clean)
+
+        mask = np.column_stack(list(checks.values()))
+        names = list(checks)
+        flagged = []
+        for i in np.flatnonzero(mask.any(axis=1) | np.fromiter((bool(r.flags) for r in reports), bool, len(reports))):
+            report = reports[i]
+            report.flags = tuple(report.flags) + tuple(names[j] for j in np.flatnonzero(mask[i]))
+            flagged.append(report)
+
+        if flagged:
+            logger.info(
+                f"Проверка данных: {len(flagged)} из {len(reports)} отчётов с пометками "
+                f"за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+        return flagged
+
+    def _duplicates(self, keys):
+        """
+        Повтор (дата, сотрудник, магазин) внутри пачки или с прошлыми пачками; первая анкета
+        не помечается. Промоутер, работавший за день в двух магазинах, повтором не считается.
+        """
+        import numpy as np
+
+        seen = np.fromiter(
+            ((employee, store) in self._seen.get(day, ())
+             for day, employee, store in zip(keys["date"], keys["employee"], keys["store"])),
+            dtype=bool, count=len(keys),
+        )
+        return keys.duplicated(["date", "employee", "store"]).to_numpy() | seen
+
+    def _outliers(self, stores, efficiency):
+        import numpy as np
+
+        codes, uniques = stores.factorize()
+        history = np.array(self.history.stats(uniques), dtype=np.float64).reshape(-1, 3)
+        count, mean, m2 = history[codes].T
+        std = np.sqrt(np.divide(m2, count - 1, out=np.zeros_like(m2), where=count > 1))
+        z = np.abs(efficiency - mean) / np.maximum(std, _MIN_STD)
+        return (count >= self.min_history) & (z > self.outlier_z)
+
+    def _remember(self, reports, keys, clean) -> None:
+        import numpy as np
+
+        for day, employee, store in zip(keys["date"], keys["employee"], keys["store"]):
+            self._seen.setdefault(day, set()).add((employee, store))
+        if len(self._seen) > self.keep_days:
+            days = sorted(self._seen, key=lambda d: datetime.strptime(d, '%d.%m.%Y'))
+            for day in days[:-self.keep_days]:
+                del self._seen[day]
+
+        # В историю эффективности идут только отчёты без пометок — ошибки не сдвигают норму магазина
+        self.history.add_reports([reports[i] for i in np.flatnonzero(clean)])
+
+
+class StoreHistory(report_events.ReportAggregate):
+    """
+    Среднее и разброс эффективности по магазину (алгоритм Уэлфорда) для проверки выбросов.
+    Пополняется отчётами без пометок из ReportValidator и при первом опросе — свёрткой
+    истории проекта (StatsCache.feed), так что норма магазина есть сразу после запуска.
+    Отчёт, уже учтённый одним путём, другим не учитывается (report_key).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stores = {}  # адрес -> [n, среднее, сумма квадратов отклонений]
+
+    def _add(self, report) -> None:
+        # Из истории в норму не идут отчёты с пометками разбора и без посетителей
+        if report.flags or report.visitors <= 0:
+            return
+        stats = self.stores.setdefault(report.normalized_address, [0, 0.0, 0.0])
+        stats[0] += 1
+        delta = report.efficiency - stats[1]
+        stats[1] += delta / stats[0]
+        stats[2] += delta * (report.efficiency - stats[1])
+
+    def stats(self, stores) -> list:
+        """[n, среднее, сумма квадратов отклонений] для каждого адреса из stores."""
+        with self._lock:
+            return [tuple(self.stores.get(store, (0, 0.0, 0.0))) for store in stores]
+
+
+def flag_labels(report) -> list[str]:
+    return [FLAGS.get(flag, flag) for flag in getattr(report, "flags", ())]
+
+
+def summary_message(flagged, total: int) -> str | None:
+    """Одно сообщение на пачку: сколько отчётов с каждой пометкой и несколько примеров."""
+    if not flagged:
+        return None
+    by_flag = {}
+    for report in flagged:
+        for flag in report.flags:
+            by_flag.setdefault(flag, []).append(report)
+
+    lines = [f"ПРОВЕРКА ДАННЫХ: <b>{len(flagged)}</b> из {total} новых отчётов с пометками", ""]
+    for flag, reports in by_flag.items():
+        lines.append(f"<b>{FLAGS.get(flag, flag)}</b>: {len(reports)}")
+        for report in reports[:_EXAMPLES]:
+            lines.append(f"   • {report.employee} — {report.normalized_address} ({report.date})")
+        if len(reports) > _EXAMPLES:
+            lines.append(f"   • … и ещё {len(reports) - _EXAMPLES}")
+    return "\n".join(lines)